@@ -0,0 +1,18 @@
+import os
+import sys
+
+if __name__ == "__main__":
+    # Add the 'wanderlust_guide' directory to sys.path so that 'app' can be imported,
+    # as run_tests.py does
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    wanderlust_guide_path = os.path.join(current_dir, "wanderlust_guide")
+
+    if wanderlust_guide_path not in sys.path:
+        sys.path.insert(0, wanderlust_guide_path)
+
+    from app.benchmark import main
+
+    # Benchmarks the query functions on synthetic places and exits with status 1
+    # if any query type regressed against wanderlust_guide/benchmarks/baseline.json.
+    # Pass --help for the options, e.g. --scales 10k,1m or --update-baseline.
+    main(sys.argv[1:])
@@ -0,0 +1,158 @@
+import heapq
+from array import array
+from bisect import bisect_left
+
+from . import bitset
+from .place_store import PlaceStore, take
+
+def normalize_activity(activity: str) -> str:
+    """Returns the token an activity is indexed under (case-insensitive, as activity_search compares)."""
+    return activity.lower()
+
+class ActivityIndex:
+    """
+    Inverted index from normalized activity to the sorted rows offering it.
+
+    Each posting list is an array of ascending row ids with no duplicates, so
+    a single lookup is one dict access, and AND/OR queries and candidate
+    restriction cost in proportion to the postings and candidates involved
+    rather than to the number of places.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore, postings: dict[str, array]):
+        self.places = places
+        self.size = len(places)
+        self.postings = postings
+        self._bitmaps: dict[str, int] = {}
+
+    @classmethod
+    def from_places(cls, places: list[dict] | PlaceStore) -> "ActivityIndex":
+        """Builds the index over a list of place dictionaries or a PlaceStore."""
+        postings: dict[str, array] = {}
+        if isinstance(places, PlaceStore):
+            column = places.activities
+            # Normalize each interned term once, not once per occurrence.
+            tokens = [normalize_activity(term) for term in column.vocabulary]
+            values, offsets = column.values, column.offsets
+            for row in range(len(places)):
+                for i in range(offsets[row], offsets[row + 1]):
+                    _add_posting(postings, tokens[values[i]], row)
+        else:
+            for row, place in enumerate(places):
+                for activity in place.get("activities", []):
+                    _add_posting(postings, normalize_activity(activity), row)
+        return cls(places, postings)
+
+    def tokens(self) -> list[str]:
+        """Returns every indexed activity token."""
+        return list(self.postings)
+
+    def count(self, activity: str) -> int:
+        """Returns how many places offer activity."""
+        return len(self.postings.get(normalize_activity(activity), ()))
+
+    def bitmap(self, activity: str) -> int:
+        """Returns the bitset of rows offering activity, built from its posting list on first use."""
+        token = normalize_activity(activity)
+        bits = self._bitmaps.get(token)
+        if bits is None:
+            bits = self._bitmaps[token] = bitset.from_indices(self.postings.get(token, ()))
+        return bits
+
+    def lookup(self, activity: str, within=None) -> list[int]:
+        """
+        Returns the sorted rows offering activity.
+
+        Args:
+            activity: The activity to look up, in any letter case.
+            within: Optional candidate rows to intersect with, either a bitset
+                    (int) or an iterable of row ids.
+
+        Returns:
+            A sorted list of row ids.
+        """
+        rows = self.postings.get(normalize_activity(activity))
+        if not rows:
+            return []
+        if within is None:
+            return list(rows)
+        return _intersect(rows, _candidate_rows(within))
+
+    def lookup_all(self, activities, within=None) -> list[int]:
+        """Returns the sorted rows offering every one of activities (AND); no activities match every row."""
+        lists = [self.postings.get(normalize_activity(a), ()) for a in activities]
+        if within is not None:
+            lists.append(_candidate_rows(within))
+        if not lists:
+            return list(range(self.size))
+        # Start from the shortest list so every later step is as cheap as possible.
+        lists.sort(key=len)
+        result = list(lists[0])
+        for rows in lists[1:]:
+            if not result:
+                break
+            result = _intersect(result, rows)
+        return result
+
+    def lookup_any(self, activities, within=None) -> list[int]:
+        """Returns the sorted rows offering at least one of activities (OR)."""
+        lists = [self.postings.get(normalize_activity(a), ()) for a in activities]
+        result = []
+        last = -1
+        for row in heapq.merge(*lists):
+            if row != last:
+                result.append(row)
+                last = row
+        if within is not None:
+            result = _intersect(result, _candidate_rows(within))
+        return result
+
+    def entries(self, activities, within=None, match_all: bool = True) -> int:
+        """
+        Returns how many index entries a lookup of activities reads: their
+        posting lists plus the candidate rows in within (a bitset or a
+        collection of row ids). lookup_all of neither reads every row.
+        """
+        read = sum(len(self.postings.get(normalize_activity(a), ())) for a in activities)
+        if within is not None:
+            read += bitset.count(within) if isinstance(within, int) else len(within)
+        elif not activities and match_all:
+            read = self.size
+        return read
+
+    def rows(self, row_ids) -> list[dict]:
+        """Materializes row_ids as place dictionaries."""
+        return take(self.places, row_ids)
+
+def _add_posting(postings: dict[str, array], token: str, row: int) -> None:
+    rows = postings.get(token)
+    if rows is None:
+        postings[token] = array("I", [row])
+    elif rows[-1] != row: # Rows arrive in order, so this is the only duplicate case
+        rows.append(row)
+
+def _candidate_rows(within) -> list[int]:
+    """Normalizes a bitset or iterable of row ids to a sorted list."""
+    if isinstance(within, int):
+        return list(bitset.iter_indices(within))
+    return sorted(within)
+
+def _intersect(small, large) -> list[int]:
+    """
+    Intersects two sorted row lists.
+
+    Each element of the shorter list is found in the longer one by binary
+    search from the previous hit, so the cost is O(short * log(long)).
+    """
+    if len(small) > len(large):
+        small, large = large, small
+    result = []
+    lo = 0
+    n = len(large)
+    for row in small:
+        lo = bisect_left(large, row, lo)
+        if lo == n:
+            break
+        if large[lo] == row:
+            result.append(row)
+    return result
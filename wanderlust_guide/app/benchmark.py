@@ -0,0 +1,273 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+from .activity_index import ActivityIndex
+from .bitmap_index import BitmapIndex
+from .clustering import ClusterIndex
+from .filters import DETAILED_FILTERS, apply_filters
+from .instrumentation import percentile
+from .map_utils import find_places_in_map_area, get_map_clusters, nearest_places
+from .planner import query
+from .search import activity_search, text_search
+from .spatial_index import SpatialIndex
+from .synthetic import ACTIVITIES, ADJECTIVES, CATEGORIES, CITIES, generate_store, zipf_weights
+from .text_index import TextIndex
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+QUERIES = ("filters", "activity", "viewport", "clusters", "text", "nearest", "planner")
+INDEXES = (BitmapIndex, ActivityIndex, SpatialIndex, ClusterIndex, TextIndex)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "baseline.json")
+WORKLOAD_SIZE = 24 # Distinct queries per query type, cycled through while measuring
+DEFAULT_MIN_TIME = 1.0 # Seconds each query type is measured for
+ROUNDS = 5 # min_time is split into this many rounds and the fastest one is reported
+# Timings of the same code vary by a third or more between runs on a shared
+# machine, while peak memory is deterministic, so memory is held much tighter.
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_MEMORY_TOLERANCE = 0.1
+# Differences below these are noise however large they are relative to a tiny baseline.
+LATENCY_SLACK_MS = 0.05
+MEMORY_SLACK_KB = 16
+
+def parse_scale(scale: str) -> int:
+    """Returns the number of places for a scale label such as "10k" or "1m", or a plain number."""
+    label = scale.strip().lower()
+    if label in SCALES:
+        return SCALES[label]
+    if label[-1:] in ("k", "m") and label[:-1].isdigit():
+        return int(label[:-1]) * (1_000 if label[-1] == "k" else 1_000_000)
+    if label.isdigit():
+        return int(label)
+    raise ValueError(f"unknown scale {scale!r}")
+
+def _viewport(rng: random.Random, zoom: int) -> tuple[tuple[float, float], tuple[float, float]]:
+    """A map view at zoom, centred near a city picked by population, as (north_east, south_west)."""
+    _, lat, lon, spread = rng.choices(CITIES, cum_weights=zipf_weights(len(CITIES)))[0]
+    lat, lon = rng.gauss(lat, spread), rng.gauss(lon, spread)
+    half_width = 180.0 / 2 ** zoom
+    half_height = half_width / 2
+    return (lat + half_height, lon + half_width), (lat - half_height, lon - half_width)
+
+def build_workload(store, seed: int = 0, size: int = WORKLOAD_SIZE) -> dict[str, list]:
+    """
+    Returns size calls for each query type over store, as zero-argument functions.
+
+    The queries are drawn from the same distributions as the synthetic places:
+    popular activities and busy cities come up more often.
+    """
+    rng = random.Random(f"{seed}:workload")
+    filter_ids = sorted(DETAILED_FILTERS)
+    activity_weights = zipf_weights(len(ACTIVITIES))
+
+    def activity():
+        return rng.choices(ACTIVITIES, cum_weights=activity_weights)[0]
+
+    def filters():
+        return set(rng.sample(filter_ids, rng.randint(1, 3)))
+
+    def text():
+        category, (_, _, nouns, words, *_) = rng.choice(list(CATEGORIES.items()))
+        return " ".join([rng.choice(ADJECTIVES).lower(), rng.choice(nouns + words + (category,)).lower()])
+
+    workload = {name: [] for name in QUERIES}
+    for _ in range(size):
+        workload["filters"].append(partial(apply_filters, store, filters()))
+        workload["activity"].append(partial(activity_search, store, activity()))
+        workload["viewport"].append(partial(find_places_in_map_area, store, *_viewport(rng, rng.randint(11, 15))))
+        zoom = rng.randint(4, 14)
+        workload["clusters"].append(partial(get_map_clusters, store, zoom, *_viewport(rng, zoom - 1)))
+        workload["text"].append(partial(text_search, text(), store, 10))
+        north_east, south_west = _viewport(rng, 14)
+        center = ((north_east[0] + south_west[0]) / 2, (north_east[1] + south_west[1]) / 2)
+        workload["nearest"].append(partial(nearest_places, store, *center, 10, filters()))
+        workload["planner"].append(partial(query, filters=filters(), activities=[activity()],
+                                           bbox=_viewport(rng, 12), limit=50, places=store))
+    return workload
+
+def measure(calls, min_time: float = DEFAULT_MIN_TIME, rounds: int = ROUNDS) -> dict:
+    """
+    Runs calls round-robin for at least min_time seconds, and at least once each.
+
+    The time is split into up to rounds rounds, each calling every query at
+    least once, and only the round with the highest throughput
+    is reported: other processes can only slow a round down, so the fastest one
+    is the most repeatable, as with timeit.
+
+    Returns:
+        The number of calls in the reported round, its queries per second of busy
+        time and latency percentiles in milliseconds, and the largest memory a
+        single call allocated on top of what was already live, in KiB (measured
+        separately under tracemalloc, which would slow the timed runs).
+    """
+    best = None
+    started = time.perf_counter()
+    for _ in range(rounds):
+        if best is not None and time.perf_counter() - started >= min_time:
+            break # Queries slow enough to fill min_time in fewer rounds
+        latencies = []
+        round_started = time.perf_counter()
+        while not latencies or time.perf_counter() - round_started < min_time / rounds:
+            for call in calls:
+                call_started = time.perf_counter()
+                call()
+                latencies.append(time.perf_counter() - call_started)
+        if best is None or len(latencies) / sum(latencies) > len(best) / sum(best):
+            best = latencies
+    latencies = sorted(best)
+    busy = sum(latencies)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for call in calls:
+            tracemalloc.reset_peak()
+            live = tracemalloc.get_traced_memory()[0]
+            result = call()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - live)
+            del result
+    finally:
+        tracemalloc.stop()
+    return {
+        "calls": len(latencies),
+        "qps": round(len(latencies) / busy, 1) if busy else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+def run_benchmarks(scales=("10k",), queries=QUERIES, seed: int = 0, min_time: float = DEFAULT_MIN_TIME,
+                   log=None) -> dict:
+    """
+    Benchmarks each query type on a synthetic store of each scale.
+
+    Args:
+        scales: Scale labels (see parse_scale).
+        queries: The query types to measure, from QUERIES.
+        seed: Seed of the synthetic places and of the queries.
+        min_time: Seconds each query type is measured for.
+        log: Optional function called with a line of progress text.
+
+    Returns:
+        {"python": ..., "seed": ..., "scales": {label: {...}}} with, per scale, the
+        store build time and size, each index's build time and the measure() result
+        of each query type.
+    """
+    results = {"python": platform.python_version(), "seed": seed, "scales": {}}
+    for label in scales:
+        n = parse_scale(label)
+        started = time.perf_counter()
+        store = generate_store(n, seed)
+        scale = results["scales"][label] = {
+            "places": n,
+            "build_s": round(time.perf_counter() - started, 3),
+            "store_mb": round(store.nbytes() / 2 ** 20, 2),
+            "index_ms": {},
+            "queries": {},
+        }
+        for index_cls in INDEXES:
+            started = time.perf_counter()
+            store.index(index_cls)
+            scale["index_ms"][index_cls.__name__] = round((time.perf_counter() - started) * 1000, 1)
+        workload = build_workload(store, seed)
+        for name in queries:
+            for call in workload[name]: # Warm up, e.g. the text index's term bitsets
+                call()
+            scale["queries"][name] = result = measure(workload[name], min_time)
+            if log is not None:
+                log(f"{label:>5} {name:<9} {result['qps']:>10.1f} q/s  p50 {result['p50_ms']:>9.3f} ms  "
+                    f"p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  peak {result['peak_kb']:>10.1f} KiB")
+        del store, workload
+        gc.collect()
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE,
+            memory_tolerance: float = DEFAULT_MEMORY_TOLERANCE) -> list[str]:
+    """
+    Returns a description of every regression of results against baseline.
+
+    A query type regresses when it runs more than 1 + tolerance times slower
+    than the baseline, by throughput or by median latency, or when its peak
+    memory grows by more than memory_tolerance. The tail percentiles are not
+    compared: with a couple dozen distinct queries, p95 and p99 fall between
+    the heaviest ones and jump from one to the other with small timing changes.
+    Scales and query types missing from the baseline are not compared, and a
+    baseline measured with another seed is reported instead of compared.
+    """
+    if baseline.get("seed") != results["seed"]:
+        return [f"baseline was measured with seed {baseline.get('seed')}, not {results['seed']}"]
+    regressions = []
+    for label, scale in results["scales"].items():
+        baseline_queries = baseline.get("scales", {}).get(label, {}).get("queries", {})
+        for name, result in scale["queries"].items():
+            before = baseline_queries.get(name)
+            if before is None:
+                continue
+            if result["qps"] * (1 + tolerance) < before["qps"]:
+                regressions.append(f"{label} {name}: throughput {result['qps']} q/s, baseline {before['qps']} q/s")
+            if result["p50_ms"] > before["p50_ms"] * (1 + tolerance) + LATENCY_SLACK_MS:
+                regressions.append(f"{label} {name}: p50 {result['p50_ms']} ms, baseline {before['p50_ms']} ms")
+            if result["peak_kb"] > before["peak_kb"] * (1 + memory_tolerance) + MEMORY_SLACK_KB:
+                regressions.append(f"{label} {name}: peak memory {result['peak_kb']} KiB, baseline {before['peak_kb']} KiB")
+    return regressions
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmark",
+                                     description="Benchmark the query functions on synthetic places and check for regressions.")
+    parser.add_argument("--scales", default="10k", help="comma-separated scales, e.g. 10k,100k,1m,10m (default: 10k)")
+    parser.add_argument("--queries", default=",".join(QUERIES), help="comma-separated query types (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="seconds per query type")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown")
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE,
+                        help="allowed relative growth of peak memory")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the baseline instead of comparing")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    queries = [name for name in args.queries.split(",") if name]
+    unknown = set(queries) - set(QUERIES)
+    if unknown:
+        parser.error(f"unknown query types: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.scales.split(","), queries, args.seed, args.min_time, log=print)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fp:
+            baseline = json.load(fp)
+    if args.update_baseline:
+        # Scales and query types that were not run keep their baseline.
+        scales = baseline["scales"] if baseline is not None and baseline.get("seed") == results["seed"] else {}
+        for label, scale in results["scales"].items():
+            queries = dict(scales.get(label, {}).get("queries", {}), **scale["queries"])
+            scales[label] = dict(scale, queries=queries)
+        merged = dict(results, scales=scales)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as fp:
+            json.dump(merged, fp, indent=2)
+            fp.write("\n")
+        print(f"Baseline written to {args.baseline}.")
+        return
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from . import bitset
+from .place_store import PlaceStore, take
+
+class BitmapIndex:
+    """
+    One bitset per boolean attribute over a fixed set of places.
+
+    A multi-filter query is the bitwise AND of a few bitsets, and a match count
+    is a popcount, so neither touches the places themselves. Only matching rows
+    are materialized. Bitmaps for keys that were not indexed up front are built
+    on first use, so any key can be queried and missing keys behave like
+    place.get(key, False).
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore):
+        self.places = places
+        self.size = len(places)
+        self._bitmaps: dict[str, int] = {}
+
+    @classmethod
+    def from_places(cls, places: list[dict] | PlaceStore, keys=None) -> "BitmapIndex":
+        """
+        Builds an index over places.
+
+        Args:
+            places: A list of place dictionaries or a PlaceStore.
+            keys: Attribute keys to index eagerly. Defaults to the store's bit
+                  columns for a PlaceStore and to nothing for a list.
+
+        Returns:
+            A new BitmapIndex.
+        """
+        index = cls(places)
+        if keys is None:
+            keys = places.bool_keys() if isinstance(places, PlaceStore) else ()
+        index._build(keys)
+        return index
+
+    def register_attribute(self, key: str, predicate=None) -> int:
+        """
+        Adds (or replaces) a boolean attribute.
+
+        Args:
+            key: The attribute name queries will use.
+            predicate: Optional callable taking a place dict and returning a
+                       truthy value. Defaults to place.get(key, False).
+
+        Returns:
+            The attribute's bitset.
+        """
+        if predicate is None:
+            self._bitmaps.pop(key, None)
+            return self.bitmap(key)
+        bits = bitset.from_indices(row for row, place in enumerate(self.places) if predicate(place))
+        self._bitmaps[key] = bits
+        return bits
+
+    def keys(self) -> list[str]:
+        """Returns the attributes that currently have a bitset."""
+        return list(self._bitmaps)
+
+    def bitmap(self, key: str) -> int:
+        """Returns the bitset of rows where key is truthy, building it if needed."""
+        bits = self._bitmaps.get(key)
+        if bits is None:
+            self._build([key])
+            bits = self._bitmaps[key]
+        return bits
+
+    def match(self, active_filters) -> int:
+        """
+        Returns the bitset of rows matching every filter.
+
+        Bitsets are ANDed from the sparsest up so empty results stop early.
+        """
+        result = bitset.full(self.size)
+        for bits in sorted((self.bitmap(key) for key in active_filters), key=bitset.count):
+            result &= bits
+            if not result:
+                break
+        return result
+
+    def count(self, active_filters) -> int:
+        """Returns the number of rows matching every filter."""
+        return bitset.count(self.match(active_filters))
+
+    def entries(self, active_filters) -> int:
+        """Returns how many index entries match reads: the set bits of every filter's bitset, or every row for no filters."""
+        if not active_filters:
+            return self.size
+        return sum(bitset.count(self.bitmap(key)) for key in active_filters)
+
+    def facet_counts(self, keys, active_filters=frozenset()) -> dict[str, int]:
+        """
+        Returns, for each key, how many rows match active_filters plus that key.
+
+        This is what a filter UI shows next to each option, e.g. "Pet-Friendly (1,234)".
+        """
+        base = self.match(active_filters)
+        return {key: bitset.count(base & self.bitmap(key)) for key in keys}
+
+    def rows(self, bits: int) -> list[dict]:
+        """Materializes the rows in bits, in row order."""
+        return take(self.places, bitset.iter_indices(bits))
+
+    def _build(self, keys) -> None:
+        keys = [key for key in keys if key not in self._bitmaps]
+        if not keys:
+            return
+        if isinstance(self.places, PlaceStore):
+            for key in keys:
+                self._bitmaps[key] = self.places.bool_column(key)
+            return
+        # One pass over the dicts for all requested keys.
+        rows = {key: [] for key in keys}
+        for row, place in enumerate(self.places):
+            for key in keys:
+                if place.get(key, False):
+                    rows[key].append(row)
+        for key in keys:
+            self._bitmaps[key] = bitset.from_indices(rows[key])
@@ -0,0 +1,169 @@
+import sys
+from array import array
+
+# Bitsets are plain Python ints: bit i set means row i is a member.
+# Python ints give us arbitrary width, fast bitwise AND/OR in C and
+# int.bit_count() for popcount, without any third-party dependency.
+
+_WORD_BITS = 64
+
+def from_indices(indices) -> int:
+    """
+    Builds a bitset from an iterable of non-negative row indices.
+
+    Args:
+        indices: Row indices to set. Duplicates are allowed.
+
+    Returns:
+        An int with bit i set for every index i.
+    """
+    indices = list(indices)
+    if not indices:
+        return 0
+    packed = bytearray((max(indices) >> 3) + 1)
+    for i in indices:
+        packed[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(packed, "little")
+
+def iter_indices(bits: int):
+    """
+    Yields the set bit positions of a bitset in ascending order.
+
+    The bitset is unpacked 64 bits at a time, so sparse bitsets cost
+    O(words + members) rather than one big-int operation per member.
+    """
+    if bits <= 0:
+        return
+    n_words = (bits.bit_length() + _WORD_BITS - 1) // _WORD_BITS
+    words = array("Q", bits.to_bytes(n_words * 8, "little"))
+    if sys.byteorder == "big":
+        words.byteswap()
+    base = 0
+    for word in words:
+        while word:
+            low = word & -word
+            yield base + low.bit_length() - 1
+            word ^= low
+        base += _WORD_BITS
+
+def count(bits: int) -> int:
+    """Returns the number of members in a bitset (its popcount)."""
+    return bits.bit_count()
+
+def full(n: int) -> int:
+    """Returns a bitset with rows 0..n-1 set."""
+    return (1 << n) - 1 if n > 0 else 0
+
+class BitArray:
+    """
+    Packed, growable bit array with O(1) reads and writes of single bits.
+
+    Testing one bit of a large int bitset costs a shift of the whole int, so
+    per-row lookups go through this bytearray instead; to_int() converts to
+    the int form for bulk AND/OR and popcount, cached until the next write.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self._int = 0
+
+    @classmethod
+    def from_int(cls, bits: int) -> "BitArray":
+        """Unpacks an int bitset, e.g. a BitmapIndex.match() result, for per-row lookups."""
+        result = cls()
+        result.data = bytearray(bits.to_bytes((bits.bit_length() + 7) >> 3, "little"))
+        result._int = bits
+        return result
+
+    @classmethod
+    def from_indices(cls, indices) -> "BitArray":
+        """Builds a BitArray with the given row indices set."""
+        result = cls()
+        for i in indices:
+            result.set(i)
+        return result
+
+    def __getitem__(self, i: int) -> bool:
+        byte = i >> 3
+        return byte < len(self.data) and bool((self.data[byte] >> (i & 7)) & 1)
+
+    def set(self, i: int, value: bool = True) -> None:
+        byte = i >> 3
+        if byte >= len(self.data):
+            if not value:
+                return
+            self.data.extend(bytes(byte + 1 - len(self.data)))
+        if value:
+            self.data[byte] |= 1 << (i & 7)
+        else:
+            self.data[byte] &= ~(1 << (i & 7)) & 0xFF
+        self._int = None
+
+    def to_int(self) -> int:
+        if self._int is None:
+            self._int = int.from_bytes(self.data, "little")
+        return self._int
+
+    def nbytes(self) -> int:
+        return len(self.data)
+
+CHUNK_BITS = 4096 # Bits per ChunkedBits chunk
+_CHUNK_BYTES = CHUNK_BITS // 8
+_EMPTY_CHUNK = bytes(_CHUNK_BYTES)
+_FULL_CHUNK = b"\xff" * _CHUNK_BYTES
+
+class ChunkedBits:
+    """
+    Immutable bitset split into fixed-size chunks, for copy-on-write updates.
+
+    with_bit() returns a new ChunkedBits that shares every chunk but the one
+    it changes, so a write copies one chunk and the chunk list, a pointer
+    per CHUNK_BITS rows, instead of a whole int. A write thus costs
+    O(n / CHUNK_BITS): small, but proportional to the size. Single bits
+    are read in O(1); to_int() joins the chunks for bulk AND/OR and is
+    cached, and count() is kept up to date by with_bit().
+    """
+
+    __slots__ = ("chunks", "_count", "_int")
+
+    def __init__(self, chunks: tuple[bytes, ...] = (), count: int = 0):
+        self.chunks = chunks
+        self._count = count
+        self._int = None
+
+    @classmethod
+    def full(cls, n: int) -> "ChunkedBits":
+        """Returns a ChunkedBits with rows 0..n-1 set."""
+        whole, rest = divmod(n, CHUNK_BITS)
+        chunks = (_FULL_CHUNK,) * whole
+        if rest:
+            chunks += (full(rest).to_bytes(_CHUNK_BYTES, "little"),)
+        return cls(chunks, n)
+
+    def __getitem__(self, i: int) -> bool:
+        chunk = i // CHUNK_BITS
+        if chunk >= len(self.chunks):
+            return False
+        offset = i % CHUNK_BITS
+        return bool((self.chunks[chunk][offset >> 3] >> (offset & 7)) & 1)
+
+    def with_bit(self, i: int, value: bool = True) -> "ChunkedBits":
+        """Returns a copy with bit i set to value; returns self when it already is."""
+        if self[i] == value:
+            return self
+        chunk, offset = divmod(i, CHUNK_BITS)
+        chunks = list(self.chunks)
+        if chunk >= len(chunks):
+            chunks.extend([_EMPTY_CHUNK] * (chunk + 1 - len(chunks)))
+        data = bytearray(chunks[chunk])
+        data[offset >> 3] ^= 1 << (offset & 7)
+        chunks[chunk] = bytes(data)
+        return ChunkedBits(tuple(chunks), self._count + (1 if value else -1))
+
+    def count(self) -> int:
+        return self._count
+
+    def to_int(self) -> int:
+        if self._int is None:
+            self._int = int.from_bytes(b"".join(self.chunks), "little")
+        return self._int
@@ -0,0 +1,240 @@
+import math
+from array import array
+
+from . import vectorized
+from .geo import viewport_boxes
+from .place_store import PlaceStore, take
+from .spatial_index import STRTree
+
+DEFAULT_RADIUS = 60 # Cluster radius in screen pixels
+DEFAULT_EXTENT = 512 # Tile size in screen pixels
+DEFAULT_MIN_ZOOM = 0
+DEFAULT_MAX_ZOOM = 20
+
+_MAX_LAT = 85.0511287798 # Web Mercator cut-off
+
+def project(lat: float, lon: float) -> tuple[float, float]:
+    """Projects latitude/longitude to Web Mercator world coordinates in [0, 1]."""
+    x = lon / 360.0 + 0.5
+    sin_lat = math.sin(math.radians(max(-_MAX_LAT, min(_MAX_LAT, lat))))
+    y = 0.5 - 0.25 * math.log((1 + sin_lat) / (1 - sin_lat)) / math.pi
+    return x, min(1.0, max(0.0, y))
+
+def unproject(x: float, y: float) -> tuple[float, float]:
+    """Inverse of project(): returns (latitude, longitude)."""
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, (x - 0.5) * 360.0
+
+class ClusterLevel:
+    """
+    The clustered points for one zoom level.
+
+    Items are either single places (count 1, id is the place row) or clusters
+    (count > 1, id is a cluster id). Coordinates are projected world
+    coordinates, and ``tree`` indexes them for bounding-box queries.
+    """
+
+    def __init__(self, xs: array, ys: array, counts: array, ids: array, expansion_zooms: array,
+                 backend: str | None = None):
+        self.xs = xs
+        self.ys = ys
+        self.counts = counts
+        self.ids = ids
+        self.expansion_zooms = expansion_zooms
+        self.tree = STRTree(xs, ys, backend=backend)
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+class ClusterIndex:
+    """
+    Zoom-aware point clustering precomputed for every zoom level, in the
+    style of supercluster.
+
+    Starting from the individual places, each zoom level from max_zoom down
+    to min_zoom greedily merges the items of the level above that fall into
+    the same grid cell of ``radius`` screen pixels. A merged cluster sits at
+    the count-weighted centroid of its members and expands (splits) at the
+    next zoom in. Each level has its own spatial index, so a (viewport, zoom)
+    request costs time proportional to the number of items returned, not to
+    the number of places. With the NumPy backend the per-zoom grid pass is
+    vectorized and produces the same levels.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore, radius: int = DEFAULT_RADIUS, extent: int = DEFAULT_EXTENT,
+                 min_zoom: int = DEFAULT_MIN_ZOOM, max_zoom: int = DEFAULT_MAX_ZOOM, backend: str | None = None):
+        self.places = places
+        self.size = len(places)
+        self.radius = radius
+        self.extent = extent
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.backend = backend
+        # levels[z] for z in min_zoom..max_zoom + 1; the last level holds the unclustered places.
+        self.levels: dict[int, ClusterLevel] = {}
+        self._build()
+
+    @classmethod
+    def from_places(cls, places: list[dict] | PlaceStore, **options) -> "ClusterIndex":
+        """Precomputes clusters for every zoom level over a list of place dictionaries or a PlaceStore."""
+        return cls(places, **options)
+
+    def _build(self) -> None:
+        xs, ys, ids = array("d"), array("d"), array("q")
+        if isinstance(self.places, PlaceStore):
+            coordinates = zip(self.places.latitudes, self.places.longitudes)
+        else:
+            coordinates = ((p.get("latitude"), p.get("longitude")) for p in self.places)
+        for row, (lat, lon) in enumerate(coordinates):
+            if lat is None or lon is None or math.isnan(lat) or math.isnan(lon):
+                continue
+            x, y = project(lat, lon)
+            xs.append(x)
+            ys.append(y)
+            ids.append(row)
+        n = len(ids)
+        level = ClusterLevel(xs, ys, array("I", [1]) * n, ids, array("b", [-1]) * n, self.backend)
+        self.levels[self.max_zoom + 1] = level
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            level = self._cluster(level, zoom)
+            self.levels[zoom] = level
+
+    def _cluster(self, level: ClusterLevel, zoom: int) -> ClusterLevel:
+        """Merges the items of the level above that share a grid cell at zoom."""
+        cells_per_world = max(1, int(self.extent * (1 << zoom) / self.radius))
+        if vectorized.use_numpy(self.backend):
+            columns = vectorized.grid_cluster(level.xs, level.ys, level.counts, level.ids,
+                                              level.expansion_zooms, cells_per_world, zoom)
+            return level if columns is None else ClusterLevel(*columns, self.backend)
+        cells: dict[int, list[int]] = {}
+        for i, (x, y) in enumerate(zip(level.xs, level.ys)):
+            cx = min(int(x * cells_per_world), cells_per_world - 1)
+            cy = min(int(y * cells_per_world), cells_per_world - 1)
+            key = cx * cells_per_world + cy
+            members = cells.get(key)
+            if members is None:
+                cells[key] = [i]
+            else:
+                members.append(i)
+        if len(cells) == len(level):
+            return level # Nothing merges at this zoom; share the level above.
+
+        xs, ys, counts, ids, expansion_zooms = array("d"), array("d"), array("I"), array("q"), array("b")
+        for members in cells.values():
+            if len(members) == 1:
+                i = members[0]
+                xs.append(level.xs[i])
+                ys.append(level.ys[i])
+                counts.append(level.counts[i])
+                ids.append(level.ids[i])
+                expansion_zooms.append(level.expansion_zooms[i])
+                continue
+            total = 0
+            wx = wy = 0.0
+            for i in members:
+                count = level.counts[i]
+                total += count
+                wx += level.xs[i] * count
+                wy += level.ys[i] * count
+            xs.append(wx / total)
+            ys.append(wy / total)
+            counts.append(total)
+            # Encode the originating item and the zoom so ids are unique across levels.
+            ids.append((members[0] << 5) + zoom + 1)
+            expansion_zooms.append(zoom + 1)
+        return ClusterLevel(xs, ys, counts, ids, expansion_zooms, self.backend)
+
+    def _level(self, zoom: int) -> ClusterLevel:
+        return self.levels[max(self.min_zoom, min(int(zoom), self.max_zoom + 1))]
+
+    def get_clusters(self, zoom: int, north_east_corner: tuple[float, float] = (90.0, 180.0),
+                     south_west_corner: tuple[float, float] = (-90.0, -180.0)) -> list[dict]:
+        """
+        Returns the clusters and single places visible in a viewport at a zoom level.
+
+        Args:
+            zoom: The map zoom level. Levels beyond max_zoom show individual places.
+            north_east_corner: (latitude, longitude) of the NE corner; defaults to the whole world.
+            south_west_corner: (latitude, longitude) of the SW corner. A south-west longitude
+                               greater than the north-east one crosses the antimeridian.
+
+        Returns:
+            A list of dictionaries with "latitude", "longitude" and "count". Clusters also have
+            "cluster_id" and "expansion_zoom"; single places have "row", their row in the places.
+        """
+        return self.features(zoom, self.query(zoom, north_east_corner, south_west_corner))
+
+    def query(self, zoom: int, north_east_corner: tuple[float, float] = (90.0, 180.0),
+              south_west_corner: tuple[float, float] = (-90.0, -180.0)) -> list[int]:
+        """Returns the sorted positions of the items visible in a viewport within the zoom's level."""
+        return self.scan(zoom, north_east_corner, south_west_corner)[0]
+
+    def scan(self, zoom: int, north_east_corner: tuple[float, float] = (90.0, 180.0),
+             south_west_corner: tuple[float, float] = (-90.0, -180.0)) -> tuple[list[int], int]:
+        """Like query, but also returns how many leaf entries were read; see STRTree.scan."""
+        level = self._level(zoom)
+        items = []
+        read = 0
+        for box in self._projected_boxes(north_east_corner, south_west_corner):
+            box_items, box_read = level.tree.scan(*box)
+            items.extend(box_items)
+            read += box_read
+        items.sort()
+        return items, read
+
+    def select(self, zoom: int, items, north_east_corner: tuple[float, float],
+               south_west_corner: tuple[float, float]) -> list[int]:
+        """
+        Narrows item positions from query() to those inside a viewport.
+
+        Uses the same projected, edge-inclusive test as query(), so narrowing the
+        items of a larger viewport gives exactly query() of the smaller one.
+        """
+        level = self._level(zoom)
+        xs, ys = level.xs, level.ys
+        boxes = self._projected_boxes(north_east_corner, south_west_corner)
+        return [
+            i for i in items
+            if any(min_x <= xs[i] <= max_x and min_y <= ys[i] <= max_y for min_x, min_y, max_x, max_y in boxes)
+        ]
+
+    def features(self, zoom: int, items) -> list[dict]:
+        """Builds the get_clusters() dictionaries for item positions within the zoom's level."""
+        level = self._level(zoom)
+        features = []
+        for i in items:
+            count = level.counts[i]
+            if count == 1:
+                row = level.ids[i]
+                lat, lon = self._place_coordinates(row)
+                features.append({"row": row, "latitude": lat, "longitude": lon, "count": 1})
+            else:
+                lat, lon = unproject(level.xs[i], level.ys[i])
+                features.append({"cluster_id": level.ids[i], "latitude": lat, "longitude": lon, "count": count,
+                                 "expansion_zoom": level.expansion_zooms[i]})
+        return features
+
+    @staticmethod
+    def _projected_boxes(north_east_corner, south_west_corner) -> list[tuple[float, float, float, float]]:
+        boxes = []
+        for min_lon, min_lat, max_lon, max_lat in viewport_boxes(north_east_corner, south_west_corner):
+            # Mercator y grows southwards, so the north edge gives the smaller y.
+            min_x, max_y = project(min_lat, min_lon)
+            max_x, min_y = project(max_lat, max_lon)
+            boxes.append((min_x, min_y, max_x, max_y))
+        return boxes
+
+    def get_cluster_expansion_zoom(self, cluster_id: int) -> int:
+        """Returns the zoom level at which a cluster splits into its children."""
+        return cluster_id & 31
+
+    def _place_coordinates(self, row: int) -> tuple[float, float]:
+        # Single places report their stored coordinates, not a projection round trip.
+        if isinstance(self.places, PlaceStore):
+            return self.places.coordinates(row)
+        place = self.places[row]
+        return place["latitude"], place["longitude"]
+
+    def rows(self, row_ids) -> list[dict]:
+        """Materializes row_ids as place dictionaries."""
+        return take(self.places, row_ids)
@@ -1,3 +1,8 @@
+from . import bitset, vectorized
+from .bitmap_index import BitmapIndex
+from .instrumentation import count_rows, instrumented
+from .place_store import PlaceStore
+
 # Define available filters
 DETAILED_FILTERS = {
     "suitable_for_kids": "Suitable for Kids",
@@ -7,20 +12,35 @@ DETAILED_FILTERS = {
     "wifi_available": "Wi-Fi Available",
 }
 
-def apply_filters(places: list[dict], active_filters: set[str]) -> list[dict]:
+@instrumented
+def apply_filters(places: list[dict] | PlaceStore | BitmapIndex, active_filters: set[str],
+                  backend: str | None = None) -> list[dict]:
     """
     Applies selected filters to a list of places.
 
     Args:
         places: A list of dictionaries, where each dictionary represents a place
-                and should have keys corresponding to the filter IDs (e.g., "pet_friendly": True).
+                and should have keys corresponding to the filter IDs (e.g., "pet_friendly": True),
+                a PlaceStore holding the same places in columnar form, or a BitmapIndex
+                over either. Stores are filtered through their cached BitmapIndex.
         active_filters: A set of strings representing the IDs of filters to apply.
+        backend: "python" or "numpy" for list input, or None for vectorized.get_backend().
+                 The NumPy backend ANDs one boolean mask per filter instead of testing
+                 each place in turn; results are identical.
 
     Returns:
         A new list of places that match all active filters.
     """
+    if isinstance(places, PlaceStore):
+        places = places.index(BitmapIndex)
+    if isinstance(places, BitmapIndex):
+        return _apply_filters_index(places, active_filters)
     if not active_filters:
         return places
+    if vectorized.use_numpy(backend):
+        filtered_places = [places[i] for i in vectorized.filter_rows(places, active_filters)]
+        count_rows("apply_filters", len(places), len(filtered_places))
+        return filtered_places
 
     filtered_places = []
     for place in places:
@@ -32,9 +52,48 @@ def apply_filters(places: list[dict], active_filters: set[str]) -> list[dict]:
         if match:
             filtered_places.append(place)
 
-    print(f"Applied filters: {active_filters}. Found {len(filtered_places)} matching places.")
+    count_rows("apply_filters", len(places), len(filtered_places))
+    return filtered_places
+
+def _apply_filters_index(index: BitmapIndex, active_filters: set[str]) -> list[dict]:
+    """apply_filters through a BitmapIndex: AND the bitsets, then materialize only the hits."""
+    if not active_filters:
+        filtered_places = index.rows(bitset.full(index.size))
+    else:
+        filtered_places = index.rows(index.match(active_filters))
+    count_rows("apply_filters", index.entries(active_filters), len(filtered_places))
     return filtered_places
 
 def get_available_filters() -> dict:
     """Returns a dictionary of available filters."""
     return DETAILED_FILTERS
+
+def register_filter(filter_id: str, label: str) -> None:
+    """
+    Makes a new boolean attribute available as a filter.
+
+    Args:
+        filter_id: The place key the filter tests (e.g., "free_entry").
+        label: The display name shown in the filter UI.
+    """
+    DETAILED_FILTERS[filter_id] = label
+
+def get_filter_counts(places: list[dict] | PlaceStore | BitmapIndex, active_filters: set[str] = frozenset()) -> dict[str, int]:
+    """
+    Counts matches for every available filter, given the filters already selected.
+
+    Args:
+        places: A list of place dictionaries, a PlaceStore, or a BitmapIndex.
+        active_filters: The filter IDs the user has already selected.
+
+    Returns:
+        A dictionary mapping each filter ID in DETAILED_FILTERS to the number of places
+        that would match if it were added to active_filters.
+    """
+    if isinstance(places, PlaceStore):
+        index = places.index(BitmapIndex)
+    elif isinstance(places, BitmapIndex):
+        index = places
+    else:
+        index = BitmapIndex.from_places(places, keys=list(DETAILED_FILTERS) + list(active_filters))
+    return index.facet_counts(DETAILED_FILTERS, active_filters)
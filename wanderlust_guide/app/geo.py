@@ -0,0 +1,80 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8 # Mean Earth radius in meters
+
+def viewport_boxes(north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> list[tuple[float, float, float, float]]:
+    """
+    Converts a map viewport into one or two plain longitude/latitude boxes.
+
+    A viewport whose south-west longitude is greater than its north-east
+    longitude crosses the antimeridian (e.g. from 170 to -170), so it is split
+    into a box up to 180 and a box from -180.
+
+    Args:
+        north_east_corner: A tuple (latitude, longitude) for the NE corner of the map view.
+        south_west_corner: A tuple (latitude, longitude) for the SW corner of the map view.
+
+    Returns:
+        A list of (min_lon, min_lat, max_lon, max_lat) boxes.
+    """
+    ne_lat, ne_lon = north_east_corner
+    sw_lat, sw_lon = south_west_corner
+    if sw_lon > ne_lon:
+        return [(sw_lon, sw_lat, 180.0, ne_lat), (-180.0, sw_lat, ne_lon, ne_lat)]
+    return [(sw_lon, sw_lat, ne_lon, ne_lat)]
+
+def in_viewport(lat: float, lon: float, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> bool:
+    """Returns True if (lat, lon) lies inside the viewport, edges included."""
+    ne_lat, ne_lon = north_east_corner
+    sw_lat, sw_lon = south_west_corner
+    if not sw_lat <= lat <= ne_lat:
+        return False
+    if sw_lon > ne_lon: # Viewport crosses the antimeridian
+        return lon >= sw_lon or lon <= ne_lon
+    return sw_lon <= lon <= ne_lon
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters between two (latitude, longitude) points."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def _hav(theta: float) -> float:
+    s = math.sin(theta / 2)
+    return s * s
+
+def box_distance_m(lat: float, lon: float, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> float:
+    """
+    Lower bound of the great-circle distance in meters from (lat, lon) to any
+    point of a longitude/latitude box, 0 if the point is inside.
+
+    The box is given in viewport_boxes() order. Distances wrap around the
+    antimeridian. When the point is east or west of the box, the closest point
+    on the box's nearer meridian edge is where that edge meets the great circle
+    through the point, or else one of the edge's corners.
+    """
+    if min_lon <= lon <= max_lon:
+        if lat < min_lat:
+            return math.radians(min_lat - lat) * EARTH_RADIUS_M
+        if lat > max_lat:
+            return math.radians(lat - max_lat) * EARTH_RADIUS_M
+        return 0.0
+    hav_d_lambda = min(_hav(math.radians(min_lon - lon)), _hav(math.radians(max_lon - lon)))
+    cos_phi = math.cos(math.radians(lat))
+
+    def hav_distance(edge_lat):
+        return cos_phi * math.cos(math.radians(edge_lat)) * hav_d_lambda + _hav(math.radians(lat - edge_lat))
+
+    cos_d_lambda = 1 - 2 * hav_d_lambda
+    if cos_d_lambda <= 0:
+        closest_lat = 90.0 if lat > 0 else -90.0
+    else:
+        closest_lat = math.degrees(math.atan(math.tan(math.radians(lat)) / cos_d_lambda))
+    if min_lat < closest_lat < max_lat:
+        h = hav_distance(closest_lat)
+    else:
+        h = min(hav_distance(min_lat), hav_distance(max_lat))
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
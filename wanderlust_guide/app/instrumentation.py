@@ -0,0 +1,296 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+
+# Upper bounds of the latency histogram buckets in seconds, as Prometheus
+# expects them; a final +Inf bucket catches everything slower.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+RECENT_ERRORS = 20 # Tracebacks kept in Metrics.recent_errors
+
+# The installed Instrumentation, or None. Instrumented functions check it on
+# every call, so nothing but that check runs while it is None.
+_instrumentation = None
+
+class Instrumentation:
+    """
+    Receives events from the query functions; this base class ignores them.
+
+    Subclass it and install an instance with set_instrumentation() to see
+    where time goes (Metrics is the one provided). The events are:
+
+    - call(): one call of a function decorated with @instrumented, which the
+      receiver must make and return the result of;
+    - rows(): how many rows a query examined and how many it returned;
+    - lookup(): a hit or miss of a cache, including PlaceStore's index cache;
+    - error(): an unexpected exception that failed a request, which the
+      client only sees as a generic error.
+    """
+
+    def call(self, name: str, function, args: tuple, kwargs: dict):
+        """Calls function(*args, **kwargs) on behalf of the instrumented function name."""
+        return function(*args, **kwargs)
+
+    def rows(self, name: str, scanned: int, returned: int) -> None:
+        """
+        Records that a call of name examined scanned rows and returned returned of them.
+
+        Linear scans count every row they test. Index paths count the index
+        entries they read instead: posting-list entries (plus candidate rows)
+        for text and activity searches, set bits of the ANDed bitsets for
+        filters, and R-tree leaf entries for viewports and clusters. A call
+        that returns every row counts each one as examined.
+        """
+
+    def lookup(self, cache: str, hit: bool) -> None:
+        """Records a hit or a miss of cache."""
+
+    def error(self, name: str, error: BaseException) -> None:
+        """Records that handling name failed with error."""
+
+class Histogram:
+    """
+    Observation counts per bucket, with their sum.
+
+    Args:
+        bounds: Ascending bucket upper bounds; values above the last go to an
+                implicit +Inf bucket.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile by interpolating inside the bucket that holds it,
+        as Prometheus' histogram_quantile() does. Quantiles falling in the +Inf
+        bucket are reported as the last bound.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list of exact observations, 0.0 when empty."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+class Metrics(Instrumentation):
+    """
+    Instrumentation that aggregates events into metrics.
+
+    Per instrumented function it keeps a latency histogram and the rows
+    scanned and returned; per cache, the hits and misses; per failed request
+    name, the count of each exception type, and the last errors with their
+    tracebacks in recent_errors. With profile_every
+    set, every Nth call of each function also runs under cProfile and its
+    stats are merged into profiles[name]. Only one call is profiled at a time,
+    so calls made while a profile is running (on any thread, or nested inside
+    the profiled call) are timed but not profiled.
+
+    The totals are exported with to_json() or, in the Prometheus text
+    exposition format, with to_prometheus().
+
+    Args:
+        profile_every: Profile one call in this many per function; 0 disables profiling.
+        buckets: Latency histogram bucket bounds in seconds.
+    """
+
+    def __init__(self, profile_every: int = 0, buckets=LATENCY_BUCKETS):
+        self.profile_every = profile_every
+        self.buckets = tuple(buckets)
+        self.latencies: dict[str, Histogram] = {}
+        self.scanned: dict[str, int] = {}
+        self.returned: dict[str, int] = {}
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self.errors: dict[str, dict[str, int]] = {}
+        self.recent_errors: deque[str] = deque(maxlen=RECENT_ERRORS)
+        self.profiles: dict[str, pstats.Stats] = {}
+        self._calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+
+    def call(self, name: str, function, args: tuple, kwargs: dict):
+        profiler = None
+        if self.profile_every:
+            with self._lock:
+                calls = self._calls[name] = self._calls.get(name, 0) + 1
+            if calls % self.profile_every == 0 and self._profiling.acquire(blocking=False):
+                profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            if profiler is None:
+                return function(*args, **kwargs)
+            return profiler.runcall(function, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                self._profiling.release()
+            with self._lock:
+                histogram = self.latencies.get(name)
+                if histogram is None:
+                    histogram = self.latencies[name] = Histogram(self.buckets)
+                histogram.observe(elapsed)
+                if profiler is not None:
+                    if name in self.profiles:
+                        self.profiles[name].add(profiler)
+                    else:
+                        self.profiles[name] = pstats.Stats(profiler)
+
+    def rows(self, name: str, scanned: int, returned: int) -> None:
+        with self._lock:
+            self.scanned[name] = self.scanned.get(name, 0) + scanned
+            self.returned[name] = self.returned.get(name, 0) + returned
+
+    def lookup(self, cache: str, hit: bool) -> None:
+        with self._lock:
+            counts = self.hits if hit else self.misses
+            counts[cache] = counts.get(cache, 0) + 1
+
+    def error(self, name: str, error: BaseException) -> None:
+        text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        with self._lock:
+            counts = self.errors.setdefault(name, {})
+            counts[type(error).__name__] = counts.get(type(error).__name__, 0) + 1
+            self.recent_errors.append(f"{name}: {text}")
+
+    def reset(self) -> None:
+        """Forgets everything recorded so far."""
+        with self._lock:
+            for metric in (self.latencies, self.scanned, self.returned, self.hits, self.misses, self.errors,
+                           self.recent_errors, self.profiles, self._calls):
+                metric.clear()
+
+    def profile_report(self, name: str, limit: int = 20, sort: str = "cumulative") -> str:
+        """Returns the merged cProfile stats of name as text, the limit slowest entries by sort."""
+        with self._lock:
+            stats = self.profiles.get(name)
+            if stats is None:
+                return ""
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def to_json(self) -> dict:
+        """
+        Returns the metrics as a JSON-serializable dictionary:
+        {"functions": {name: {...}}, "caches": {cache: {...}}, "errors": {name: {exception type: count}}},
+        with latencies in milliseconds. recent_errors is left out, as it holds tracebacks.
+        """
+        with self._lock:
+            functions = {}
+            for name in sorted(set(self.latencies) | set(self.scanned)):
+                histogram = self.latencies.get(name) or Histogram(self.buckets)
+                functions[name] = {
+                    "calls": histogram.count,
+                    "total_ms": round(histogram.sum * 1000, 3),
+                    "p50_ms": round(histogram.quantile(0.50) * 1000, 3),
+                    "p95_ms": round(histogram.quantile(0.95) * 1000, 3),
+                    "p99_ms": round(histogram.quantile(0.99) * 1000, 3),
+                    "rows_scanned": self.scanned.get(name, 0),
+                    "rows_returned": self.returned.get(name, 0),
+                    "profiled": name in self.profiles,
+                }
+            caches = {}
+            for cache in sorted(set(self.hits) | set(self.misses)):
+                hits, misses = self.hits.get(cache, 0), self.misses.get(cache, 0)
+                caches[cache] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4)}
+            errors = {name: dict(sorted(counts.items())) for name, counts in sorted(self.errors.items())}
+        return {"functions": functions, "caches": caches, "errors": errors}
+
+    def to_prometheus(self, prefix: str = "wanderlust") -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines.append(f"# HELP {prefix}_query_duration_seconds Latency of instrumented query functions.")
+            lines.append(f"# TYPE {prefix}_query_duration_seconds histogram")
+            for name, histogram in sorted(self.latencies.items()):
+                label = f'function="{name}"'
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_query_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_query_duration_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}_query_duration_seconds_sum{{{label}}} {histogram.sum!r}")
+                lines.append(f"{prefix}_query_duration_seconds_count{{{label}}} {histogram.count}")
+            for metric, values, help_text in (("rows_scanned", self.scanned, "Rows examined by query functions."),
+                                              ("rows_returned", self.returned, "Rows returned by query functions.")):
+                lines.append(f"# HELP {prefix}_{metric}_total {help_text}")
+                lines.append(f"# TYPE {prefix}_{metric}_total counter")
+                for name, value in sorted(values.items()):
+                    lines.append(f'{prefix}_{metric}_total{{function="{name}"}} {value}')
+            lines.append(f"# HELP {prefix}_cache_lookups_total Cache lookups by result.")
+            lines.append(f"# TYPE {prefix}_cache_lookups_total counter")
+            for result, counts in (("hit", self.hits), ("miss", self.misses)):
+                for cache, value in sorted(counts.items()):
+                    lines.append(f'{prefix}_cache_lookups_total{{cache="{cache}",result="{result}"}} {value}')
+            lines.append(f"# HELP {prefix}_errors_total Failed requests by exception type.")
+            lines.append(f"# TYPE {prefix}_errors_total counter")
+            for name, counts in sorted(self.errors.items()):
+                for kind, value in sorted(counts.items()):
+                    lines.append(f'{prefix}_errors_total{{function="{name}",type="{kind}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+def set_instrumentation(instrumentation: Instrumentation | None) -> Instrumentation | None:
+    """Installs instrumentation process-wide (None to turn it off) and returns the one it replaces."""
+    global _instrumentation
+    previous, _instrumentation = _instrumentation, instrumentation
+    return previous
+
+def get_instrumentation() -> Instrumentation | None:
+    """Returns the installed instrumentation, or None."""
+    return _instrumentation
+
+def instrumented(function):
+    """Decorator handing each call of function to the installed instrumentation, named by its __qualname__."""
+    name = function.__qualname__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        instrumentation = _instrumentation
+        if instrumentation is None:
+            return function(*args, **kwargs)
+        return instrumentation.call(name, function, args, kwargs)
+
+    return wrapper
+
+def count_rows(name: str, scanned: int, returned: int) -> None:
+    """Reports rows scanned and returned by a call of name to the installed instrumentation."""
+    if _instrumentation is not None:
+        _instrumentation.rows(name, scanned, returned)
+
+def count_lookup(cache: str, hit: bool) -> None:
+    """Reports a cache hit or miss to the installed instrumentation."""
+    if _instrumentation is not None:
+        _instrumentation.lookup(cache, hit)
+
+def report_error(name: str, error: BaseException) -> None:
+    """Reports an exception that failed a request for name to the installed instrumentation."""
+    if _instrumentation is not None:
+        _instrumentation.error(name, error)
@@ -0,0 +1,379 @@
+import itertools
+import math
+import threading
+from array import array
+from bisect import bisect_left
+
+from . import bitset
+from .activity_index import ActivityIndex, normalize_activity
+from .bitmap_index import BitmapIndex
+from .geo import in_viewport
+from .instrumentation import count_rows, instrumented
+from .name_index import NameIndex
+from .place_store import (
+    ACTIVITIES_KEY, DESCRIPTION_KEY, LATITUDE_KEY, LONGITUDE_KEY, NAME_KEY, PlaceStore,
+)
+from .spatial_index import SpatialIndex
+
+# Writes since the last compaction beyond which the background compactor is woken early.
+DEFAULT_COMPACTION_THRESHOLD = 4096
+DEFAULT_COMPACTION_INTERVAL = 60.0 # Seconds
+
+_NON_FILTER_KEYS = frozenset({NAME_KEY, DESCRIPTION_KEY, ACTIVITIES_KEY, LATITUDE_KEY, LONGITUDE_KEY})
+# Indexes built for every new base, so that readers never pay for building them.
+_BASE_INDEXES = (BitmapIndex, ActivityIndex, SpatialIndex, NameIndex)
+
+class _DeltaLog:
+    """
+    Append-only storage of delta places, shared by a chain of snapshots.
+
+    Every snapshot reads only its first delta_size entries, so appending for
+    a newer snapshot never changes an older one. The per-key, flag, activity
+    and name tables list positions in ascending order for the same reason.
+    """
+
+    def __init__(self):
+        self.places: list[dict] = []
+        self.keys: list[int] = []
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.rows: dict[int, list[int]] = {}
+        self.flags: dict[str, list[int]] = {}
+        self.activities: dict[str, list[int]] = {}
+        self.names: dict[str, list[int]] = {}
+
+    def truncated(self, size: int) -> "_DeltaLog":
+        """A private copy of the first size entries, for a snapshot that is not the newest of its chain."""
+        log = _DeltaLog()
+        for key, place in zip(self.keys[:size], self.places[:size]):
+            log.append(key, place)
+        return log
+
+    def append(self, key: int, place: dict) -> None:
+        pos = len(self.places)
+        self.places.append(place)
+        self.keys.append(key)
+        self.rows.setdefault(key, []).append(pos)
+        for k, value in place.items():
+            if value and k not in _NON_FILTER_KEYS:
+                self.flags.setdefault(k, []).append(pos)
+        for token in {normalize_activity(a) for a in place.get(ACTIVITIES_KEY, [])}:
+            self.activities.setdefault(token, []).append(pos)
+        name = place.get(NAME_KEY)
+        if name is not None:
+            self.names.setdefault(name, []).append(pos)
+        lat, lon = place.get(LATITUDE_KEY), place.get(LONGITUDE_KEY)
+        missing = lat is None or lon is None
+        self.latitudes.append(math.nan if missing else lat)
+        self.longitudes.append(math.nan if missing else lon)
+
+class PlaceSnapshot:
+    """
+    An immutable, consistent view of the places at one version.
+
+    A snapshot is a compacted base PlaceStore, with its indexes, plus a small
+    delta of places written since the base was built. The base is shared by
+    every snapshot until the next compaction and never changes. Deleting a
+    base place clears its bit in ``base_live``. Updating one deletes it and
+    appends the new version to the delta.
+
+    The delta lives in an append-only log shared with later snapshots; a
+    snapshot sees its first ``delta_size`` entries, and ``delta_live`` marks
+    which of them are current. ``base_live`` and ``delta_live`` are
+    ChunkedBits, so a write copies one chunk of each plus its tuple of chunk
+    references, never the base or the delta, and appends to the log in
+    amortized O(1). A write is therefore cheap but still proportional to the
+    base size: one reference per CHUNK_BITS rows. Queries combine base
+    index results masked by ``base_live`` with the live delta entries.
+
+    Places are listed base rows first, then the delta in write order, so an
+    updated place moves to the end until the next compaction.
+    """
+
+    def __init__(self, version: int, base: PlaceStore, base_keys: array, base_live: bitset.ChunkedBits):
+        self.version = version
+        self.base = base
+        self.base_keys = base_keys
+        self.base_rows = {key: row for row, key in enumerate(base_keys)} if base_keys else {}
+        self.base_live = base_live
+        self.delta_size = 0
+        self.delta_live = bitset.ChunkedBits()
+        self._log = _DeltaLog()
+
+    @classmethod
+    def from_base(cls, version: int, base: PlaceStore, base_keys: array) -> "PlaceSnapshot":
+        """A snapshot of a freshly compacted base with an empty delta."""
+        return cls(version, base, base_keys, bitset.ChunkedBits.full(len(base)))
+
+    def __len__(self) -> int:
+        return self.base_live.count() + self.delta_live.count()
+
+    def __iter__(self):
+        return iter(self.places())
+
+    def _copy(self) -> "PlaceSnapshot":
+        clone = object.__new__(PlaceSnapshot)
+        clone.__dict__.update(self.__dict__)
+        return clone
+
+    def _delta_positions(self, positions: list[int] | None) -> list[int]:
+        """The positions of a log table entry that this snapshot can see."""
+        if not positions:
+            return []
+        return positions[:bisect_left(positions, self.delta_size)]
+
+    def _delta_bits(self, positions: list[int] | None) -> int:
+        return bitset.from_indices(self._delta_positions(positions)) & self.delta_live.to_int()
+
+    def _delta_pos(self, key: int) -> int | None:
+        """The live delta position holding key, or None."""
+        positions = self._delta_positions(self._log.rows.get(key))
+        if positions and self.delta_live[positions[-1]]:
+            return positions[-1]
+        return None
+
+    # Writes: each returns a new snapshot and leaves this one untouched.
+
+    def with_place(self, key: int, place: dict | None, version: int) -> "PlaceSnapshot":
+        """Returns a snapshot where key holds place, or is deleted when place is None."""
+        snapshot = self._copy()
+        snapshot.version = version
+        snapshot._remove(key)
+        if place is not None:
+            snapshot._append(key, place)
+        return snapshot
+
+    def _remove(self, key: int) -> None:
+        pos = self._delta_pos(key)
+        if pos is not None:
+            self.delta_live = self.delta_live.with_bit(pos, False)
+            return
+        row = self.base_rows.get(key)
+        if row is not None:
+            self.base_live = self.base_live.with_bit(row, False)
+
+    def _append(self, key: int, place: dict) -> None:
+        if len(self._log.places) != self.delta_size:
+            # A newer snapshot already appended to the shared log; branch off a copy.
+            self._log = self._log.truncated(self.delta_size)
+        pos = self.delta_size
+        self._log.append(key, place)
+        self.delta_size += 1
+        self.delta_live = self.delta_live.with_bit(pos)
+
+    # Reads
+
+    def get(self, key: int) -> dict | None:
+        """Returns the current place for key, or None if it does not exist."""
+        pos = self._delta_pos(key)
+        if pos is not None:
+            return self._log.places[pos]
+        row = self.base_rows.get(key)
+        if row is not None and self.base_live[row]:
+            return self.base[row]
+        return None
+
+    def keys(self) -> list[int]:
+        """Returns the keys of all live places, in listing order."""
+        return ([self.base_keys[row] for row in bitset.iter_indices(self.base_live.to_int())]
+                + [self._log.keys[pos] for pos in bitset.iter_indices(self.delta_live.to_int())])
+
+    def places(self) -> list[dict]:
+        """Returns all live places, base rows first."""
+        return self._materialize(self.base_live.to_int(), self.delta_live.to_int())
+
+    def _materialize(self, base_bits: int, delta_bits: int) -> list[dict]:
+        delta = self._log.places
+        return self.base.rows(bitset.iter_indices(base_bits)) + [delta[pos] for pos in bitset.iter_indices(delta_bits)]
+
+    @instrumented
+    def apply_filters(self, active_filters: set[str]) -> list[dict]:
+        """apply_filters over the snapshot."""
+        if not active_filters:
+            filtered_places = self.places()
+            count_rows("PlaceSnapshot.apply_filters", len(filtered_places), len(filtered_places))
+            return filtered_places
+        index = self.base.index(BitmapIndex)
+        base_bits = index.match(active_filters) & self.base_live.to_int()
+        delta_bits = self.delta_live.to_int()
+        for f_id in active_filters:
+            delta_bits &= self._delta_bits(self._log.flags.get(f_id))
+        filtered_places = self._materialize(base_bits, delta_bits)
+        count_rows("PlaceSnapshot.apply_filters", index.entries(active_filters) + self.delta_size, len(filtered_places))
+        return filtered_places
+
+    @instrumented
+    def activity_search(self, activity: str) -> list[dict]:
+        """activity_search over the snapshot."""
+        if not activity:
+            found_places = self.places()
+            count_rows("PlaceSnapshot.activity_search", len(found_places), len(found_places))
+            return found_places
+        index = self.base.index(ActivityIndex)
+        base_bits = index.bitmap(activity) & self.base_live.to_int()
+        delta_bits = self._delta_bits(self._log.activities.get(normalize_activity(activity)))
+        found_places = self._materialize(base_bits, delta_bits)
+        count_rows("PlaceSnapshot.activity_search", index.entries([activity]) + self.delta_size, len(found_places))
+        return found_places
+
+    @instrumented
+    def find_places_in_map_area(self, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> list[dict]:
+        """find_places_in_map_area over the snapshot; the delta is small enough to scan."""
+        base_live = self.base_live
+        rows, scanned = self.base.index(SpatialIndex).scan(north_east_corner, south_west_corner)
+        rows = [row for row in rows if base_live[row]]
+        log = self._log
+        lats, lons = log.latitudes, log.longitudes
+        visible_places = self.base.rows(rows) + [
+            log.places[pos] for pos in bitset.iter_indices(self.delta_live.to_int())
+            if in_viewport(lats[pos], lons[pos], north_east_corner, south_west_corner)
+        ]
+        count_rows("PlaceSnapshot.find_places_in_map_area", scanned + self.delta_size, len(visible_places))
+        return visible_places
+
+    def get_place_coordinates(self, place_name: str) -> tuple[float, float] | None:
+        """get_place_coordinates over the snapshot: the first live place with that exact name."""
+        name_index = self.base.index(NameIndex)
+        base_live = self.base_live
+        row = name_index.lookup(place_name)
+        if row is not None and not base_live[row]:
+            # The first match was deleted; look for a later live base row with the same name.
+            row = next((r for r in name_index.lookup_normalized(place_name)
+                        if base_live[r] and self.base.value(r, NAME_KEY) == place_name), None)
+        if row is not None:
+            return name_index.coordinates(row)
+        for pos in self._delta_positions(self._log.names.get(place_name)):
+            if self.delta_live[pos]:
+                place = self._log.places[pos]
+                return place.get(LATITUDE_KEY), place.get(LONGITUDE_KEY)
+        return None
+
+def _build_base(places: list[dict]) -> PlaceStore:
+    """Builds a base PlaceStore with its indexes ready."""
+    base = PlaceStore.from_dicts(places)
+    for index_cls in _BASE_INDEXES:
+        base.index(index_cls)
+    return base
+
+def _compacted_base(snapshot: PlaceSnapshot) -> tuple[PlaceStore, array]:
+    """Builds a new base holding a snapshot's live places, with its indexes ready."""
+    return _build_base(snapshot.places()), array("q", snapshot.keys())
+
+class LivePlaceStore:
+    """
+    Places that are edited while being queried.
+
+    Writers call insert/update/delete. Each write is serialized by a lock
+    and builds a new PlaceSnapshot from the current one, then publishes it
+    with a single reference assignment. Readers call snapshot() and query
+    the returned snapshot without locking; it never changes under them.
+
+    Compaction folds the delta into a new base PlaceStore. It builds the
+    base from a snapshot outside the write lock, then replays the writes
+    that arrived meanwhile onto it before swapping it in. It runs on demand
+    with compact(), or periodically on a background thread started with
+    start_compaction(), which is also woken when the delta grows past
+    compaction_threshold.
+    """
+
+    def __init__(self, places=(), compaction_threshold: int = DEFAULT_COMPACTION_THRESHOLD):
+        self.compaction_threshold = compaction_threshold
+        self._next_key = itertools.count()
+        places = [dict(place) for place in places]
+        keys = array("q", (next(self._next_key) for _ in places))
+        self._snapshot = PlaceSnapshot.from_base(0, _build_base(places), keys)
+        self._write_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._replay_log: list[tuple[int, dict | None]] | None = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._compactor: threading.Thread | None = None
+        self.compactions = 0
+
+    def snapshot(self) -> PlaceSnapshot:
+        """Returns the current snapshot."""
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    def insert(self, place: dict) -> int:
+        """Adds a place and returns its key."""
+        with self._write_lock:
+            key = next(self._next_key)
+            self._write(key, dict(place))
+        return key
+
+    def update(self, key: int, place: dict) -> None:
+        """
+        Replaces the place stored under key.
+
+        Raises:
+            KeyError: If there is no place with that key.
+        """
+        with self._write_lock:
+            if self._snapshot.get(key) is None:
+                raise KeyError(key)
+            self._write(key, dict(place))
+
+    def delete(self, key: int) -> None:
+        """
+        Removes the place stored under key.
+
+        Raises:
+            KeyError: If there is no place with that key.
+        """
+        with self._write_lock:
+            if self._snapshot.get(key) is None:
+                raise KeyError(key)
+            self._write(key, None)
+
+    def _write(self, key: int, place: dict | None) -> None:
+        snapshot = self._snapshot
+        self._snapshot = snapshot.with_place(key, place, snapshot.version + 1)
+        if self._replay_log is not None:
+            self._replay_log.append((key, place))
+        if self._snapshot.delta_size >= self.compaction_threshold:
+            self._wake.set()
+
+    def compact(self) -> None:
+        """Folds the delta into a new base, without blocking readers and blocking writers only briefly."""
+        with self._compaction_lock:
+            with self._write_lock:
+                snapshot = self._snapshot
+                if not snapshot.delta_size and snapshot.base_live.count() == len(snapshot.base):
+                    return
+                self._replay_log = []
+            base, keys = _compacted_base(snapshot)
+            with self._write_lock:
+                compacted = PlaceSnapshot.from_base(self._snapshot.version + 1, base, keys)
+                for key, place in self._replay_log:
+                    compacted = compacted.with_place(key, place, compacted.version)
+                self._replay_log = None
+                self._snapshot = compacted
+            self.compactions += 1
+
+    def start_compaction(self, interval: float = DEFAULT_COMPACTION_INTERVAL) -> None:
+        """Starts compacting on a daemon thread every interval seconds, or sooner when the delta is large."""
+        if self._compactor is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(interval)
+                self._wake.clear()
+                if not self._stop.is_set():
+                    self.compact()
+
+        self._compactor = threading.Thread(target=run, name="place-compactor", daemon=True)
+        self._compactor.start()
+
+    def stop_compaction(self) -> None:
+        """Stops the background compaction thread and waits for it to finish."""
+        if self._compactor is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._compactor.join()
+        self._compactor = None
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from urllib.parse import urlsplit
+
+from .instrumentation import percentile
+from .server import DEFAULT_HOST, DEFAULT_PORT
+
+# Requests cycled through when none are given: a mix of the API's endpoints over the sample places.
+DEFAULT_PATHS = [
+    "/api/search?q=park",
+    "/api/filters",
+    "/api/places?filters=pet_friendly",
+    "/api/activities?activity=hiking",
+    "/api/map/viewport?ne=34.10,-118.20&sw=34.00,-118.30",
+    "/api/map/clusters?zoom=10&ne=34.2,-118.1&sw=33.9,-118.5",
+    "/api/coordinates?name=City%20Museum",
+]
+
+class Connection:
+    """One keep-alive HTTP/1.1 client connection, enough to drive QueryService."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, path: str, headers: dict | None = None) -> tuple[int, dict, bytes]:
+        """Sends a GET request and returns (status, headers, body), reconnecting if the server closed the connection."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"GET {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+        status = int(status_line.split(" ")[1])
+        response_headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if response_headers.get("transfer-encoding") == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+            body = bytes(body)
+        else:
+            body = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        if response_headers.get("connection") == "close":
+            await self.close()
+        return status, response_headers, body
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+async def fetch(host: str, port: int, path: str, headers: dict | None = None) -> tuple[int, dict, bytes]:
+    """Sends one GET request on a new connection."""
+    connection = Connection(host, port)
+    try:
+        return await connection.request(path, headers)
+    finally:
+        await connection.close()
+
+async def run_load(host: str, port: int, paths=None, concurrency: int = 16, requests: int = 1000) -> dict:
+    """
+    Sends requests from concurrency keep-alive connections as fast as the server answers.
+
+    Args:
+        host, port: Where the server listens.
+        paths: Request paths, cycled through in order; defaults to DEFAULT_PATHS.
+        concurrency: The number of connections, each with one request outstanding.
+        requests: The total number of requests.
+
+    Returns:
+        A summary with the requests per second, latency percentiles in milliseconds
+        and the count of responses by status code.
+    """
+    paths = itertools.cycle(paths or DEFAULT_PATHS)
+    remaining = requests
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+
+    async def client():
+        nonlocal remaining
+        connection = Connection(host, port)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                path = next(paths)
+                started = time.perf_counter()
+                status, _, _ = await connection.request(path)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.loadgen", description="Measure the API's throughput and tail latency.")
+    parser.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", help="server address")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--path", action="append", dest="paths", help="request path to send (repeatable)")
+    args = parser.parse_args(argv)
+    url = urlsplit(args.url)
+    summary = asyncio.run(run_load(url.hostname, url.port or 80, args.paths, args.concurrency, args.requests))
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
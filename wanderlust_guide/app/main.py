@@ -1,3 +1,4 @@
+from .sample_data import SAMPLE_PLACES
 from .search import voice_search, text_search
 
 def main():
@@ -23,18 +24,8 @@ def main():
 
     # Simulate applying detailed filters
     print("\\nSimulating detailed filters:")
-    # Let's assume text_search now returns places with filterable attributes
-    # For demonstration, we'll create a sample list of places
-    # Adding 'activities', 'latitude', and 'longitude' to sample_places
-    sample_places = [
-        {"name": "Adventure Park", "description": "Fun for all ages", "suitable_for_kids": True, "parking_available": True, "pet_friendly": False, "activities": ["hiking", "zip-lining", "rock climbing"], "latitude": 34.0522, "longitude": -118.2437},
-        {"name": "Quiet Cafe", "description": "Relax and unwind", "wifi_available": True, "pet_friendly": True, "suitable_for_kids": False, "activities": ["reading", "board games"], "latitude": 34.0550, "longitude": -118.2500},
-        {"name": "City Museum", "description": "Historical artifacts", "wheelchair_accessible": True, "parking_available": True, "activities": ["guided tours", "exhibits"], "latitude": 34.0500, "longitude": -118.2400},
-        {"name": "Dog Haven", "description": "A park for dogs and their owners", "pet_friendly": True, "parking_available": True, "suitable_for_kids": True, "activities": ["dog walking", "fetch"], "latitude": 34.0600, "longitude": -118.2600},
-        {"name": "Tech Hub Cafe", "description": "Work and coffee", "wifi_available": True, "wheelchair_accessible": True, "pet_friendly": False, "activities": ["coding", "meetings"], "latitude": 34.0480, "longitude": -118.2450},
-        {"name": "Mountain Trails", "description": "Scenic hiking paths", "activities": ["hiking", "bird watching", "cycling"], "parking_available": True, "latitude": 34.1500, "longitude": -118.3000},
-        {"name": "Beach Resort", "description": "Sun and Sand", "activities": ["diving", "swimming", "surfing"], "wifi_available": True, "suitable_for_kids": True, "latitude": 33.9500, "longitude": -118.4000}
-    ]
+    # text_search returns places with filterable attributes from the same demo dataset
+    sample_places = SAMPLE_PLACES
 
     from .filters import apply_filters, get_available_filters
 
@@ -69,8 +60,14 @@ def main():
 
     # User wants to find places for "diving" using the results from "pet_friendly" and "parking_available"
     activity_to_find_in_filtered = "diving"
-    # Apply activity search on the previously filtered results
-    activity_in_filtered_results = activity_search(filtered_results, activity_to_find_in_filtered)
+    # Combine the filters and the activity in one planned query: the most selective
+    # index drives and only the final results are materialized.
+    from .place_store import PlaceStore
+    from .planner import query
+
+    place_store = PlaceStore.from_dicts(sample_places)
+    activity_in_filtered_results = query(filters=selected_filter_ids, activities=[activity_to_find_in_filtered],
+                                         limit=None, places=place_store)
     if activity_in_filtered_results:
         print(f"\\nPlaces from previous filter (pet_friendly, parking_available) that also offer '{activity_to_find_in_filtered}':")
         for place in activity_in_filtered_results:
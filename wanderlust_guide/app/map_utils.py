@@ -1,48 +1,124 @@
-def find_places_in_map_area(places: list[dict], north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> list[dict]:
+import math
+
+from . import bitset, vectorized
+from .activity_index import ActivityIndex, normalize_activity
+from .bitmap_index import BitmapIndex
+from .clustering import ClusterIndex
+from .geo import in_viewport
+from .instrumentation import count_rows, instrumented
+from .name_index import NameIndex
+from .place_store import PlaceStore, take
+from .spatial_index import SpatialIndex, coordinate_columns, scan_nearest
+
+# When filters leave at most this many candidate places, their distances are
+# computed directly instead of traversing the spatial index.
+NEAREST_SCAN_THRESHOLD = 1024
+
+# Above this zoom level get_map_clusters returns the individual places in view instead of clusters.
+PLACES_ZOOM = 15
+
+@instrumented
+def find_places_in_map_area(places: list[dict] | PlaceStore | SpatialIndex, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float],
+                            backend: str | None = None) -> list[dict]:
     """
     Simulates finding places within a given map bounding box.
     Each place dictionary must have 'latitude' and 'longitude' keys.
 
     Args:
-        places: A list of place dictionaries.
+        places: A list of place dictionaries, a PlaceStore, or a SpatialIndex.
+                Stores are queried through their cached SpatialIndex.
         north_east_corner: A tuple (latitude, longitude) for the NE corner of the map view.
         south_west_corner: A tuple (latitude, longitude) for the SW corner of the map view.
+                A south-west longitude greater than the north-east one means the view
+                crosses the antimeridian.
+        backend: "python" or "numpy" for list input, or None for vectorized.get_backend().
 
     Returns:
         A list of places within the bounding box.
     """
-    ne_lat, ne_lon = north_east_corner
-    sw_lat, sw_lon = south_west_corner
+    if isinstance(places, PlaceStore):
+        places = places.index(SpatialIndex)
+    if isinstance(places, SpatialIndex):
+        rows, scanned = places.scan(north_east_corner, south_west_corner)
+        visible_places = places.rows(rows)
+        count_rows("find_places_in_map_area", scanned, len(visible_places))
+        return visible_places
+    if vectorized.use_numpy(backend):
+        lats = vectorized.float_column(places, "latitude")
+        lons = vectorized.float_column(places, "longitude")
+        rows = vectorized.viewport_rows(lats, lons, north_east_corner, south_west_corner)
+        visible_places = [places[i] for i in rows]
+        count_rows("find_places_in_map_area", len(places), len(visible_places))
+        return visible_places
 
     visible_places = []
     for place in places:
         lat = place.get("latitude")
         lon = place.get("longitude")
         if lat is not None and lon is not None:
-            if sw_lat <= lat <= ne_lat and sw_lon <= lon <= ne_lon:
+            if in_viewport(lat, lon, north_east_corner, south_west_corner):
                 visible_places.append(place)
 
-    print(f"Map area search: Found {len(visible_places)} places in the defined bounding box.")
+    count_rows("find_places_in_map_area", len(places), len(visible_places))
     return visible_places
 
-def get_map_clusters(places: list[dict], zoom_level: int) -> dict:
+@instrumented
+def get_map_clusters(places: list[dict] | PlaceStore | ClusterIndex, zoom_level: int,
+                     north_east_corner: tuple[float, float] | None = None,
+                     south_west_corner: tuple[float, float] | None = None,
+                     backend: str | None = None, summary_only: bool = False) -> dict:
     """
     Simulates generating map clusters based on place density and zoom level.
     In a real implementation, this would involve a clustering algorithm (e.g., k-means, DBSCAN for geo-data, or server-side clustering).
 
     Args:
-        places: A list of place dictionaries with 'latitude' and 'longitude'.
+        places: A list of place dictionaries with 'latitude' and 'longitude', a PlaceStore,
+                or a ClusterIndex. Stores are served from their cached ClusterIndex, which
+                precomputes real grid clusters for every zoom level.
         zoom_level: An integer representing the map's zoom level (higher means more zoomed in).
+        north_east_corner: Optional (latitude, longitude) of the map view's NE corner.
+        south_west_corner: Optional (latitude, longitude) of the map view's SW corner. Only
+                places (or clusters) inside the view are returned when both corners are given.
+        backend: "python" or "numpy" for list input, or None for vectorized.get_backend().
+        summary_only: Return only counts, as {"type": "summary", "data": {...}}, never
+                places or member lists. "data" holds {"places": n} when only
+                individual places are in view, else the quadrant counts, or the
+                counts per "cluster:<id>" / "place:<row>" key for a ClusterIndex.
 
     Returns:
-        A dictionary representing clustered data. For simulation, this might just
-        group places by a coarse grid or return them if zoom is high.
+        Above PLACES_ZOOM, {"type": "places", "data": [...]} with the places in view.
+        Otherwise {"type": "clusters", "data": {key: count}, "details": {...}}. For list
+        input the keys are the quadrants "NW", "NE", "SW" and "SE" and "details" maps
+        each to its member places. For a PlaceStore or ClusterIndex the keys are
+        "cluster:<id>" or "place:<row>" and "details" maps each to a feature dictionary
+        (centroid latitude/longitude, count, and cluster_id with expansion_zoom or
+        row), not to member places, which would cost time proportional to the places
+        clustered; when nothing in view is clustered the response is "places" too.
     """
+    if isinstance(places, PlaceStore):
+        places = places.index(ClusterIndex)
+    if isinstance(places, ClusterIndex):
+        return _get_map_clusters_index(places, zoom_level, north_east_corner, south_west_corner, summary_only)
+    scanned = len(places)
+    if north_east_corner is not None and south_west_corner is not None:
+        places = [
+            place for place in places
+            if place.get("latitude") is not None and place.get("longitude") is not None
+            and in_viewport(place["latitude"], place["longitude"], north_east_corner, south_west_corner)
+        ]
+
     # This is a highly simplified simulation.
     # Real clustering is complex.
-    if zoom_level > 15: # Arbitrary zoom level threshold for showing individual places
-        print(f"Zoom level {zoom_level}: High enough to show individual places. Returning {len(places)} places.")
+    if zoom_level > PLACES_ZOOM: # Zoomed in far enough to show individual places
+        count_rows("get_map_clusters", scanned, len(places))
+        if summary_only:
+            return {"type": "summary", "data": {"places": len(places)}}
         return {"type": "places", "data": places}
+    elif vectorized.use_numpy(backend):
+        quadrant_rows = vectorized.quadrant_rows(
+            vectorized.float_column(places, "latitude"), vectorized.float_column(places, "longitude"),
+        )
+        quadrants = {q_name: [places[i] for i in rows] for q_name, rows in quadrant_rows.items()}
     else:
         # Simulate some basic clustering by grouping into quadrants for simplicity
         quadrants = {
@@ -66,15 +142,164 @@ def get_map_clusters(places: list[dict], zoom_level: int) -> dict:
                 else: # lat < avg_lat and lon >= avg_lon
                     quadrants["SE"].append(place)
 
-        cluster_summary = {
-            q_name: len(q_places) for q_name, q_places in quadrants.items() if q_places
-        }
-        print(f"Zoom level {zoom_level}: Simulated clustering. Summary: {cluster_summary}")
-        return {"type": "clusters", "data": cluster_summary, "details": quadrants}
+    cluster_summary = {
+        q_name: len(q_places) for q_name, q_places in quadrants.items() if q_places
+    }
+    count_rows("get_map_clusters", scanned, len(places))
+    if summary_only:
+        return {"type": "summary", "data": cluster_summary}
+    return {"type": "clusters", "data": cluster_summary, "details": quadrants}
+
+def _get_map_clusters_index(index: ClusterIndex, zoom_level: int,
+                            north_east_corner: tuple[float, float] | None,
+                            south_west_corner: tuple[float, float] | None, summary_only: bool = False) -> dict:
+    """
+    get_map_clusters from a precomputed ClusterIndex.
 
-def get_place_coordinates(place_name: str, places_data: list[dict]) -> tuple[float, float] | None:
+    When nothing in view is clustered, as always above PLACES_ZOOM, the response is
+    {"type": "places", ...} with the place dictionaries. Otherwise "data" maps
+    "cluster:<id>" / "place:<row>" keys to counts and "details" holds each item's
+    centroid, count and expansion zoom instead of member lists.
+    """
+    zoom_level = _cluster_zoom(index, zoom_level)
+    if north_east_corner is None or south_west_corner is None:
+        items, scanned = index.scan(zoom_level)
+    else:
+        items, scanned = index.scan(zoom_level, north_east_corner, south_west_corner)
+    features = index.features(zoom_level, items)
+    count_rows("get_map_clusters", scanned, len(features))
+    return _clusters_response(index.places, features, summary_only)
+
+def _cluster_zoom(index: ClusterIndex, zoom_level: int) -> int:
+    """The ClusterIndex level answering zoom_level: above PLACES_ZOOM, the level of unclustered places."""
+    return zoom_level if zoom_level <= PLACES_ZOOM else index.max_zoom + 1
+
+def _clusters_response(places: list[dict] | PlaceStore, features: list[dict], summary_only: bool = False) -> dict:
+    """Shapes ClusterIndex features over places as a get_map_clusters response."""
+    unclustered = all(feature["count"] == 1 for feature in features)
+    if summary_only:
+        if unclustered:
+            return {"type": "summary", "data": {"places": len(features)}}
+        cluster_summary = {_feature_key(feature): feature["count"] for feature in features}
+        return {"type": "summary", "data": cluster_summary}
+    if unclustered:
+        places = take(places, [feature["row"] for feature in features])
+        return {"type": "places", "data": places}
+
+    cluster_summary = {}
+    details = {}
+    for feature in features:
+        key = _feature_key(feature)
+        cluster_summary[key] = feature["count"]
+        details[key] = feature
+    return {"type": "clusters", "data": cluster_summary, "details": details}
+
+def _feature_key(feature: dict) -> str:
+    return f"cluster:{feature['cluster_id']}" if "cluster_id" in feature else f"place:{feature['row']}"
+
+def get_place_coordinates(place_name: str, places_data: list[dict] | PlaceStore | NameIndex) -> tuple[float, float] | None:
     """Retrieves coordinates for a given place name."""
+    if isinstance(places_data, PlaceStore):
+        places_data = places_data.index(NameIndex)
+    if isinstance(places_data, NameIndex):
+        # Exact-name hash lookup instead of a scan
+        row = places_data.lookup(place_name)
+        return None if row is None else places_data.coordinates(row)
     for place in places_data:
         if place.get("name") == place_name:
             return place.get("latitude"), place.get("longitude")
     return None
+
+@instrumented
+def nearest_places(places: list[dict] | PlaceStore | SpatialIndex, latitude: float, longitude: float, k: int,
+                   filters: set[str] | None = None, activities: list[str] | None = None,
+                   backend: str | None = None) -> list[dict]:
+    """
+    Finds the k places closest to a point, e.g. for "restaurants near me".
+
+    Args:
+        places: A list of place dictionaries, a PlaceStore, or a SpatialIndex.
+                Stores are searched through their cached SpatialIndex with a
+                best-first nearest-neighbour traversal; lists are scanned.
+        latitude: Latitude of the point to search around.
+        longitude: Longitude of the point to search around.
+        k: The maximum number of places to return.
+        filters: Optional filter IDs (as in apply_filters) every place must match.
+        activities: Optional activities (as in activity_search) every place must offer.
+        backend: "python" or "numpy" for distance scans, or None for vectorized.get_backend().
+
+    Returns:
+        Up to k places ordered by great-circle distance, nearest first. Filters and
+        activities are checked while the index is traversed, so the search stops as soon
+        as k matching places are found. Places without coordinates never match.
+    """
+    source, found = _nearest(places, latitude, longitude, k, math.inf, filters, activities, backend)
+    nearby_places = take(source, [row for row, _ in found])
+    return nearby_places
+
+@instrumented
+def places_within_radius(places: list[dict] | PlaceStore | SpatialIndex, latitude: float, longitude: float, meters: float,
+                         filters: set[str] | None = None, activities: list[str] | None = None,
+                         backend: str | None = None) -> list[dict]:
+    """
+    Finds every place within a great-circle distance of a point, nearest first.
+
+    Args:
+        places: A list of place dictionaries, a PlaceStore, or a SpatialIndex, as for nearest_places.
+        latitude: Latitude of the point to search around.
+        longitude: Longitude of the point to search around.
+        meters: The search radius in meters; places exactly on the circle are included.
+        filters: Optional filter IDs every place must match.
+        activities: Optional activities every place must offer.
+        backend: "python" or "numpy" for distance scans, or None for vectorized.get_backend().
+
+    Returns:
+        The places within the radius ordered by distance.
+    """
+    source, found = _nearest(places, latitude, longitude, None, meters, filters, activities, backend)
+    nearby_places = take(source, [row for row, _ in found])
+    return nearby_places
+
+def _nearest(places, latitude, longitude, k, max_distance, filters, activities, backend):
+    """Returns (places, [(row, meters), ...]) for nearest_places and places_within_radius."""
+    if isinstance(places, PlaceStore):
+        places = places.index(SpatialIndex)
+    if not isinstance(places, SpatialIndex):
+        rows = [row for row, place in enumerate(places) if _place_matches(place, filters, activities)]
+        lats, lons = coordinate_columns(places)
+        return places, scan_nearest(lats, lons, latitude, longitude, rows, k, max_distance, backend)
+
+    index = places
+    if k is not None and k <= 0:
+        return index.places, []
+    if not filters and not activities:
+        return index.places, index.nearest(latitude, longitude, k, max_distance)
+    if not isinstance(index.places, PlaceStore):
+        source = index.places
+        accept = lambda row: _place_matches(source[row], filters, activities)
+        return source, index.nearest(latitude, longitude, k, max_distance, accept)
+
+    # Filters and activities combine into one bitset of candidate rows. Few candidates
+    # are measured directly; otherwise the index is traversed and each row is tested
+    # against the bitset on its way into the queue.
+    store = index.places
+    candidates = store.index(BitmapIndex).match(filters) if filters else bitset.full(len(store))
+    if activities:
+        activity_index = store.index(ActivityIndex)
+        for activity in activities:
+            candidates &= activity_index.bitmap(activity)
+    if bitset.count(candidates) <= NEAREST_SCAN_THRESHOLD:
+        lats, lons = index.coordinate_columns()
+        rows = bitset.iter_indices(candidates)
+        return store, scan_nearest(lats, lons, latitude, longitude, rows, k, max_distance, backend)
+    members = bitset.BitArray.from_int(candidates)
+    return store, index.nearest(latitude, longitude, k, max_distance, members.__getitem__)
+
+def _place_matches(place: dict, filters, activities) -> bool:
+    """Tests one place dictionary against filter IDs and required activities."""
+    if filters and not all(place.get(f_id, False) for f_id in filters):
+        return False
+    if activities:
+        offered = {normalize_activity(a) for a in place.get("activities", [])}
+        return all(normalize_activity(a) in offered for a in activities)
+    return True
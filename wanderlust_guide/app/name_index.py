@@ -0,0 +1,248 @@
+import heapq
+import math
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from .geo import box_distance_m, haversine_m
+from .place_store import PlaceStore, take
+from .spatial_index import STRTree
+
+POPULARITY_KEY = "popularity"
+# Every prefix matching more names than this has its top suggestions precomputed.
+PRECOMPUTED_SUGGESTIONS = 10
+# Names per cell of the tree that ranks suggestions by distance.
+NAME_CELL_SIZE = 16
+# Prefixes matching at most this many names rank them all by distance instead of searching the tree.
+NEAR_SCAN_THRESHOLD = 256
+
+_PREFIX_END = "\U0010ffff"
+
+def normalize_name(name: str) -> str:
+    """
+    Folds a name for case- and accent-insensitive matching.
+
+    "Café" and "CAFE" both become "cafe". Only Latin combining accents are
+    dropped, so Thai vowel and tone marks are preserved.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return "".join(ch for ch in decomposed if not "\u0300" <= ch <= "\u036f")
+
+class NameIndex:
+    """
+    Exact name lookup plus prefix autocomplete over place names.
+
+    Exact lookups are one dict access. For autocomplete, normalized names are
+    kept in one sorted list, so every prefix matches a contiguous range of
+    positions found by binary search. The ranges of all prefixes are the
+    intervals of a trie over the names, and every range wider than
+    PRECOMPUTED_SUGGESTIONS has its top suggestions by popularity
+    precomputed, so ranking by popularity costs O(prefix length + limit)
+    however many names match; narrower ranges are ranked directly.
+
+    Ranking by distance uses an STRTree of the named places' coordinates,
+    in cells of NAME_CELL_SIZE, where each node also keeps the name
+    positions it covers in sorted order. A best-first search from the query
+    point binary-searches each node for the prefix range, so it skips nodes
+    without matches and stops once no unexplored node can hold a nearer one.
+    Prefixes matching at most NEAR_SCAN_THRESHOLD names are ranked directly.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore, popularity_key: str = POPULARITY_KEY):
+        self.places = places
+        self.size = len(places)
+        self.popularity_key = popularity_key
+        self.exact: dict[str, int] = {}
+        self.keys: list[str] = []
+        self.key_rows = array("I")
+        self.popularity = array("d")
+        # (first, end) position range -> its top positions by popularity, for ranges wider than PRECOMPUTED_SUGGESTIONS.
+        self.top_by_range: dict[tuple[int, int], array] = {}
+        self.tree: STRTree | None = None # Over name positions; its sorted_levels() are searched for prefix ranges
+        self.unlocated = array("I") # Positions of names without coordinates
+        self._build()
+
+    @classmethod
+    def from_places(cls, places: list[dict] | PlaceStore, popularity_key: str = POPULARITY_KEY) -> "NameIndex":
+        """Builds the index over a list of place dictionaries or a PlaceStore."""
+        return cls(places, popularity_key)
+
+    def _value(self, row: int, key: str):
+        if isinstance(self.places, PlaceStore):
+            return self.places.value(row, key)
+        return self.places[row].get(key)
+
+    def _build(self) -> None:
+        entries = []
+        for row in range(self.size):
+            name = self._value(row, "name")
+            self.popularity.append(float(self._value(row, self.popularity_key) or 0))
+            if name is None:
+                continue
+            self.exact.setdefault(name, row) # First match wins, as in a linear scan
+            entries.append((normalize_name(name), row))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.key_rows = array("I", (row for _, row in entries))
+        if self.keys:
+            self._build_top()
+            self._build_cells()
+
+    def _build_top(self) -> None:
+        """
+        Precomputes top suggestions for every prefix range wider than PRECOMPUTED_SUGGESTIONS.
+
+        The ranges are the lcp-intervals of the sorted names (the positions
+        sharing a longest common prefix), enumerated bottom-up with a stack
+        in one pass. Each interval's top list is merged from its children's,
+        so the work is O(names * PRECOMPUTED_SUGGESTIONS).
+        """
+        keys, limit = self.keys, PRECOMPUTED_SUGGESTIONS
+        n = len(keys)
+        # Positions ranked best first; ranks compare as plain ints while merging.
+        order = self._top_positions(range(n), n)
+        rank = array("I", bytes(4 * n))
+        for r, pos in enumerate(order):
+            rank[pos] = r
+
+        def finish(first: int, end: int, ranks: list[int]) -> list[int]:
+            top = heapq.nsmallest(limit, ranks)
+            if end - first > limit:
+                self.top_by_range[(first, end)] = array("I", (order[r] for r in top))
+            return top
+
+        stack = [(0, 0, [])] # (common prefix length, first position, candidate ranks)
+        for end in range(1, n + 1):
+            height = _common_prefix_length(keys[end - 1], keys[end]) if end < n else 0
+            first, done = end - 1, [rank[end - 1]]
+            while height < stack[-1][0]:
+                _, first, ranks = stack.pop()
+                ranks.extend(done)
+                done = finish(first, end, ranks)
+            if height > stack[-1][0]:
+                stack.append((height, first, done))
+            else:
+                stack[-1][2].extend(done)
+        finish(0, n, stack[0][2])
+
+    def _build_cells(self) -> None:
+        lats, lons = array("d"), array("d")
+        for row in self.key_rows:
+            lat, lon = self.coordinates(row)
+            missing = lat is None or lon is None
+            lats.append(math.nan if missing else lat)
+            lons.append(math.nan if missing else lon)
+        self.tree = STRTree(lons, lats, NAME_CELL_SIZE)
+        self.tree.sorted_levels()
+        self.unlocated = array("I", (pos for pos, lat in enumerate(lats) if lat != lat or lons[pos] != lons[pos]))
+
+    def _top_positions(self, positions, limit: int) -> list[int]:
+        """The limit most popular positions; ties go to the alphabetically first name."""
+        popularity, key_rows = self.popularity, self.key_rows
+        return heapq.nsmallest(limit, positions, key=lambda pos: (-popularity[key_rows[pos]], pos))
+
+    def lookup(self, name: str) -> int | None:
+        """Returns the first row whose name is exactly name, or None."""
+        return self.exact.get(name)
+
+    def lookup_normalized(self, name: str) -> list[int]:
+        """Returns every row whose name matches name ignoring case and accents."""
+        key = normalize_name(name)
+        lo = bisect_left(self.keys, key)
+        hi = bisect_left(self.keys, key + "\0", lo)
+        return sorted(self.key_rows[lo:hi])
+
+    def complete(self, prefix: str, limit: int = PRECOMPUTED_SUGGESTIONS, near: tuple[float, float] | None = None) -> list[int]:
+        """
+        Returns rows whose name starts with prefix, best first.
+
+        Args:
+            prefix: What the user has typed so far; case and accents are ignored.
+            limit: The maximum number of suggestions.
+            near: Optional (latitude, longitude). When given, suggestions are ranked by
+                  distance from it (places without coordinates last) instead of popularity.
+
+        Returns:
+            Up to limit row ids.
+        """
+        if limit <= 0:
+            return []
+        key = normalize_name(prefix)
+        lo = bisect_left(self.keys, key)
+        hi = bisect_left(self.keys, key + _PREFIX_END, lo)
+        if lo == hi:
+            return []
+        if near is not None:
+            positions = self._nearest_positions(lo, hi, limit, near)
+        elif limit <= PRECOMPUTED_SUGGESTIONS:
+            # Ranges missing from top_by_range hold at most PRECOMPUTED_SUGGESTIONS names.
+            positions = self.top_by_range.get((lo, hi)) or self._top_positions(range(lo, hi), limit)
+        else:
+            positions = self._top_positions(range(lo, hi), limit) # Longer lists than precomputed cost O(range)
+        return [self.key_rows[pos] for pos in positions[:limit]]
+
+    def _nearest_positions(self, lo: int, hi: int, limit: int, near: tuple[float, float]) -> list[int]:
+        """The limit positions in [lo, hi) nearest to near, ties and places without coordinates last by position."""
+        lat, lon = near
+        tree = self.tree
+        cells, xs, ys = tree.sorted_levels(), tree.xs, tree.ys
+        if hi - lo <= NEAR_SCAN_THRESHOLD:
+            def distance(pos):
+                return (haversine_m(lat, lon, ys[pos], xs[pos]) if ys[pos] == ys[pos] else math.inf, pos)
+
+            return heapq.nsmallest(limit, range(lo, hi), key=distance)
+        best = [] # Max-heap of (-meters, -position) holding the nearest found so far
+        # Queued nodes are (box distance, node, level, first, last), with first:last
+        # the node's slice of tree.sorted_levels()[level] inside [lo, hi); nodes without
+        # matches are never queued.
+        queue = []
+        for node in range(len(tree.levels[-1][0]) if tree.levels else 0):
+            self._queue_node(queue, lat, lon, node, len(tree.levels) - 1, lo, hi)
+        while queue:
+            bound, node, level, first, last = heapq.heappop(queue)
+            if len(best) == limit and bound > -best[0][0]:
+                break
+            if not level or last - first <= NAME_CELL_SIZE:
+                for pos in cells[level][first:last]:
+                    item = (-haversine_m(lat, lon, ys[pos], xs[pos]), -pos)
+                    if len(best) < limit:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+            else:
+                for child in range(node * NAME_CELL_SIZE, min((node + 1) * NAME_CELL_SIZE, len(tree.levels[level - 1][0]))):
+                    self._queue_node(queue, lat, lon, child, level - 1, lo, hi)
+        found = [-pos for _, pos in sorted(best, reverse=True)]
+        if len(found) < limit:
+            first = bisect_left(self.unlocated, lo)
+            found.extend(self.unlocated[first:bisect_left(self.unlocated, hi, first)][:limit - len(found)])
+        return found
+
+    def _queue_node(self, queue: list, lat: float, lon: float, node: int, level: int, lo: int, hi: int) -> None:
+        positions = self.tree.sorted_levels()[level]
+        start = node * NAME_CELL_SIZE ** (level + 1)
+        end = min(len(positions), start + NAME_CELL_SIZE ** (level + 1))
+        first = bisect_left(positions, lo, start, end)
+        last = bisect_left(positions, hi, first, end)
+        if first < last:
+            min_lon, min_lat, max_lon, max_lat = (column[node] for column in self.tree.levels[level])
+            heapq.heappush(queue, (box_distance_m(lat, lon, min_lon, min_lat, max_lon, max_lat), node, level, first, last))
+
+    def coordinates(self, row: int) -> tuple[float | None, float | None]:
+        """Returns (latitude, longitude) of row, with None for missing values."""
+        return self._value(row, "latitude"), self._value(row, "longitude")
+
+    def rows(self, row_ids) -> list[dict]:
+        """Materializes row_ids as place dictionaries."""
+        return take(self.places, row_ids)
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """The length of the longest common prefix of a and b."""
+    if a == b:
+        return len(a)
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
@@ -0,0 +1,362 @@
+import itertools
+import json
+import math
+from array import array
+
+from . import bitset
+from .instrumentation import count_lookup
+
+# Keys with a dedicated column. Anything else that is always a bool becomes a
+# packed bit column; all remaining keys are kept in a sparse per-row dict.
+NAME_KEY = "name"
+DESCRIPTION_KEY = "description"
+ACTIVITIES_KEY = "activities"
+LATITUDE_KEY = "latitude"
+LONGITUDE_KEY = "longitude"
+_FIXED_KEYS = {NAME_KEY, DESCRIPTION_KEY, ACTIVITIES_KEY, LATITUDE_KEY, LONGITUDE_KEY}
+
+_MISSING = float("nan")
+
+class StringColumn:
+    """
+    Offset-encoded string column.
+
+    All values are stored back to back as UTF-8 in one bytearray; row i spans
+    data[offsets[i]:offsets[i + 1]]. Missing values are tracked in a bitset so
+    they can be told apart from empty strings.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+        self.present = bitset.BitArray()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def extend(self, values) -> None:
+        """Appends values (str or None) to the end of the column."""
+        row = len(self)
+        for value in values:
+            if value is not None:
+                self.data += value.encode("utf-8")
+                self.present.set(row)
+            self.offsets.append(len(self.data))
+            row += 1
+
+    def get(self, row: int) -> str | None:
+        """Returns the value at row, or None if it was missing."""
+        if not self.present[row]:
+            return None
+        return str(self.data[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+class ListColumn:
+    """
+    Column of string lists with an interned vocabulary.
+
+    Each distinct string is stored once in ``vocabulary``; row i holds the ids
+    values[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self):
+        self.vocabulary: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.values = array("I")
+        self.offsets = array("Q", [0])
+        self.present = bitset.BitArray()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def intern(self, value: str) -> int:
+        """Returns the id of value, adding it to the vocabulary if new."""
+        term_id = self.ids.get(value)
+        if term_id is None:
+            term_id = len(self.vocabulary)
+            self.ids[value] = term_id
+            self.vocabulary.append(value)
+        return term_id
+
+    def extend(self, rows) -> None:
+        """Appends rows (lists of str, or None) to the end of the column."""
+        row = len(self)
+        for items in rows:
+            if items is not None:
+                self.values.extend(self.intern(item) for item in items)
+                self.present.set(row)
+            self.offsets.append(len(self.values))
+            row += 1
+
+    def get_ids(self, row: int) -> array:
+        """Returns the vocabulary ids stored at row."""
+        return self.values[self.offsets[row]:self.offsets[row + 1]]
+
+    def get(self, row: int) -> list[str] | None:
+        """Returns the list stored at row, or None if it was missing."""
+        if not self.present[row]:
+            return None
+        vocabulary = self.vocabulary
+        return [vocabulary[i] for i in self.get_ids(row)]
+
+    def nbytes(self) -> int:
+        return (
+            sum(len(v) for v in self.vocabulary)
+            + self.values.itemsize * len(self.values)
+            + self.offsets.itemsize * len(self.offsets)
+        )
+
+class PlaceStore:
+    """
+    Compact columnar storage for places.
+
+    A PlaceStore holds the same information as a list of place dictionaries
+    but keeps each attribute in its own column:
+
+    - latitude/longitude in float arrays (NaN when missing),
+    - boolean attributes (e.g. "pet_friendly") as packed bitsets,
+    - names and descriptions as offset-encoded UTF-8,
+    - activities as ids into an interned vocabulary.
+
+    Rows are addressed by their insertion position. Indexing a store returns
+    a freshly built dictionary in the original place shape, so code written
+    against list[dict] keeps working on materialized rows.
+    """
+
+    def __init__(self):
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.names = StringColumn()
+        self.descriptions = StringColumn()
+        self.activities = ListColumn()
+        # key -> (true bits, present bits)
+        self._bool_columns: dict[str, tuple[bitset.BitArray, bitset.BitArray]] = {}
+        self._extras: dict[int, dict] = {}
+        self._extra_keys: set[str] = set()
+        self._indexes: dict[type, tuple[int, object]] = {}
+        self.version = 0
+
+    @classmethod
+    def from_dicts(cls, places) -> "PlaceStore":
+        """Builds a store from an iterable of place dictionaries."""
+        store = cls()
+        store.extend(places)
+        return store
+
+    @classmethod
+    def from_json(cls, source) -> "PlaceStore":
+        """
+        Builds a store from JSON input.
+
+        Args:
+            source: A file path or readable text file containing either a JSON
+                    array of place objects or JSON Lines (one object per line).
+
+        Returns:
+            A new PlaceStore.
+        """
+        if hasattr(source, "read"):
+            return cls.from_dicts(_iter_json_places(source))
+        with open(source, encoding="utf-8") as fp:
+            return cls.from_dicts(_iter_json_places(fp))
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def __getitem__(self, row: int) -> dict:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("place row out of range")
+        return self._materialize(row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self._materialize(row)
+
+    def extend(self, places) -> None:
+        """Appends places in bulk."""
+        places = list(places)
+        if not places:
+            return
+        base = len(self)
+
+        extra_rows: dict[int, dict] = {}
+        for key in _bool_keys(places):
+            if key not in self._bool_columns and key not in self._extra_keys:
+                self._bool_columns[key] = (bitset.BitArray(), bitset.BitArray())
+        bool_columns = self._bool_columns
+
+        for i, place in enumerate(places):
+            row = base + i
+            lat = place.get(LATITUDE_KEY)
+            lon = place.get(LONGITUDE_KEY)
+            self.latitudes.append(_MISSING if lat is None else float(lat))
+            self.longitudes.append(_MISSING if lon is None else float(lon))
+            extras = None
+            for key, value in place.items():
+                if key in _FIXED_KEYS:
+                    continue
+                column = bool_columns.get(key)
+                if column is not None and isinstance(value, bool):
+                    column[1].set(row)
+                    if value:
+                        column[0].set(row)
+                else:
+                    if extras is None:
+                        extras = {}
+                    extras[key] = value
+            if extras:
+                extra_rows[row] = extras
+                self._extra_keys.update(extras)
+
+        self.names.extend(place.get(NAME_KEY) for place in places)
+        self.descriptions.extend(place.get(DESCRIPTION_KEY) for place in places)
+        self.activities.extend(place.get(ACTIVITIES_KEY) for place in places)
+        self._extras.update(extra_rows)
+        self.version += 1
+
+    def bool_keys(self) -> list[str]:
+        """Returns the keys stored as packed bit columns."""
+        return list(self._bool_columns)
+
+    def bool_column(self, key: str) -> int:
+        """
+        Returns the bitset of rows where key is True.
+
+        Unknown keys give an empty bitset, matching place.get(key, False).
+        Non-bool values kept in the extras count when they are truthy.
+        """
+        column = self._bool_columns.get(key)
+        bits = column[0].to_int() if column else 0
+        if key in self._extra_keys:
+            bits |= bitset.from_indices(
+                row for row, extras in self._extras.items() if extras.get(key)
+            )
+        return bits
+
+    def index(self, index_cls):
+        """
+        Returns index_cls.from_places(self), cached until the store changes.
+
+        Index classes only need a from_places(places) classmethod; the cache
+        is keyed by class and dropped whenever version moves on.
+        """
+        cached = self._indexes.get(index_cls)
+        hit = cached is not None and cached[0] == self.version
+        count_lookup(f"index.{index_cls.__name__}", hit)
+        if not hit:
+            cached = (self.version, index_cls.from_places(self))
+            self._indexes[index_cls] = cached
+        return cached[1]
+
+    def rows(self, row_ids) -> list[dict]:
+        """Materializes the given rows as place dictionaries."""
+        return [self._materialize(row) for row in row_ids]
+
+    def to_dicts(self) -> list[dict]:
+        """Materializes every row as a place dictionary."""
+        return list(self)
+
+    def coordinates(self, row: int) -> tuple[float, float] | tuple[None, None]:
+        """Returns (latitude, longitude) for row, with None for missing values."""
+        lat = self.latitudes[row]
+        lon = self.longitudes[row]
+        return (
+            None if math.isnan(lat) else lat,
+            None if math.isnan(lon) else lon,
+        )
+
+    def value(self, row: int, key: str, default=None):
+        """Returns place[key] for row without materializing the whole place."""
+        if key == NAME_KEY:
+            value = self.names.get(row)
+        elif key == DESCRIPTION_KEY:
+            value = self.descriptions.get(row)
+        elif key == ACTIVITIES_KEY:
+            value = self.activities.get(row)
+        elif key == LATITUDE_KEY:
+            value = self.coordinates(row)[0]
+        elif key == LONGITUDE_KEY:
+            value = self.coordinates(row)[1]
+        else:
+            column = self._bool_columns.get(key)
+            if column is not None and column[1][row]:
+                return column[0][row]
+            return self._extras.get(row, {}).get(key, default)
+        return default if value is None else value
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns, excluding extras."""
+        bits = sum(
+            true_bits.nbytes() + present_bits.nbytes()
+            for true_bits, present_bits in self._bool_columns.values()
+        )
+        return (
+            self.latitudes.itemsize * len(self.latitudes)
+            + self.longitudes.itemsize * len(self.longitudes)
+            + self.names.nbytes()
+            + self.descriptions.nbytes()
+            + self.activities.nbytes()
+            + bits
+        )
+
+    def _materialize(self, row: int) -> dict:
+        place = {}
+        extras = self._extras.get(row)
+        if extras:
+            place.update(extras)
+        name = self.names.get(row)
+        if name is not None:
+            place[NAME_KEY] = name
+        description = self.descriptions.get(row)
+        if description is not None:
+            place[DESCRIPTION_KEY] = description
+        for key, (true_bits, present_bits) in self._bool_columns.items():
+            if present_bits[row]:
+                place[key] = true_bits[row]
+        activities = self.activities.get(row)
+        if activities is not None:
+            place[ACTIVITIES_KEY] = activities
+        lat, lon = self.coordinates(row)
+        if lat is not None:
+            place[LATITUDE_KEY] = lat
+        if lon is not None:
+            place[LONGITUDE_KEY] = lon
+        return place
+
+def take(places: list[dict] | PlaceStore, row_ids) -> list[dict]:
+    """Returns the places at row_ids from either a list of dicts or a PlaceStore."""
+    if isinstance(places, PlaceStore):
+        return places.rows(row_ids)
+    return [places[row] for row in row_ids]
+
+def _bool_keys(places: list[dict]) -> set[str]:
+    """Returns the non-fixed keys whose values are bools in every place that has them."""
+    seen_bool = set()
+    not_bool = set()
+    for place in places:
+        for key, value in place.items():
+            if key in _FIXED_KEYS:
+                continue
+            if isinstance(value, bool):
+                seen_bool.add(key)
+            else:
+                not_bool.add(key)
+    return seen_bool - not_bool
+
+def _iter_json_places(fp):
+    """Yields place dicts from a JSON array or JSON Lines text file."""
+    head = fp.read(1)
+    while head and head.isspace():
+        head = fp.read(1)
+    if head == "[":
+        yield from json.loads(head + fp.read())
+        return
+    first_line = head + fp.readline()
+    for line in itertools.chain((first_line,), fp):
+        line = line.strip()
+        if line:
+            yield json.loads(line)
@@ -0,0 +1,305 @@
+import itertools
+import math
+
+from . import bitset
+from .activity_index import ActivityIndex
+from .bitmap_index import BitmapIndex
+from .geo import in_viewport
+from .instrumentation import count_rows, instrumented
+from .map_utils import NEAREST_SCAN_THRESHOLD
+from .place_store import PlaceStore
+from .search import DEFAULT_SEARCH_LIMIT, _get_store
+from .spatial_index import SpatialIndex, scan_nearest
+from .text_index import TextIndex
+
+class Predicate:
+    """
+    One condition of a query, with what the planner needs to order and run it.
+
+    Args:
+        description: How explain() shows the condition.
+        estimate: The expected number of matching rows, from index statistics.
+        bits: Optional function returning the matching rows as a bitset. Such
+              predicates can be combined with a single AND.
+        rows: Optional function returning the matching rows in ascending order;
+              derived from bits if not given.
+        test: Optional function returning a one-row membership test; derived
+              from bits if not given.
+    """
+
+    def __init__(self, description: str, estimate: float, bits=None, rows=None, test=None):
+        self.description = description
+        self.estimate = estimate
+        self.bits = bits
+        self._rows = rows
+        self._test = test
+
+    def rows(self):
+        if self._rows is not None:
+            return self._rows()
+        return bitset.iter_indices(self.bits())
+
+    def test(self):
+        if self._test is not None:
+            return self._test()
+        return bitset.BitArray.from_int(self.bits()).__getitem__
+
+class Stage:
+    """One executed step of a plan with its row counts; rows_in is None for stages that start from an index."""
+
+    def __init__(self, operation: str, description: str, estimate: float | None = None):
+        self.operation = operation
+        self.description = description
+        self.estimate = estimate
+        self.rows_in = None
+        self.rows_out = 0
+
+    def __str__(self) -> str:
+        text = f"{self.operation} {self.description}"
+        if self.estimate is not None:
+            text += f" (estimated {round(self.estimate)})"
+        if self.rows_in is not None:
+            text += f": {self.rows_in} in"
+            return text + f", {self.rows_out} out"
+        return text + f": {self.rows_out} out"
+
+class QueryPlan:
+    """
+    An ordered plan for a composite query over one PlaceStore.
+
+    Predicates are ordered by estimated row count. The most selective one
+    drives: its rows come straight from its index. Further bitset predicates
+    (filters, activities, text matches) are intersected with it by AND;
+    the others (viewports) are probed one row at a time, lazily, so rows that
+    a limit cuts off are never tested. Results are ordered by distance when
+    ``near`` is given, by BM25 relevance when only ``text`` is, and by row
+    otherwise. Text ranking may itself drive when its terms are rarer than
+    every predicate, and a nearest search traverses the spatial index unless
+    the driving predicate leaves few enough rows to measure directly.
+    """
+
+    def __init__(self, store: PlaceStore, text: str | None, predicates: list[Predicate],
+                 near: tuple | None, limit: int | None):
+        self.store = store
+        self.text = text
+        self.predicates = sorted(predicates, key=lambda predicate: predicate.estimate)
+        self.near = near
+        self.limit = len(store) if limit is None else max(0, limit)
+        if near is not None:
+            self.ranking = "distance"
+        elif text:
+            self.ranking = "relevance"
+        else:
+            self.ranking = "row"
+        self.stages: list[Stage] = []
+        self.executed = False
+
+    def execute(self) -> list[int]:
+        """Runs the plan and returns the result rows in ranking order."""
+        self.stages = []
+        self.executed = True
+        if self.ranking == "distance":
+            return self._execute_nearest()
+        if self.ranking == "relevance":
+            return self._execute_text()
+        if not self.predicates:
+            stage = self._stage("scan", "all rows")
+            rows = range(min(self.limit, len(self.store)))
+            stage.rows_out = len(rows)
+            return list(rows)
+        return list(itertools.islice(self._candidates(self.predicates), self.limit))
+
+    def explain(self) -> str:
+        """Describes the plan with estimated and actual rows per stage, executing it if needed."""
+        if not self.executed:
+            self.execute()
+        lines = [f"Query plan over {len(self.store)} places, ranked by {self.ranking}, limit {self.limit}:"]
+        lines.extend(f"  {i}. {stage}" for i, stage in enumerate(self.stages, 1))
+        return "\n".join(lines)
+
+    def _stage(self, operation: str, description: str, estimate: float | None = None) -> Stage:
+        stage = Stage(operation, description, estimate)
+        self.stages.append(stage)
+        return stage
+
+    def _candidates(self, predicates: list[Predicate]):
+        """Rows matching every predicate, in ascending order, produced lazily."""
+        driver, *rest = predicates
+        stage = self._stage("scan", driver.description, driver.estimate)
+        probes = []
+        if driver.bits is not None:
+            bits = driver.bits()
+            stage.rows_out = bitset.count(bits)
+            for predicate in rest:
+                if predicate.bits is None:
+                    probes.append(predicate)
+                    continue
+                stage = self._stage("intersect", predicate.description, predicate.estimate)
+                stage.rows_in = bitset.count(bits)
+                bits &= predicate.bits()
+                stage.rows_out = bitset.count(bits)
+            rows = bitset.iter_indices(bits)
+        else:
+            rows = driver.rows()
+            stage.rows_out = len(rows)
+            probes = rest
+        for predicate in probes:
+            rows = self._probe(predicate, rows)
+        return rows
+
+    def _probe(self, predicate: Predicate, rows):
+        stage = self._stage("probe", predicate.description, predicate.estimate)
+        test = predicate.test()
+
+        def probe():
+            stage.rows_in = 0
+            for row in rows:
+                stage.rows_in += 1
+                if test(row):
+                    stage.rows_out += 1
+                    yield row
+
+        return probe()
+
+    def _counting_test(self, predicate: Predicate):
+        """A test of predicate that records how many rows it was asked about."""
+        stage = self._stage("probe", predicate.description, predicate.estimate)
+        stage.rows_in = 0
+        test = predicate.test()
+
+        def counted(row):
+            stage.rows_in += 1
+            if test(row):
+                stage.rows_out += 1
+                return True
+            return False
+
+        return counted
+
+    def _accept(self, predicates: list[Predicate]):
+        """One row test for all predicates, with the bitset predicates ANDed into a single probe."""
+        with_bits = [predicate for predicate in predicates if predicate.bits is not None]
+        if len(with_bits) > 1:
+            bits = with_bits[0].bits()
+            for predicate in with_bits[1:]:
+                stage = self._stage("intersect", predicate.description, predicate.estimate)
+                stage.rows_in = bitset.count(bits)
+                bits &= predicate.bits()
+                stage.rows_out = bitset.count(bits)
+            combined = Predicate(" and ".join(predicate.description for predicate in with_bits),
+                                 bitset.count(bits), bits=lambda: bits)
+            predicates = [combined] + [predicate for predicate in predicates if predicate.bits is None]
+        tests = [self._counting_test(predicate) for predicate in predicates]
+        if not tests:
+            return None
+        return lambda row: all(test(row) for test in tests)
+
+    def _execute_text(self) -> list[int]:
+        text_index = self.store.index(TextIndex)
+        estimate = text_index.document_count(self.text)
+        if not self.predicates or estimate <= self.predicates[0].estimate:
+            accept = self._accept(self.predicates)
+            stage = self._stage("rank", f"text {self.text!r} by BM25, scoring its postings", estimate)
+            found = text_index.search(self.text, self.limit, accept)
+        else:
+            candidates = list(self._candidates(self.predicates))
+            stage = self._stage("rank", f"text {self.text!r} by BM25, scoring the candidates", estimate)
+            stage.rows_in = len(candidates)
+            found = text_index.rank(self.text, candidates, self.limit)
+        stage.rows_out = len(found)
+        return [row for row, _ in found]
+
+    def _execute_nearest(self) -> list[int]:
+        latitude, longitude = self.near[0], self.near[1]
+        max_distance = self.near[2] if len(self.near) > 2 else math.inf
+        spatial_index = self.store.index(SpatialIndex)
+        description = f"from ({latitude}, {longitude})"
+        if max_distance != math.inf:
+            description += f" within {max_distance} m"
+        if self.predicates and self.predicates[0].estimate <= NEAREST_SCAN_THRESHOLD:
+            candidates = list(self._candidates(self.predicates))
+            stage = self._stage("nearest", description + " by measuring the candidates")
+            stage.rows_in = len(candidates)
+            lats, lons = spatial_index.coordinate_columns()
+            found = scan_nearest(lats, lons, latitude, longitude, candidates, self.limit, max_distance)
+        else:
+            accept = self._accept(self.predicates)
+            stage = self._stage("nearest", description + " by spatial index traversal")
+            found = spatial_index.nearest(latitude, longitude, self.limit, max_distance, accept)
+        stage.rows_out = len(found)
+        return [row for row, _ in found]
+
+def plan_query(places: list[dict] | PlaceStore | None = None, text: str | None = None, filters=None, activities=None,
+               bbox: tuple[tuple[float, float], tuple[float, float]] | None = None, near: tuple | None = None,
+               limit: int | None = DEFAULT_SEARCH_LIMIT) -> QueryPlan:
+    """Builds the QueryPlan for query(); see query() for the arguments."""
+    store = _get_store(places)
+    n = len(store)
+    predicates = []
+    if filters:
+        bitmap_index = store.index(BitmapIndex)
+        filters = frozenset(filters)
+        bits = bitmap_index.match(filters)
+        predicates.append(Predicate(f"filters {sorted(filters)}", bitset.count(bits), bits=lambda: bits))
+    if activities:
+        activity_index = store.index(ActivityIndex)
+        activity_bits = bitset.full(n)
+        for activity in activities:
+            activity_bits &= activity_index.bitmap(activity)
+        predicates.append(Predicate(f"activities {list(activities)}", bitset.count(activity_bits),
+                                    bits=lambda: activity_bits))
+    if bbox is not None:
+        north_east_corner, south_west_corner = bbox
+        spatial_index = store.index(SpatialIndex)
+        lats, lons = store.latitudes, store.longitudes
+        predicates.append(Predicate(
+            f"bbox NE{tuple(north_east_corner)} SW{tuple(south_west_corner)}",
+            spatial_index.estimate(north_east_corner, south_west_corner),
+            rows=lambda: spatial_index.query(north_east_corner, south_west_corner),
+            test=lambda: lambda row: in_viewport(lats[row], lons[row], north_east_corner, south_west_corner),
+        ))
+    if text and near is not None:
+        # Ranked by distance, so the text only restricts rows to those matching a term.
+        text_index = store.index(TextIndex)
+        predicates.append(Predicate(f"text {text!r}", text_index.document_count(text),
+                                    bits=lambda: text_index.bitmap(text)))
+    return QueryPlan(store, text, predicates, near, limit)
+
+@instrumented
+def query(text: str | None = None, filters=None, activities=None,
+          bbox: tuple[tuple[float, float], tuple[float, float]] | None = None, near: tuple | None = None,
+          limit: int | None = DEFAULT_SEARCH_LIMIT, places: list[dict] | PlaceStore | None = None) -> list[dict]:
+    """
+    Runs a composite search in one pass over the indexes.
+
+    Replaces chaining apply_filters, activity_search and find_places_in_map_area, which
+    materializes every intermediate list: rows are only materialized for the final results.
+
+    Args:
+        text: Optional free text. Without near, results are ranked by BM25 relevance;
+              with near, places must match at least one of its terms.
+        filters: Optional filter IDs (as in apply_filters) every place must match.
+        activities: Optional activities (as in activity_search) every place must offer.
+        bbox: Optional (north_east_corner, south_west_corner) viewport places must be in.
+        near: Optional (latitude, longitude) or (latitude, longitude, meters). Results are
+              ranked nearest first, and limited to the radius when meters is given.
+        limit: The maximum number of results, or None for all.
+        places: A PlaceStore (using its cached indexes) or a list of place dictionaries
+                (indexed for this call only). Defaults to the search corpus.
+
+    Returns:
+        Up to limit places, in ranking order (row order when neither text nor near is given).
+    """
+    plan = plan_query(places, text, filters, activities, bbox, near, limit)
+    results = plan.store.rows(plan.execute())
+    # The driving stage produced every row the later stages examined.
+    count_rows("query", plan.stages[0].rows_out if plan.stages else len(results), len(results))
+    return results
+
+def explain(text: str | None = None, filters=None, activities=None,
+            bbox: tuple[tuple[float, float], tuple[float, float]] | None = None, near: tuple | None = None,
+            limit: int | None = DEFAULT_SEARCH_LIMIT, places: list[dict] | PlaceStore | None = None) -> str:
+    """Runs query() with the same arguments and returns its plan with per-stage row counts."""
+    plan = plan_query(places, text, filters, activities, bbox, near, limit)
+    plan.execute()
+    return plan.explain()
@@ -0,0 +1,273 @@
+import math
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
+from . import bitset
+from .bitmap_index import BitmapIndex
+from .clustering import ClusterIndex
+from .geo import in_viewport
+from .instrumentation import count_lookup, count_rows, instrumented
+from .map_utils import _cluster_zoom, _clusters_response
+from .place_store import PlaceStore
+from .spatial_index import SpatialIndex
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL = 300.0 # Seconds
+MAX_TILE_ZOOM = 20
+# Rough per-entry cost of the dict slot, key tuple and bookkeeping.
+ENTRY_OVERHEAD = 200
+
+class LRUCache:
+    """
+    Least-recently-used cache with a byte budget and a time to live.
+
+    Entries are kept in an OrderedDict from least to most recently used.
+    Adding an entry evicts from the old end until the total size fits
+    max_bytes; entries older than ttl seconds count as misses and are dropped
+    when next looked up. The cache remembers the dataset version it holds
+    results for, and validate() empties it when the version moves on.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float | None = DEFAULT_TTL, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict() # key -> (value, nbytes, expires_at)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def validate(self, version) -> None:
+        """Drops every entry if version differs from the dataset version the entries were computed for."""
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self.version = version
+
+    def get(self, key, default=None):
+        """Returns the value cached for key, or default on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, nbytes, expires_at = entry
+        if expires_at is not None and self.clock() >= expires_at:
+            self._remove(key, nbytes)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, nbytes: int | None = None) -> None:
+        """
+        Caches value under key.
+
+        Args:
+            key: A hashable key.
+            value: The value to cache.
+            nbytes: The value's size; estimated with sys.getsizeof if not given. Values
+                    larger than the whole budget are not cached.
+        """
+        if nbytes is None:
+            nbytes = sys.getsizeof(value)
+        nbytes += sys.getsizeof(key) + ENTRY_OVERHEAD
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        if nbytes > self.max_bytes:
+            return
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        self._entries[key] = (value, nbytes, expires_at)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            old_key, (_, old_nbytes, _) = next(iter(self._entries.items()))
+            self._remove(old_key, old_nbytes)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drops every entry; counters are kept."""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the current size, for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _remove(self, key, nbytes: int) -> None:
+        del self._entries[key]
+        self.nbytes -= nbytes
+
+def viewport_zoom(north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> int:
+    """The largest tile zoom whose tiles are at least as wide as the viewport."""
+    span = north_east_corner[1] - south_west_corner[1]
+    if span < 0: # Crosses the antimeridian
+        span += 360.0
+    if span <= 0:
+        return MAX_TILE_ZOOM
+    return max(0, min(MAX_TILE_ZOOM, math.floor(math.log2(360.0 / span))))
+
+def snap_viewport(north_east_corner: tuple[float, float], south_west_corner: tuple[float, float],
+                  zoom: int) -> tuple[tuple, tuple[float, float], tuple[float, float]]:
+    """
+    Grows a viewport outward to whole tiles of a longitude/latitude grid.
+
+    At zoom z the world is split into 2**z by 2**z tiles. Viewports that touch
+    the same tiles share a key, so small pans and zooms reuse one cached
+    result, which is then narrowed to the exact viewport.
+
+    Returns:
+        (key, north_east_corner, south_west_corner) of the snapped viewport.
+    """
+    n = 1 << zoom
+    width = 360.0 / n
+    height = 180.0 / n
+    ne_lat, ne_lon = north_east_corner
+    sw_lat, sw_lon = south_west_corner
+    x0 = min(n - 1, max(0, math.floor((sw_lon + 180.0) / width)))
+    x1 = min(n - 1, max(0, math.floor((ne_lon + 180.0) / width)))
+    y0 = min(n - 1, max(0, math.floor((sw_lat + 90.0) / height)))
+    y1 = min(n - 1, max(0, math.floor((ne_lat + 90.0) / height)))
+    if sw_lon > ne_lon and x0 <= x1 + 1:
+        x0, x1 = 0, n - 1 # The snapped antimeridian-crossing view wraps the whole world
+    snapped_ne = ((y1 + 1) * height - 90.0, (x1 + 1) * width - 180.0)
+    snapped_sw = (y0 * height - 90.0, x0 * width - 180.0)
+    return (zoom, x0, y0, x1, y1), snapped_ne, snapped_sw
+
+def _places_nbytes(places: list[dict]) -> int:
+    """Approximate size of materialized place dictionaries (keys are shared, so not counted)."""
+    return sys.getsizeof(places) + sum(
+        sys.getsizeof(place) + sum(sys.getsizeof(value) for value in place.values()) for place in places
+    )
+
+class CachedPlaces:
+    """
+    Caching layer in front of the map and filter queries for one PlaceStore.
+
+    The methods mirror find_places_in_map_area, get_map_clusters and
+    apply_filters and return the same results. Entries hold materialized
+    places (or cluster features), so a hit skips both the index query and
+    building the dictionaries; cached dictionaries are shared between
+    callers, as with a plain list of places.
+
+    Viewports are snapped outward to tiles SNAP_REFINEMENT zoom levels finer
+    than the viewport itself, so a map being panned or jiggled by less than
+    about a tile hits the same entry, which is then narrowed to the exact
+    viewport. Filter sets are canonicalized so their order does not matter.
+    Every call checks the store's version, so any change to the places
+    invalidates the cache.
+    """
+
+    # Tiles are 1/2**SNAP_REFINEMENT of the viewport width: finer tiles waste less
+    # of each entry on places outside the viewport, coarser ones hit more often.
+    SNAP_REFINEMENT = 3
+
+    def __init__(self, places: PlaceStore, cache: LRUCache | None = None):
+        self.places = places
+        self.cache = cache if cache is not None else LRUCache()
+
+    def _lookup(self, key, compute):
+        self.cache.validate(self.places.version)
+        value = self.cache.get(key)
+        count_lookup("query_cache", value is not None)
+        if value is None:
+            value, nbytes = compute()
+            self.cache.put(key, value, nbytes)
+        return value
+
+    def _snap(self, north_east_corner, south_west_corner):
+        zoom = min(MAX_TILE_ZOOM, viewport_zoom(north_east_corner, south_west_corner) + self.SNAP_REFINEMENT)
+        return snap_viewport(north_east_corner, south_west_corner, zoom)
+
+    @instrumented
+    def find_places_in_map_area(self, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> list[dict]:
+        """find_places_in_map_area through the cache."""
+        index = self.places.index(SpatialIndex)
+        tile_key, snapped_ne, snapped_sw = self._snap(north_east_corner, south_west_corner)
+
+        def compute():
+            rows = array("I", index.query(snapped_ne, snapped_sw))
+            places = index.rows(rows)
+            return (rows, places), sys.getsizeof(rows) + _places_nbytes(places)
+
+        rows, places = self._lookup(("viewport", tile_key), compute)
+        lats, lons = self.places.latitudes, self.places.longitudes
+        visible_places = [
+            place for row, place in zip(rows, places)
+            if in_viewport(lats[row], lons[row], north_east_corner, south_west_corner)
+        ]
+        count_rows("CachedPlaces.find_places_in_map_area", len(rows), len(visible_places))
+        return visible_places
+
+    @instrumented
+    def get_map_clusters(self, zoom_level: int, north_east_corner: tuple[float, float] | None = None,
+                         south_west_corner: tuple[float, float] | None = None, summary_only: bool = False) -> dict:
+        """get_map_clusters through the cache."""
+        index = self.places.index(ClusterIndex)
+        zoom_level = _cluster_zoom(index, zoom_level)
+        if north_east_corner is None or south_west_corner is None:
+            key, snapped_ne, snapped_sw = ("clusters", zoom_level), (90.0, 180.0), (-90.0, -180.0)
+        else:
+            tile_key, snapped_ne, snapped_sw = self._snap(north_east_corner, south_west_corner)
+            key = ("clusters", zoom_level, tile_key)
+
+        def compute():
+            items = index.query(zoom_level, snapped_ne, snapped_sw)
+            features = dict(zip(items, index.features(zoom_level, items)))
+            nbytes = sys.getsizeof(features) + sum(
+                sys.getsizeof(feature) + sum(sys.getsizeof(value) for value in feature.values())
+                for feature in features.values()
+            )
+            return features, nbytes
+
+        features = self._lookup(key, compute)
+        if north_east_corner is None or south_west_corner is None:
+            visible = list(features.values())
+        else:
+            items = index.select(zoom_level, features, north_east_corner, south_west_corner)
+            visible = [features[i] for i in items]
+        count_rows("CachedPlaces.get_map_clusters", len(features), len(visible))
+        return _clusters_response(index.places, visible, summary_only)
+
+    @instrumented
+    def apply_filters(self, active_filters: set[str]) -> list[dict]:
+        """apply_filters through the cache."""
+        index = self.places.index(BitmapIndex)
+        if not active_filters:
+            filtered_places = index.rows(bitset.full(index.size))
+            count_rows("CachedPlaces.apply_filters", index.size, len(filtered_places))
+            return filtered_places
+
+        def compute():
+            places = index.rows(index.match(active_filters))
+            return places, _places_nbytes(places)
+
+        filtered_places = list(self._lookup(("filters", tuple(sorted(set(active_filters)))), compute))
+        count_rows("CachedPlaces.apply_filters", index.entries(active_filters), len(filtered_places))
+        return filtered_places
+
+    def stats(self) -> dict:
+        """Returns the cache statistics; see LRUCache.stats."""
+        return self.cache.stats()
@@ -0,0 +1,10 @@
+# Demo dataset used by the console app and as the default text search corpus.
+SAMPLE_PLACES = [
+    {"name": "Adventure Park", "description": "Fun for all ages", "suitable_for_kids": True, "parking_available": True, "pet_friendly": False, "activities": ["hiking", "zip-lining", "rock climbing"], "latitude": 34.0522, "longitude": -118.2437},
+    {"name": "Quiet Cafe", "description": "Relax and unwind", "wifi_available": True, "pet_friendly": True, "suitable_for_kids": False, "activities": ["reading", "board games"], "latitude": 34.0550, "longitude": -118.2500},
+    {"name": "City Museum", "description": "Historical artifacts", "wheelchair_accessible": True, "parking_available": True, "activities": ["guided tours", "exhibits"], "latitude": 34.0500, "longitude": -118.2400},
+    {"name": "Dog Haven", "description": "A park for dogs and their owners", "pet_friendly": True, "parking_available": True, "suitable_for_kids": True, "activities": ["dog walking", "fetch"], "latitude": 34.0600, "longitude": -118.2600},
+    {"name": "Tech Hub Cafe", "description": "Work and coffee", "wifi_available": True, "wheelchair_accessible": True, "pet_friendly": False, "activities": ["coding", "meetings"], "latitude": 34.0480, "longitude": -118.2450},
+    {"name": "Mountain Trails", "description": "Scenic hiking paths", "activities": ["hiking", "bird watching", "cycling"], "parking_available": True, "latitude": 34.1500, "longitude": -118.3000},
+    {"name": "Beach Resort", "description": "Sun and Sand", "activities": ["diving", "swimming", "surfing"], "wifi_available": True, "suitable_for_kids": True, "latitude": 33.9500, "longitude": -118.4000}
+]
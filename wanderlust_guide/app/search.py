@@ -1,11 +1,85 @@
-def text_search(query: str):
-    """Performs a text-based search for places."""
-    # Placeholder for text search logic
-    print(f"Performing text search for: {query}")
-    return [{"name": "Test Place", "description": "A place for testing."}]
-
-def voice_search():
-    """Handles voice input and converts it to text for searching."""
+from .activity_index import ActivityIndex
+from .instrumentation import count_rows, get_instrumentation, instrumented
+from .name_index import NameIndex
+from .place_store import PlaceStore
+from .sample_data import SAMPLE_PLACES
+from .text_index import TextIndex
+
+DEFAULT_SEARCH_LIMIT = 10
+
+# Corpus searched by text_search/voice_search/autocomplete when no places are passed in.
+_default_corpus: list[dict] | PlaceStore = SAMPLE_PLACES
+_default_indexes: dict[type, object] = {}
+
+def set_search_corpus(places: list[dict] | PlaceStore) -> None:
+    """Sets the places text_search, voice_search and autocomplete use when none are passed in."""
+    global _default_corpus
+    _default_corpus = places
+    _default_indexes.clear()
+
+def _get_index(places, index_cls):
+    """Resolves the places argument of a search function to an index of type index_cls."""
+    if places is None:
+        index = _default_indexes.get(index_cls)
+        if index is None:
+            index = _default_indexes[index_cls] = _get_index(_default_corpus, index_cls)
+        return index
+    if isinstance(places, index_cls):
+        return places
+    if isinstance(places, PlaceStore):
+        return places.index(index_cls)
+    return index_cls.from_places(places)
+
+def _get_store(places: list[dict] | PlaceStore | None) -> PlaceStore:
+    """Resolves the places argument of a search function to a PlaceStore."""
+    if places is None:
+        if isinstance(_default_corpus, PlaceStore):
+            return _default_corpus
+        store = _default_indexes.get(PlaceStore)
+        if store is None:
+            store = _default_indexes[PlaceStore] = PlaceStore.from_dicts(_default_corpus)
+        return store
+    if isinstance(places, PlaceStore):
+        return places
+    return PlaceStore.from_dicts(places)
+
+@instrumented
+def text_search(query: str, places: list[dict] | PlaceStore | TextIndex | None = None, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+    """
+    Performs a text-based search for places.
+
+    Args:
+        query: Free text in English and/or Thai (e.g., "parks with playgrounds", "ร้านกาแฟ").
+        places: The places to search: a TextIndex, a PlaceStore (searched through its cached
+                TextIndex) or a list of place dictionaries (indexed for this call only).
+                Defaults to the corpus set with set_search_corpus().
+        limit: The maximum number of results to return.
+
+    Returns:
+        Up to limit places ranked by BM25 relevance, best match first.
+    """
+    index = _get_index(places, TextIndex)
+    found_places = index.rows(row for row, _ in index.search(query, limit))
+    if get_instrumentation() is not None:
+        # The query terms' postings bound the rows scored; pruning usually skips many.
+        count_rows("text_search", sum(len(index.postings[term][0]) for term in index.terms(query)), len(found_places))
+    return found_places
+
+@instrumented
+def voice_search(places: list[dict] | PlaceStore | TextIndex | None = None, limit: int = DEFAULT_SEARCH_LIMIT,
+                 audio=None, transcriber=None) -> list[dict]:
+    """
+    Handles voice input and converts it to text for searching.
+
+    Given audio, an iterable of audio chunks, the chunks are streamed through a
+    voice.VoicePipeline with transcriber (a StubTranscriber by default). For many
+    utterances, keep one VoicePipeline open instead, so they share its batching.
+    Without audio, the transcription is simulated.
+    """
+    if audio is not None:
+        from .voice import VoicePipeline
+        with VoicePipeline(places, transcriber) as pipeline:
+            return pipeline.search(audio, limit)
     # Placeholder for voice search logic
     # In a real application, this would involve:
     # 1. Accessing the microphone
@@ -13,24 +87,50 @@ def voice_search():
     # 3. Sending audio to a speech-to-text API
     # 4. Receiving the transcribed text
     # 5. Calling text_search() with the transcribed text
-    print("Voice search activated. Please speak your query.")
     # Simulate transcribed text
     transcribed_text = "restaurants near me"
-    print(f"Transcribed text: {transcribed_text}")
-    return text_search(transcribed_text)
+    return text_search(transcribed_text, places=places, limit=limit)
+
+def autocomplete(prefix: str, places: list[dict] | PlaceStore | NameIndex | None = None, limit: int = DEFAULT_SEARCH_LIMIT,
+                 near: tuple[float, float] | None = None) -> list[dict]:
+    """
+    Suggests places whose name starts with what the user has typed.
+
+    Args:
+        prefix: The text typed so far. Matching ignores case and accents ("cafe" finds "Café").
+        places: A NameIndex, a PlaceStore (searched through its cached NameIndex) or a list of
+                place dictionaries (indexed for this call only). Defaults to the search corpus.
+        limit: The maximum number of suggestions.
+        near: Optional (latitude, longitude) to rank suggestions by distance instead of by
+              the places' "popularity" value.
 
-def activity_search(places: list[dict], activity: str) -> list[dict]:
+    Returns:
+        Up to limit places, best suggestion first.
+    """
+    index = _get_index(places, NameIndex)
+    return index.rows(index.complete(prefix, limit, near))
+
+@instrumented
+def activity_search(places: list[dict] | PlaceStore | ActivityIndex, activity: str, within=None) -> list[dict]:
     """
     Searches for places that offer a specific activity.
 
     Args:
-        places: A list of place dictionaries. Each place should have an 'activities' key
-                with a list of strings representing available activities.
+        places: A list of place dictionaries, a PlaceStore, or an ActivityIndex. Each place
+                should have an 'activities' key with a list of strings representing available
+                activities. Stores are searched through their cached ActivityIndex.
         activity: The activity to search for (e.g., "hiking", "diving").
+        within: Optional candidate rows to search inside (a bitset such as
+                BitmapIndex.match() returns, or row ids). Only used with a PlaceStore
+                or ActivityIndex.
 
     Returns:
         A list of places that offer the specified activity.
     """
+    if isinstance(places, PlaceStore):
+        places = places.index(ActivityIndex)
+    if isinstance(places, ActivityIndex):
+        return _activity_search_index(places, activity, within)
     if not activity:
         return places # Or perhaps return an empty list, depending on desired behavior
 
@@ -39,5 +139,40 @@ def activity_search(places: list[dict], activity: str) -> list[dict]:
         if activity.lower() in [a.lower() for a in place.get("activities", [])]:
             found_places.append(place)
 
-    print(f"Searching for activity '{activity}'. Found {len(found_places)} matching places.")
+    count_rows("activity_search", len(places), len(found_places))
+    return found_places
+
+def _activity_search_index(index: ActivityIndex, activity: str, within) -> list[dict]:
+    """activity_search through an ActivityIndex posting list."""
+    activities = [activity] if activity else []
+    if activity:
+        found_places = index.rows(index.lookup(activity, within))
+    else:
+        found_places = index.rows(index.lookup_all(activities, within))
+
+    count_rows("activity_search", index.entries(activities, within), len(found_places))
+    return found_places
+
+@instrumented
+def search_activities(places: PlaceStore | ActivityIndex, activities: list[str], match_all: bool = True, within=None) -> list[dict]:
+    """
+    Searches for places offering several activities at once.
+
+    Args:
+        places: A PlaceStore or an ActivityIndex.
+        activities: The activities to search for (e.g., ["hiking", "cycling"]).
+        match_all: True to require every activity (AND), False for any of them (OR).
+        within: Optional candidate rows to search inside, as for activity_search.
+
+    Returns:
+        A list of matching places in row order.
+    """
+    index = places.index(ActivityIndex) if isinstance(places, PlaceStore) else places
+    if match_all:
+        rows = index.lookup_all(activities, within)
+    else:
+        rows = index.lookup_any(activities, within)
+    found_places = index.rows(rows)
+
+    count_rows("search_activities", index.entries(activities, within, match_all), len(found_places))
     return found_places
@@ -0,0 +1,562 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from .filters import apply_filters, get_available_filters
+from .instrumentation import Metrics, get_instrumentation, report_error, set_instrumentation
+from .map_utils import find_places_in_map_area, get_map_clusters, get_place_coordinates
+from .place_store import PlaceStore
+from .search import DEFAULT_SEARCH_LIMIT, _get_store, activity_search, text_search, voice_search
+from .streaming import DEFAULT_PAGE_SIZE, PlaceStream, iter_activity_search, iter_filters, iter_places_in_map_area
+from .voice import VoicePipeline
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_IN_FLIGHT = 8 # Queries running in the executor at once
+DEFAULT_MAX_QUEUE = 64 # Queries waiting for an executor slot before new ones are rejected
+DEFAULT_QUEUE_TIMEOUT = 2.0 # Seconds a query may wait for a slot before it is rejected
+MAX_HEADER_BYTES = 64 * 1024
+STREAM_BATCH = 256 # Places per NDJSON chunk
+UPLOAD_CHUNK = 4096 # Bytes of a voice upload with Content-Length fed to its session at a time
+MAX_BODY_BYTES = 16 * 1024 * 1024 # Largest request body accepted, in either framing
+MAX_CHUNK_BYTES = 1024 * 1024 # Largest single chunk of a chunked body, which is buffered whole
+NDJSON = "application/x-ndjson"
+PROMETHEUS_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large",
+            431: "Request Header Fields Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class Overloaded(Exception):
+    """Raised when a query is refused by admission control."""
+
+class HTTPError(Exception):
+    """An error response with a status code and a message for the client."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _param(params: dict, name: str, default=None) -> str:
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise HTTPError(400, f"missing parameter '{name}'")
+        return default
+    return values[0]
+
+def _int_param(params: dict, name: str, default: int | None = None) -> int:
+    value = _param(params, name, None if default is None else str(default))
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPError(400, f"parameter '{name}' must be an integer") from None
+
+def _point_param(params: dict, name: str, required: bool = True) -> tuple[float, float] | None:
+    value = _param(params, name, None if required else "")
+    if not value:
+        return None
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+    except ValueError:
+        raise HTTPError(400, f"parameter '{name}' must be 'latitude,longitude'") from None
+    return lat, lon
+
+def _list_param(params: dict, name: str) -> list[str]:
+    return [item for value in params.get(name, ()) for item in value.split(",") if item]
+
+def _encode(result) -> bytes:
+    return json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+async def _read_body(reader: asyncio.StreamReader, headers: dict):
+    """
+    Yields a request body as it arrives: chunk by chunk when chunked, else UPLOAD_CHUNK bytes at a time.
+
+    Raises:
+        HTTPError: 400 for a malformed chunk size, 413 for a chunk over MAX_CHUNK_BYTES
+            or a chunked body over MAX_BODY_BYTES.
+    """
+    if headers.get("transfer-encoding", "").lower() != "chunked":
+        remaining = int(headers.get("content-length", 0))
+        while remaining:
+            data = await reader.readexactly(min(UPLOAD_CHUNK, remaining))
+            remaining -= len(data)
+            yield data
+        return
+    total = 0
+    while True:
+        try:
+            line = await reader.readline() # ValueError past the reader's limit
+            size = int(line.split(b";")[0], 16)
+        except ValueError:
+            raise HTTPError(400, "malformed chunked body") from None
+        if size < 0:
+            raise HTTPError(400, "malformed chunked body")
+        if not size:
+            break
+        total += size
+        if size > MAX_CHUNK_BYTES or total > MAX_BODY_BYTES:
+            raise HTTPError(413, "request body too large")
+        data = await reader.readexactly(size + 2)
+        yield data[:-2]
+    while (await reader.readline()).strip():
+        pass # Trailer fields
+
+class QueryService:
+    """
+    HTTP/1.1 JSON API over the search and map functions, on asyncio streams.
+
+    Every query runs in an executor so the event loop only parses requests
+    and writes responses. Identical GET requests that arrive while one is
+    being answered share its result instead of running again. Admission
+    control bounds the load: at most max_in_flight queries run at once, at
+    most max_queue wait for a slot, and a query that cannot start within
+    queue_timeout seconds is rejected; rejected requests get 503 with
+    Retry-After, so overload sheds requests instead of growing latency for
+    everyone. Place lists are streamed as NDJSON, in batches that wait for
+    the client to keep up, when the client asks for it with
+    ``Accept: application/x-ndjson`` or ``?format=ndjson``; listings are
+    then read from their iter_* stream batch by batch instead of as a list.
+    Unexpected errors are answered with a generic 500 and reported to the
+    installed instrumentation.
+
+    Endpoints (all GET):
+
+    - /api/search?q=&limit=          text_search
+    - /api/voice-search?limit=       voice_search
+    - /api/filters                   get_available_filters
+    - /api/places?filters=a,b        apply_filters
+    - /api/activities?activity=      activity_search
+    - /api/map/viewport?ne=&sw=      find_places_in_map_area (corners as "latitude,longitude")
+    - /api/map/clusters?zoom=&ne=&sw=&summary=1 get_map_clusters (corners optional; summary=1 for counts only)
+    - /api/coordinates?name=         get_place_coordinates
+    - /api/metrics                   stats(), plus the installed Metrics as JSON
+    - /metrics                       the same in the Prometheus text format
+
+    POST /api/voice-search?limit= streams the request body, as chunks of a
+    chunked upload arrive, into a session of the VoicePipeline and answers
+    {"transcript", "partials", "places", "latency_ms"} when the upload ends.
+
+    /api/places, /api/activities and /api/map/viewport return one page,
+    {"places": [...], "next_cursor": ...}, when given limit= or cursor=; pass
+    next_cursor back as cursor= for the following page (null on the last one).
+
+    Args:
+        places: The places to serve; defaults to the search corpus.
+        backend: Optional object providing some of apply_filters, activity_search,
+                 find_places_in_map_area and get_map_clusters as methods without the places
+                 argument, e.g. a ShardedPlaces; the others run over places.
+        executor: Where queries run; defaults to a thread pool with max_in_flight threads.
+        max_in_flight: The number of queries running at once.
+        max_queue: The number of queries allowed to wait for a slot.
+        queue_timeout: Seconds a query may wait for a slot.
+        voice: The VoicePipeline for voice uploads; one over places is created on the first upload.
+
+    close() shuts down the executor and VoicePipeline the service created;
+    ones passed in are left to their owner.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore | None = None, backend=None, executor=None,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_queue: int = DEFAULT_MAX_QUEUE,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT, voice: VoicePipeline | None = None):
+        self.store = _get_store(places)
+        self.backend = backend
+        self.executor = executor or ThreadPoolExecutor(max_in_flight, thread_name_prefix="query")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.voice = voice
+        self._closers = [] if executor else [self.executor.shutdown] # Called by close()
+        self._slots = None # Created on first use, inside the running event loop
+        self._waiting = 0
+        self._running = 0
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        self._counters = {"requests": 0, "queries": 0, "coalesced": 0, "rejected": 0, "errors": 0}
+        self._routes = {
+            "/api/search": self._search,
+            "/api/voice-search": self._voice_search,
+            "/api/filters": self._filters,
+            "/api/places": self._places,
+            "/api/activities": self._activities,
+            "/api/map/viewport": self._viewport,
+            "/api/map/clusters": self._clusters,
+            "/api/coordinates": self._coordinates,
+            "/api/metrics": self._metrics,
+        }
+
+    def stats(self) -> dict:
+        """Returns request counters and the current number of running and waiting queries."""
+        return dict(self._counters, running=self._running, waiting=self._waiting)
+
+    def _call(self, name: str, function, *args, **kwargs):
+        """Calls backend.name(*args, **kwargs) when the backend has it, else function(store, *args, **kwargs)."""
+        method = getattr(self.backend, name, None)
+        if method is not None:
+            return lambda: method(*args, **kwargs)
+        return lambda: function(self.store, *args, **kwargs)
+
+    def _paged(self, params, stream: bool, name: str, function, stream_function, *args):
+        """
+        _call, or one page of stream_function(store, *args) when the request asks for pages.
+
+        Unpaged NDJSON requests get the PlaceStream itself, which _send_ndjson
+        reads batch by batch, unless the backend answers the query.
+        """
+        if "limit" not in params and "cursor" not in params:
+            if stream and getattr(self.backend, name, None) is None:
+                return lambda: stream_function(self.store, *args)
+            return self._call(name, function, *args)
+        limit = _int_param(params, "limit", DEFAULT_PAGE_SIZE)
+        cursor = params.get("cursor", [None])[0]
+
+        def page():
+            try:
+                places, next_cursor = stream_function(self.store, *args).page(limit, cursor)
+            except ValueError as error:
+                raise HTTPError(400, str(error)) from None
+            return {"places": places, "next_cursor": next_cursor}
+
+        return page
+
+    def _search(self, params, stream: bool):
+        query = _param(params, "q")
+        limit = _int_param(params, "limit", DEFAULT_SEARCH_LIMIT)
+        return lambda: text_search(query, self.store, limit)
+
+    def _voice_search(self, params, stream: bool):
+        limit = _int_param(params, "limit", DEFAULT_SEARCH_LIMIT)
+        return lambda: voice_search(self.store, limit)
+
+    def _filters(self, params, stream: bool):
+        return get_available_filters
+
+    def _places(self, params, stream: bool):
+        return self._paged(params, stream, "apply_filters", apply_filters, iter_filters, set(_list_param(params, "filters")))
+
+    def _activities(self, params, stream: bool):
+        return self._paged(params, stream, "activity_search", activity_search, iter_activity_search, _param(params, "activity"))
+
+    def _viewport(self, params, stream: bool):
+        return self._paged(params, stream, "find_places_in_map_area", find_places_in_map_area, iter_places_in_map_area,
+                           _point_param(params, "ne"), _point_param(params, "sw"))
+
+    def _clusters(self, params, stream: bool):
+        zoom = _int_param(params, "zoom")
+        ne, sw = _point_param(params, "ne", required=False), _point_param(params, "sw", required=False)
+        summary_only = _param(params, "summary", "0") not in ("0", "false")
+        return self._call("get_map_clusters", get_map_clusters, zoom, ne, sw, summary_only=summary_only)
+
+    def _coordinates(self, params, stream: bool):
+        name = _param(params, "name")
+
+        def lookup():
+            coordinates = get_place_coordinates(name, self.store)
+            if coordinates is None:
+                raise HTTPError(404, f"no place named {name!r}")
+            return {"name": name, "latitude": coordinates[0], "longitude": coordinates[1]}
+
+        return lookup
+
+    def _metrics(self, params, stream: bool):
+        def collect():
+            metrics = get_instrumentation()
+            result = {"service": self.stats()}
+            if isinstance(metrics, Metrics):
+                result.update(metrics.to_json())
+            if self.voice is not None:
+                result["voice"] = self.voice.stats()
+            return result
+
+        return collect
+
+    def prometheus(self) -> str:
+        """Returns stats() and the installed Metrics in the Prometheus text format."""
+        lines = []
+        for name, value in self.stats().items():
+            kind = "gauge" if name in ("running", "waiting") else "counter"
+            metric = f"wanderlust_http_{name}" if kind == "gauge" else f"wanderlust_http_{name}_total"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+        text = "\n".join(lines) + "\n"
+        metrics = get_instrumentation()
+        if isinstance(metrics, Metrics):
+            text += metrics.to_prometheus()
+        return text
+
+    async def _admit(self):
+        """Waits for an executor slot, or raises Overloaded if the queue is full or the wait too long."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            raise Overloaded()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded() from None
+        finally:
+            self._waiting -= 1
+
+    async def _execute(self, function, stream: bool):
+        await self._admit()
+        self._running += 1
+        try:
+            self._counters["queries"] += 1
+            loop = asyncio.get_running_loop()
+            # JSON is encoded in the executor too; streamed results are encoded batch by batch.
+            return await loop.run_in_executor(self.executor, function if stream else lambda: _encode(function()))
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    async def query(self, path: str, params: dict, stream: bool = False):
+        """
+        Answers one API request, sharing the work with an identical request already in flight.
+
+        Returns:
+            The encoded JSON body, or the result itself when stream is true.
+
+        Raises:
+            HTTPError: For unknown paths, bad parameters or failed lookups.
+            Overloaded: If admission control refuses the query.
+        """
+        route = self._routes.get(path)
+        if route is None:
+            raise HTTPError(404, f"unknown endpoint {path}")
+        key = (path, stream, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._execute(route(params, stream), stream))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self._counters["coalesced"] += 1
+        # Shielded so a client that disconnects does not cancel the others' result.
+        return await asyncio.shield(task)
+
+    def close(self) -> None:
+        """Stops the VoicePipeline and executor the service created, once requests are no longer served."""
+        while self._closers:
+            self._closers.pop()()
+
+    async def voice_query(self, reader: asyncio.StreamReader, headers: dict, params: dict) -> bytes:
+        """
+        Answers a voice upload, feeding the request body to a VoicePipeline session as it arrives.
+
+        Returns:
+            The encoded JSON body.
+
+        Raises:
+            HTTPError: For bad parameters or a malformed or truncated body.
+            Overloaded: If admission control refuses the final search.
+        """
+        limit = _int_param(params, "limit", DEFAULT_SEARCH_LIMIT)
+        if self.voice is None:
+            self.voice = VoicePipeline(self.store)
+            self._closers.append(self.voice.close)
+        session = self.voice.open(limit)
+        try:
+            async for chunk in _read_body(reader, headers):
+                session.feed(chunk)
+        except asyncio.IncompleteReadError:
+            raise HTTPError(400, "request body ended early") from None
+
+        def finish():
+            places = session.finish()
+            return {"transcript": session.transcript, "partials": session.partials, "places": places,
+                    "latency_ms": session.latency}
+
+        return await self._execute(finish, stream=False)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._send_error(writer, 431, "request headers too large", keep_alive=False)
+                    break
+                keep_alive = await self._handle_request(reader, writer, head)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _handle_request(self, reader, writer, head: bytes) -> bool:
+        self._counters["requests"] += 1
+        request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+        try:
+            method, target, version = request_line.split(" ")
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            content_length = int(headers.get("content-length", 0)) # Checked here so _read_body can trust it
+            if content_length < 0:
+                raise ValueError("negative Content-Length")
+        except ValueError:
+            await self._send_error(writer, 400, "malformed request", keep_alive=False)
+            return False
+        if content_length > MAX_BODY_BYTES:
+            await self._send_error(writer, 413, "request body too large", keep_alive=False)
+            return False
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+
+        upload = method == "POST" and url.path == "/api/voice-search"
+        if upload:
+            stream = False
+            pending = self.voice_query(reader, headers, params)
+        else:
+            # Bodies of other requests are read and dropped, so the next request on the connection parses.
+            try:
+                async for _ in _read_body(reader, headers):
+                    pass
+            except HTTPError as error:
+                await self._send_error(writer, error.status, str(error), keep_alive=False)
+                return False
+            except asyncio.IncompleteReadError:
+                return False
+            if method != "GET":
+                await self._send_error(writer, 405, f"method {method} not allowed", keep_alive)
+                return keep_alive
+            if url.path == "/metrics":
+                await self._send(writer, 200, self.prometheus().encode("utf-8"), PROMETHEUS_TEXT, keep_alive)
+                return keep_alive
+            stream = NDJSON in headers.get("accept", "") or params.pop("format", [""])[0] == "ndjson"
+            pending = self.query(url.path, params, stream)
+        try:
+            result = await pending
+        except HTTPError as error:
+            # An upload refused part way leaves the rest of its body unread.
+            keep_alive = keep_alive and not upload
+            await self._send_error(writer, error.status, str(error), keep_alive)
+            return keep_alive
+        except Overloaded:
+            self._counters["rejected"] += 1
+            await self._send_error(writer, 503, "server overloaded, retry later", keep_alive, {"Retry-After": "1"})
+            return keep_alive
+        except Exception as error:
+            self._counters["errors"] += 1
+            report_error(url.path, error)
+            await self._send_error(writer, 500, "internal server error", keep_alive)
+            return keep_alive
+        if stream:
+            return await self._send_ndjson(writer, url.path, result, keep_alive)
+        await self._send(writer, 200, result, "application/json; charset=utf-8", keep_alive)
+        return keep_alive
+
+    async def _send(self, writer, status: int, body: bytes, content_type: str, keep_alive: bool,
+                    extra_headers: dict | None = None) -> None:
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body))}
+        headers.update(extra_headers or {})
+        writer.write(self._head(status, headers, keep_alive) + body)
+        await writer.drain()
+
+    async def _send_error(self, writer, status: int, message: str, keep_alive: bool, extra_headers=None) -> None:
+        await self._send(writer, status, _encode({"error": message}), "application/json; charset=utf-8",
+                         keep_alive, extra_headers)
+
+    async def _send_ndjson(self, writer, path: str, result, keep_alive: bool) -> bool:
+        """
+        Writes result as chunked NDJSON, one line per item of a list or PlaceStream, waiting for the client between batches.
+
+        Batches of STREAM_BATCH items are read and encoded in the executor, so a
+        stream's places are only materialized as fast as the client takes them.
+        A failure part way is reported like any other error; the response is cut
+        off without its final chunk, so the client sees it is incomplete.
+
+        Returns:
+            Whether the connection can be kept alive.
+        """
+        writer.write(self._head(200, {"Content-Type": NDJSON, "Transfer-Encoding": "chunked"}, keep_alive))
+        items = iter(result if isinstance(result, (list, PlaceStream)) else [result])
+        loop = asyncio.get_running_loop()
+
+        def next_chunk():
+            return b"".join(_encode(item) + b"\n" for item in itertools.islice(items, STREAM_BATCH))
+
+        while True:
+            try:
+                chunk = await loop.run_in_executor(self.executor, next_chunk)
+            except Exception as error:
+                self._counters["errors"] += 1
+                report_error(path, error)
+                return False
+            if not chunk:
+                break
+            writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            # drain() blocks while the client's socket buffer is full, so a slow
+            # reader holds back only its own response.
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    @staticmethod
+    def _head(status: int, headers: dict, keep_alive: bool) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS[status]}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.append("Access-Control-Allow-Origin: *")
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def serve(service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.Server:
+    """Starts serving service; use port 0 to pick a free port (see server.sockets)."""
+    return await asyncio.start_server(service.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.server", description="Serve the place search API over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--places", help="JSON array or JSON Lines file of places (default: the sample places)")
+    source.add_argument("--snapshot", help="snapshot file built with 'python -m app.snapshot build'")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT)
+    parser.add_argument("--metrics", action="store_true", help="collect query metrics, served on /metrics and /api/metrics")
+    parser.add_argument("--profile-every", type=int, default=0, metavar="N",
+                        help="with --metrics, also profile one call in N of each query function")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        set_instrumentation(Metrics(profile_every=args.profile_every))
+
+    if args.snapshot:
+        from .snapshot import open_snapshot
+        places = open_snapshot(args.snapshot)
+    elif args.places:
+        places = PlaceStore.from_json(args.places)
+    else:
+        places = None
+    service = QueryService(places, max_in_flight=args.max_in_flight, max_queue=args.max_queue,
+                           queue_timeout=args.queue_timeout)
+
+    async def run():
+        server = await serve(service, args.host, args.port)
+        print(f"Serving {len(service.store)} places on http://{args.host}:{args.port}/api")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(run())
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import heapq
+import itertools
+import math
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+from . import bitset
+from .activity_index import ActivityIndex
+from .bitmap_index import BitmapIndex
+from .clustering import ClusterIndex
+from .geo import box_distance_m, viewport_boxes
+from .instrumentation import count_rows, instrumented
+from .map_utils import _cluster_zoom, _clusters_response, _nearest
+from .place_store import PlaceStore
+from .snapshot import open_snapshot, write_snapshot
+from .spatial_index import SpatialIndex
+
+# Indexes written into each shard's snapshot: the ones the shard queries use.
+SHARD_INDEXES = ("spatial", "clusters", "activities")
+
+# Shard files go here when it exists, so mapping them is mapping shared memory.
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+
+def partition_rows(store: PlaceStore, n_shards: int) -> list[array]:
+    """
+    Splits the rows of store into geographic shards.
+
+    Places with coordinates are split as in a k-d tree: each split sorts the
+    rows along the wider of their longitude and latitude spans and cuts them
+    in proportion to the shards on either side, so shards hold similar
+    numbers of places over compact areas. Places without coordinates are
+    dealt round-robin, as only filter and activity queries can return them.
+
+    Returns:
+        n_shards arrays of ascending rows; some are empty when there are fewer places than shards.
+    """
+    lats, lons = store.latitudes, store.longitudes
+    located, unlocated = [], []
+    for row in range(len(store)):
+        # x == x is False only for NaN.
+        (located if lats[row] == lats[row] and lons[row] == lons[row] else unlocated).append(row)
+
+    shards: list[list[int]] = []
+
+    def split(rows: list[int], n: int) -> None:
+        if n == 1:
+            shards.append(rows)
+            return
+        if rows:
+            lon_span = max(lons[row] for row in rows) - min(lons[row] for row in rows)
+            lat_span = max(lats[row] for row in rows) - min(lats[row] for row in rows)
+            rows = sorted(rows, key=(lons if lon_span >= lat_span else lats).__getitem__)
+        left = n // 2
+        cut = len(rows) * left // n
+        split(rows[:cut], left)
+        split(rows[cut:], n - left)
+
+    split(located, n_shards)
+    for i, row in enumerate(unlocated):
+        shards[i % n_shards].append(row)
+    return [array("I", sorted(rows)) for rows in shards]
+
+def _extent(store: PlaceStore, rows) -> tuple[float, float, float, float] | None:
+    """The (min_lon, min_lat, max_lon, max_lat) box of the located rows, or None if there are none."""
+    lats, lons = store.latitudes, store.longitudes
+    located = [row for row in rows if lats[row] == lats[row] and lons[row] == lons[row]]
+    if not located:
+        return None
+    return (min(lons[row] for row in located), min(lats[row] for row in located),
+            max(lons[row] for row in located), max(lats[row] for row in located))
+
+def _overlaps(box, extent) -> bool:
+    min_lon, min_lat, max_lon, max_lat = box
+    return not (extent[0] > max_lon or extent[2] < min_lon or extent[1] > max_lat or extent[3] < min_lat)
+
+# Worker side. Each worker process maps every shard once, at startup; the
+# functions below answer one query on one shard, in global row numbers.
+
+_worker_shards: list[tuple[PlaceStore, memoryview]] = []
+
+def _open_shards(paths: list[tuple[str, str]]) -> None:
+    for snapshot_path, rows_path in paths:
+        with open(rows_path, "rb") as fp:
+            rows = memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)).cast("I")
+        _worker_shards.append((open_snapshot(snapshot_path), rows))
+
+def _shard_rows(shard: int, local_rows, scanned: int) -> tuple[list[int], list[dict], int]:
+    """Returns the global rows and places of local_rows, with the index entries read to find them."""
+    store, global_rows = _worker_shards[shard]
+    local_rows = list(local_rows)
+    return [global_rows[row] for row in local_rows], store.rows(local_rows), scanned
+
+def _filter_shard(shard: int, active_filters) -> tuple[list[int], list[dict], int]:
+    index = _worker_shards[shard][0].index(BitmapIndex)
+    return _shard_rows(shard, bitset.iter_indices(index.match(active_filters)), index.entries(active_filters))
+
+def _activity_shard(shard: int, activity: str) -> tuple[list[int], list[dict], int]:
+    index = _worker_shards[shard][0].index(ActivityIndex)
+    return _shard_rows(shard, index.lookup(activity), index.entries([activity]))
+
+def _viewport_shard(shard: int, north_east_corner, south_west_corner) -> tuple[list[int], list[dict], int]:
+    store = _worker_shards[shard][0]
+    return _shard_rows(shard, *store.index(SpatialIndex).scan(north_east_corner, south_west_corner))
+
+def _clusters_shard(shard: int, n_shards: int, zoom_level: int, north_east_corner, south_west_corner) -> list[dict]:
+    store, global_rows = _worker_shards[shard]
+    index = store.index(ClusterIndex)
+    features = index.get_clusters(_cluster_zoom(index, zoom_level), north_east_corner, south_west_corner)
+    for feature in features:
+        if "cluster_id" in feature:
+            # Interleave the shards' ids, keeping the expansion zoom in the low five bits.
+            cluster_id = feature["cluster_id"]
+            feature["cluster_id"] = (((cluster_id >> 5) * n_shards + shard) << 5) | (cluster_id & 31)
+        else:
+            feature["row"] = global_rows[feature["row"]]
+    return features
+
+def _nearest_shard(shard: int, latitude: float, longitude: float, k: int | None, max_distance: float,
+                   filters, activities) -> list[tuple[float, int, dict]]:
+    store, global_rows = _worker_shards[shard]
+    _, found = _nearest(store, latitude, longitude, k, max_distance, filters, activities, None)
+    places = store.rows(row for row, _ in found)
+    return [(meters, global_rows[row], place) for (row, meters), place in zip(found, places)]
+
+class ShardedPlaces:
+    """
+    A PlaceStore split into geographic shards and queried by a pool of worker processes.
+
+    Pure-Python scans are bound to one core by the GIL; here each query is
+    fanned out to the shards that can hold results and those run in parallel
+    in separate processes. Every shard is written as a snapshot file (see
+    snapshot.py) that each worker maps read-only, so the workers share one
+    copy of the columns and indexes through shared memory instead of being
+    sent pickled places. Only the results travel back.
+
+    Viewport and cluster queries go only to shards whose extent overlaps the
+    viewport, and nearest-place queries only to shards that can hold a place
+    closer than the k-th found so far. Results are merged in the parent:
+    row-ordered results with a heap merge of each shard's ascending rows and
+    nearest-first results with a heap merge of each shard's k best, so both
+    equal the unsharded answers. Clusters are computed per shard and do not
+    merge across shard boundaries; their ids are renumbered to stay unique.
+
+    Use as a context manager, or call close(), to stop the workers and remove
+    the shard files.
+
+    Args:
+        store: The places to serve.
+        n_shards: The number of shards. Defaults to the number of processes.
+        processes: The number of worker processes. Defaults to the CPU count.
+        directory: Where to write the shard files. Defaults to a temporary directory,
+                   in shared memory where available, removed by close().
+    """
+
+    def __init__(self, store: PlaceStore, n_shards: int | None = None, processes: int | None = None,
+                 directory: str | None = None):
+        self.store = store
+        processes = processes or os.cpu_count() or 1
+        n_shards = n_shards or processes
+        self._owns_directory = directory is None
+        if directory is None:
+            parent = SHARED_MEMORY_DIRECTORY if os.path.isdir(SHARED_MEMORY_DIRECTORY) else None
+            directory = tempfile.mkdtemp(prefix="wanderlust-shards-", dir=parent)
+        self.directory = directory
+
+        self.extents: list[tuple[float, float, float, float] | None] = []
+        paths = []
+        for rows in partition_rows(store, n_shards):
+            if not rows:
+                continue
+            number = len(paths)
+            snapshot_path = os.path.join(directory, f"shard-{number}.snap")
+            rows_path = os.path.join(directory, f"shard-{number}.rows")
+            write_snapshot(PlaceStore.from_dicts(store.rows(rows)), snapshot_path, SHARD_INDEXES)
+            with open(rows_path, "wb") as fp:
+                rows.tofile(fp)
+            paths.append((snapshot_path, rows_path))
+            self.extents.append(_extent(store, rows))
+        self.n_shards = len(paths)
+        self._executor = ProcessPoolExecutor(processes, initializer=_open_shards, initargs=(paths,))
+
+    def __enter__(self) -> "ShardedPlaces":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stops the worker processes and removes the shard files if they were written to a temporary directory."""
+        self._executor.shutdown()
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _fan_out(self, function, shards, *args) -> list:
+        futures = [self._executor.submit(function, shard, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+    def _merge_rows(self, results: list[tuple[list[int], list[dict], int]]) -> list[dict]:
+        """Merges per-shard (rows, places, scanned) results into one list of places in row order."""
+        if len(results) == 1:
+            return results[0][1]
+        merged = heapq.merge(*(zip(rows, places) for rows, places, _ in results), key=itemgetter(0))
+        return [place for _, place in merged]
+
+    def _shards_in_view(self, north_east_corner, south_west_corner) -> list[int]:
+        boxes = viewport_boxes(north_east_corner, south_west_corner)
+        return [
+            shard for shard, extent in enumerate(self.extents)
+            if extent is not None and any(_overlaps(box, extent) for box in boxes)
+        ]
+
+    @instrumented
+    def apply_filters(self, active_filters: set[str]) -> list[dict]:
+        """apply_filters across the shards."""
+        if not active_filters:
+            filtered_places = self.store.rows(range(len(self.store)))
+            count_rows("ShardedPlaces.apply_filters", len(filtered_places), len(filtered_places))
+            return filtered_places
+        results = self._fan_out(_filter_shard, range(self.n_shards), frozenset(active_filters))
+        filtered_places = self._merge_rows(results)
+        count_rows("ShardedPlaces.apply_filters", sum(result[2] for result in results), len(filtered_places))
+        return filtered_places
+
+    @instrumented
+    def activity_search(self, activity: str) -> list[dict]:
+        """activity_search across the shards."""
+        if not activity:
+            found_places = self.store.rows(range(len(self.store)))
+            count_rows("ShardedPlaces.activity_search", len(found_places), len(found_places))
+            return found_places
+        results = self._fan_out(_activity_shard, range(self.n_shards), activity)
+        found_places = self._merge_rows(results)
+        count_rows("ShardedPlaces.activity_search", sum(result[2] for result in results), len(found_places))
+        return found_places
+
+    @instrumented
+    def find_places_in_map_area(self, north_east_corner: tuple[float, float],
+                                south_west_corner: tuple[float, float]) -> list[dict]:
+        """find_places_in_map_area across the shards overlapping the viewport."""
+        shards = self._shards_in_view(north_east_corner, south_west_corner)
+        results = self._fan_out(_viewport_shard, shards, north_east_corner, south_west_corner)
+        visible_places = self._merge_rows(results) if results else []
+        count_rows("ShardedPlaces.find_places_in_map_area", sum(result[2] for result in results), len(visible_places))
+        return visible_places
+
+    @instrumented
+    def get_map_clusters(self, zoom_level: int, north_east_corner: tuple[float, float] | None = None,
+                         south_west_corner: tuple[float, float] | None = None, summary_only: bool = False) -> dict:
+        """get_map_clusters across the shards overlapping the viewport, clustering each shard separately."""
+        if north_east_corner is None or south_west_corner is None:
+            north_east_corner, south_west_corner = (90.0, 180.0), (-90.0, -180.0)
+        shards = self._shards_in_view(north_east_corner, south_west_corner)
+        results = self._fan_out(_clusters_shard, shards, self.n_shards, zoom_level, north_east_corner, south_west_corner)
+        features = list(itertools.chain.from_iterable(results))
+        if all(feature["count"] == 1 for feature in features):
+            features.sort(key=itemgetter("row"))
+        return _clusters_response(self.store, features, summary_only)
+
+    @instrumented
+    def nearest_places(self, latitude: float, longitude: float, k: int,
+                       filters: set[str] | None = None, activities: list[str] | None = None) -> list[dict]:
+        """nearest_places across the shards, merging each shard's k nearest."""
+        nearby_places = [place for _, _, place in self._nearest(latitude, longitude, k, math.inf, filters, activities)]
+        return nearby_places
+
+    @instrumented
+    def places_within_radius(self, latitude: float, longitude: float, meters: float,
+                             filters: set[str] | None = None, activities: list[str] | None = None) -> list[dict]:
+        """places_within_radius across the shards within the radius."""
+        nearby_places = [place for _, _, place in self._nearest(latitude, longitude, None, meters, filters, activities)]
+        return nearby_places
+
+    def _nearest(self, latitude, longitude, k, max_distance, filters, activities) -> list[tuple[float, int, dict]]:
+        if k is not None and k <= 0:
+            return []
+        bounds = sorted(
+            (bound, shard) for shard, extent in enumerate(self.extents)
+            if extent is not None and (bound := box_distance_m(latitude, longitude, *extent)) <= max_distance
+        )
+        if not bounds:
+            return []
+        args = (latitude, longitude, k, max_distance, filters, activities)
+        # Search the closest shard first: once it has k places, only shards that
+        # could hold one at most as far as its k-th need to be asked.
+        closest = self._fan_out(_nearest_shard, [bounds[0][1]], *args)
+        cutoff = closest[0][k - 1][0] if k is not None and len(closest[0]) >= k else max_distance
+        rest = self._fan_out(_nearest_shard, [shard for bound, shard in bounds[1:] if bound <= cutoff], *args)
+        merged = heapq.merge(*closest, *rest)
+        return list(merged if k is None else itertools.islice(merged, k))
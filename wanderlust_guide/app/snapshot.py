@@ -0,0 +1,501 @@
+import argparse
+import bisect
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping
+
+from . import bitset
+from .activity_index import ActivityIndex
+from .clustering import ClusterIndex, ClusterLevel
+from .name_index import NameIndex
+from .place_store import ListColumn, PlaceStore, StringColumn
+from .spatial_index import SpatialIndex, STRTree
+from .text_index import TextIndex
+
+# Memory-mapped binary snapshots of a PlaceStore and its prebuilt indexes.
+#
+# A snapshot file is laid out as:
+#
+# - a fixed prefix: magic bytes, format version, CRC32 and metadata length,
+# - JSON metadata: store attributes, index parameters and a section table,
+# - the sections: raw, 8-byte aligned arrays (columns, posting lists, tree nodes).
+#
+# open_snapshot() maps the file read-only and wraps every section in a
+# memoryview cast to its array type, so nothing is parsed or copied: opening
+# takes the same time for ten places or ten million, and processes that open
+# the same file share its physical pages through the OS page cache. Lookups
+# keyed by strings (exact names, text terms, activity tokens) or rows (extra
+# attributes) are stored as sorted tables searched by bisection instead of
+# dicts that would have to be rebuilt. Stores and indexes loaded from a
+# snapshot are read-only.
+#
+# Build a snapshot from JSON or JSON Lines input with:
+#
+#     python -m app.snapshot build places.jsonl places.snap
+
+MAGIC = b"WLGSNAP\0"
+FORMAT_VERSION = 2
+
+# magic, format version, CRC32 of everything after the prefix, metadata length
+_PREFIX = struct.Struct("<8sIIQ")
+_ALIGNMENT = 8
+
+class SnapshotError(ValueError):
+    """Raised for files that are not valid snapshots of a supported format version."""
+
+class StringArray:
+    """
+    Read-only sequence of strings stored as offset-encoded UTF-8.
+
+    Supports len() and indexing, so sorted string tables can be searched with
+    the bisect module without decoding more than log(n) strings.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @staticmethod
+    def encode(strings) -> tuple[bytes, array]:
+        """Returns the (data, offsets) encoding of strings."""
+        data = bytearray()
+        offsets = array("Q", [0])
+        for string in strings:
+            data += string.encode("utf-8")
+            offsets.append(len(data))
+        return bytes(data), offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string index out of range")
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+class SortedMap(Mapping):
+    """
+    Read-only mapping over a sorted sequence of keys, such as a StringArray.
+
+    value_at(pos) returns the value of the key at position pos; lookups are
+    a binary search over the keys.
+    """
+
+    def __init__(self, sorted_keys, value_at):
+        self.sorted_keys = sorted_keys
+        self._value_at = value_at
+
+    def _position(self, key) -> int:
+        keys = self.sorted_keys
+        try:
+            pos = bisect.bisect_left(keys, key)
+        except TypeError: # Not comparable with the keys, so not one of them
+            return -1
+        return pos if pos < len(keys) and keys[pos] == key else -1
+
+    def __getitem__(self, key):
+        pos = self._position(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self._value_at(pos)
+
+    def __contains__(self, key) -> bool:
+        return self._position(key) >= 0
+
+    def __iter__(self):
+        return iter(self.sorted_keys)
+
+    def __len__(self) -> int:
+        return len(self.sorted_keys)
+
+class _Writer:
+    """Collects named sections and metadata, then writes them out as one file."""
+
+    def __init__(self):
+        self.sections: dict[str, tuple[int, int, str]] = {}
+        self.chunks: list[bytes] = []
+        self.size = 0
+
+    def add(self, name: str, values, typecode: str = "B") -> None:
+        data = values.tobytes() if isinstance(values, array) else bytes(values)
+        padding = -self.size % _ALIGNMENT
+        if padding:
+            self.chunks.append(bytes(padding))
+            self.size += padding
+        self.sections[name] = (self.size, len(data), typecode)
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def add_array(self, name: str, values: array) -> None:
+        self.add(name, values, values.typecode)
+
+    def add_strings(self, name: str, strings) -> None:
+        data, offsets = StringArray.encode(strings)
+        self.add(name + ".data", data)
+        self.add_array(name + ".offsets", offsets)
+
+    def write(self, path, metadata: dict) -> None:
+        metadata = dict(metadata, byteorder=sys.byteorder, sections=self.sections)
+        header = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+        header += b" " * (-(_PREFIX.size + len(header)) % _ALIGNMENT)
+        checksum = zlib.crc32(header)
+        for chunk in self.chunks:
+            checksum = zlib.crc32(chunk, checksum)
+        with open(path, "wb") as fp:
+            fp.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, checksum, len(header)))
+            fp.write(header)
+            for chunk in self.chunks:
+                fp.write(chunk)
+
+class _Reader:
+    """Zero-copy access to the sections of a mapped snapshot file."""
+
+    def __init__(self, path, verify: bool):
+        with open(path, "rb") as fp:
+            prefix = fp.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                raise SnapshotError(f"{path}: file too short for a snapshot")
+            magic, version, checksum, header_length = _PREFIX.unpack(prefix)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path}: not a place snapshot")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"{path}: snapshot format version {version}, expected {FORMAT_VERSION}")
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if verify and zlib.crc32(self.view[_PREFIX.size:]) != checksum:
+            raise SnapshotError(f"{path}: checksum mismatch, the snapshot is corrupt")
+        header_end = _PREFIX.size + header_length
+        try:
+            self.metadata = json.loads(bytes(self.view[_PREFIX.size:header_end]))
+        except ValueError as error:
+            raise SnapshotError(f"{path}: unreadable snapshot metadata") from error
+        if self.metadata["byteorder"] != sys.byteorder:
+            raise SnapshotError(f"{path}: snapshot was written on a {self.metadata['byteorder']}-endian machine")
+        self.payload = self.view[header_end:]
+        self.sections = self.metadata["sections"]
+
+    def get(self, name: str):
+        offset, length, typecode = self.sections[name]
+        return self.payload[offset:offset + length].cast(typecode)
+
+    def get_strings(self, name: str) -> StringArray:
+        return StringArray(self.get(name + ".data"), self.get(name + ".offsets"))
+
+def _write_bits(writer: _Writer, name: str, bits: bitset.BitArray) -> None:
+    writer.add(name, bits.data)
+
+def _read_bits(reader: _Reader, name: str) -> bitset.BitArray:
+    bits = bitset.BitArray()
+    bits.data = reader.get(name)
+    bits._int = None
+    return bits
+
+def _write_store(writer: _Writer, store: PlaceStore) -> dict:
+    writer.add_array("latitudes", store.latitudes)
+    writer.add_array("longitudes", store.longitudes)
+    for name in ("names", "descriptions"):
+        column = getattr(store, name)
+        writer.add(name + ".data", column.data)
+        writer.add_array(name + ".offsets", column.offsets)
+        _write_bits(writer, name + ".present", column.present)
+    activities = store.activities
+    writer.add_array("activities.values", activities.values)
+    writer.add_array("activities.offsets", activities.offsets)
+    _write_bits(writer, "activities.present", activities.present)
+    for i, (true_bits, present_bits) in enumerate(store._bool_columns.values()):
+        _write_bits(writer, f"bools.{i}.true", true_bits)
+        _write_bits(writer, f"bools.{i}.present", present_bits)
+    # Extras are decoded one row at a time, when the row is read.
+    extra_rows = sorted(store._extras)
+    writer.add_array("extras.rows", array("q", extra_rows))
+    writer.add_strings("extras", (json.dumps(store._extras[row], separators=(",", ":")) for row in extra_rows))
+    return {
+        "size": len(store),
+        "version": store.version,
+        "vocabulary": activities.vocabulary,
+        "bool_keys": list(store._bool_columns),
+        "extra_keys": sorted(store._extra_keys),
+    }
+
+def _read_store(reader: _Reader, metadata: dict) -> PlaceStore:
+    store = PlaceStore()
+    store.latitudes = reader.get("latitudes")
+    store.longitudes = reader.get("longitudes")
+    for name in ("names", "descriptions"):
+        column = StringColumn()
+        column.data = reader.get(name + ".data")
+        column.offsets = reader.get(name + ".offsets")
+        column.present = _read_bits(reader, name + ".present")
+        setattr(store, name, column)
+    activities = ListColumn()
+    activities.vocabulary = metadata["vocabulary"]
+    activities.ids = {term: term_id for term_id, term in enumerate(activities.vocabulary)}
+    activities.values = reader.get("activities.values")
+    activities.offsets = reader.get("activities.offsets")
+    activities.present = _read_bits(reader, "activities.present")
+    store.activities = activities
+    for i, key in enumerate(metadata["bool_keys"]):
+        store._bool_columns[key] = (_read_bits(reader, f"bools.{i}.true"), _read_bits(reader, f"bools.{i}.present"))
+    extras = reader.get_strings("extras")
+    store._extras = SortedMap(reader.get("extras.rows"), lambda pos: json.loads(extras[pos]))
+    store._extra_keys = set(metadata["extra_keys"])
+    store.version = metadata["version"]
+    return store
+
+def _write_tree(writer: _Writer, name: str, tree: STRTree) -> dict:
+    writer.add_array(name + ".ids", tree.ids)
+    writer.add_array(name + ".packed_xs", tree.packed_xs)
+    writer.add_array(name + ".packed_ys", tree.packed_ys)
+    for level, boxes in enumerate(tree.levels):
+        for side, values in zip(("min_x", "min_y", "max_x", "max_y"), boxes):
+            writer.add_array(f"{name}.levels.{level}.{side}", values)
+    return {"node_size": tree.node_size, "levels": len(tree.levels)}
+
+def _read_tree(reader: _Reader, name: str, metadata: dict, xs, ys) -> STRTree:
+    tree = STRTree.__new__(STRTree)
+    tree.xs = xs
+    tree.ys = ys
+    tree.node_size = metadata["node_size"]
+    tree.backend = None
+    tree._sorted_levels = None
+    tree.ids = reader.get(name + ".ids")
+    tree.packed_xs = reader.get(name + ".packed_xs")
+    tree.packed_ys = reader.get(name + ".packed_ys")
+    tree.levels = [
+        tuple(reader.get(f"{name}.levels.{level}.{side}") for side in ("min_x", "min_y", "max_x", "max_y"))
+        for level in range(metadata["levels"])
+    ]
+    return tree
+
+def _write_spatial(writer: _Writer, index: SpatialIndex) -> dict:
+    return _write_tree(writer, "spatial", index.tree)
+
+def _read_spatial(reader: _Reader, metadata: dict, store: PlaceStore) -> SpatialIndex:
+    return SpatialIndex(store, _read_tree(reader, "spatial", metadata, store.longitudes, store.latitudes))
+
+def _write_clusters(writer: _Writer, index: ClusterIndex) -> dict:
+    # Zoom levels where nothing merges share the level object above; store it once.
+    level_numbers: dict[int, int] = {}
+    levels = {}
+    trees = []
+    for zoom, level in sorted(index.levels.items()):
+        number = level_numbers.get(id(level))
+        if number is None:
+            number = level_numbers[id(level)] = len(level_numbers)
+            name = f"clusters.{number}"
+            for column in ("xs", "ys", "counts", "ids", "expansion_zooms"):
+                writer.add_array(f"{name}.{column}", getattr(level, column))
+            trees.append(_write_tree(writer, name + ".tree", level.tree))
+        levels[zoom] = number
+    return {
+        "radius": index.radius, "extent": index.extent,
+        "min_zoom": index.min_zoom, "max_zoom": index.max_zoom,
+        "levels": levels, "trees": trees,
+    }
+
+def _read_clusters(reader: _Reader, metadata: dict, store: PlaceStore) -> ClusterIndex:
+    index = ClusterIndex.__new__(ClusterIndex)
+    index.places = store
+    index.size = len(store)
+    index.radius = metadata["radius"]
+    index.extent = metadata["extent"]
+    index.min_zoom = metadata["min_zoom"]
+    index.max_zoom = metadata["max_zoom"]
+    index.backend = None
+    levels = []
+    for number, tree in enumerate(metadata["trees"]):
+        name = f"clusters.{number}"
+        level = ClusterLevel.__new__(ClusterLevel)
+        for column in ("xs", "ys", "counts", "ids", "expansion_zooms"):
+            setattr(level, column, reader.get(f"{name}.{column}"))
+        level.tree = _read_tree(reader, name + ".tree", tree, level.xs, level.ys)
+        levels.append(level)
+    index.levels = {int(zoom): levels[number] for zoom, number in metadata["levels"].items()}
+    return index
+
+def _write_postings(writer: _Writer, name: str, postings: dict, columns) -> None:
+    """Writes a str -> posting list dict as sorted keys plus flat arrays of its columns."""
+    keys = sorted(postings)
+    writer.add_strings(name + ".keys", keys)
+    offsets = array("Q", [0])
+    flat = [array(typecode) for typecode in columns]
+    for key in keys:
+        lists = postings[key] if len(columns) > 1 else (postings[key],)
+        for values, posting in zip(flat, lists):
+            values.extend(posting)
+        offsets.append(len(flat[0]))
+    writer.add_array(name + ".offsets", offsets)
+    for i, values in enumerate(flat):
+        writer.add_array(f"{name}.{i}", values)
+
+def _read_postings(reader: _Reader, name: str, n_columns: int) -> SortedMap:
+    offsets = reader.get(name + ".offsets")
+    flat = [reader.get(f"{name}.{i}") for i in range(n_columns)]
+    if n_columns == 1:
+        values = flat[0]
+        return SortedMap(reader.get_strings(name + ".keys"),
+                         lambda pos: values[offsets[pos]:offsets[pos + 1]])
+    return SortedMap(reader.get_strings(name + ".keys"),
+                     lambda pos: tuple(values[offsets[pos]:offsets[pos + 1]] for values in flat))
+
+def _write_activities(writer: _Writer, index: ActivityIndex) -> dict:
+    _write_postings(writer, "activities.postings", index.postings, "I")
+    return {}
+
+def _read_activities(reader: _Reader, metadata: dict, store: PlaceStore) -> ActivityIndex:
+    return ActivityIndex(store, _read_postings(reader, "activities.postings", 1))
+
+def _write_names(writer: _Writer, index: NameIndex) -> dict:
+    exact = sorted(index.exact.items())
+    writer.add_strings("names.exact", (name for name, _ in exact))
+    writer.add_array("names.exact_rows", array("I", (row for _, row in exact)))
+    writer.add_strings("names.keys", index.keys)
+    writer.add_array("names.key_rows", index.key_rows)
+    writer.add_array("names.popularity", index.popularity)
+    ranges = sorted(index.top_by_range)
+    writer.add_array("names.top.first", array("I", (first for first, _ in ranges)))
+    writer.add_array("names.top.end", array("I", (end for _, end in ranges)))
+    offsets, top = array("Q", [0]), array("I")
+    for key in ranges:
+        top.extend(index.top_by_range[key])
+        offsets.append(len(top))
+    writer.add_array("names.top.offsets", offsets)
+    writer.add_array("names.top", top)
+    writer.add_array("names.unlocated", index.unlocated)
+    metadata = {"popularity_key": index.popularity_key, "tree": None}
+    if index.tree is not None:
+        writer.add_array("names.lats", index.tree.ys)
+        writer.add_array("names.lons", index.tree.xs)
+        for level, positions in enumerate(index.tree.sorted_levels()):
+            writer.add_array(f"names.cells.{level}", positions)
+        metadata["tree"] = _write_tree(writer, "names.tree", index.tree)
+    return metadata
+
+def _read_names(reader: _Reader, metadata: dict, store: PlaceStore) -> NameIndex:
+    index = NameIndex.__new__(NameIndex)
+    index.places = store
+    index.size = len(store)
+    index.popularity_key = metadata["popularity_key"]
+    exact_rows = reader.get("names.exact_rows")
+    index.exact = SortedMap(reader.get_strings("names.exact"), exact_rows.__getitem__)
+    index.keys = reader.get_strings("names.keys")
+    index.key_rows = reader.get("names.key_rows")
+    index.popularity = reader.get("names.popularity")
+    offsets, top = reader.get("names.top.offsets"), reader.get("names.top")
+    index.top_by_range = {
+        (first, end): top[offsets[i]:offsets[i + 1]]
+        for i, (first, end) in enumerate(zip(reader.get("names.top.first"), reader.get("names.top.end")))
+    }
+    index.unlocated = reader.get("names.unlocated")
+    index.tree = None
+    if metadata["tree"] is not None:
+        index.tree = _read_tree(reader, "names.tree", metadata["tree"], reader.get("names.lons"), reader.get("names.lats"))
+        index.tree._sorted_levels = [reader.get(f"names.cells.{level}") for level in range(metadata["tree"]["levels"])]
+    return index
+
+def _write_text(writer: _Writer, index: TextIndex) -> dict:
+    _write_postings(writer, "text.postings", index.postings, "If")
+    writer.add_array("text.max_scores", array("d", (index.max_scores[term] for term in sorted(index.postings))))
+    writer.add_array("text.doc_lengths", index.doc_lengths)
+    return {"avg_doc_length": index.avg_doc_length}
+
+def _read_text(reader: _Reader, metadata: dict, store: PlaceStore) -> TextIndex:
+    index = TextIndex.__new__(TextIndex)
+    index.places = store
+    index.size = len(store)
+    index.postings = _read_postings(reader, "text.postings", 2)
+    index.max_scores = SortedMap(index.postings.sorted_keys, reader.get("text.max_scores").__getitem__)
+    index.doc_lengths = reader.get("text.doc_lengths")
+    index.avg_doc_length = metadata["avg_doc_length"]
+    index._bitmaps = {}
+    return index
+
+# name -> (index class, writer, reader); BitmapIndex is left out because its
+# bitsets are read straight from the store's bool columns.
+INDEXES = {
+    "spatial": (SpatialIndex, _write_spatial, _read_spatial),
+    "clusters": (ClusterIndex, _write_clusters, _read_clusters),
+    "activities": (ActivityIndex, _write_activities, _read_activities),
+    "names": (NameIndex, _write_names, _read_names),
+    "text": (TextIndex, _write_text, _read_text),
+}
+
+def write_snapshot(store: PlaceStore, path, indexes=None) -> None:
+    """
+    Writes store and its indexes to a snapshot file.
+
+    Args:
+        store: The places to write.
+        path: The output file path.
+        indexes: Names from INDEXES to prebuild and include; defaults to all of them.
+                 Indexes are taken from the store's cache, so ones already built are reused.
+    """
+    writer = _Writer()
+    metadata = {"store": _write_store(writer, store), "indexes": {}}
+    for name in INDEXES if indexes is None else indexes:
+        index_cls, write, _ = INDEXES[name]
+        metadata["indexes"][name] = write(writer, store.index(index_cls))
+    writer.write(path, metadata)
+
+def open_snapshot(path, verify: bool = False) -> PlaceStore:
+    """
+    Maps a snapshot file and returns its read-only PlaceStore, with the stored indexes cached.
+
+    Args:
+        path: The snapshot file path.
+        verify: Whether to check the CRC32 first. This reads the whole file,
+                so it is off by default to keep opening O(1); use it (or the
+                ``verify`` command) after copying snapshots between machines.
+
+    Returns:
+        A PlaceStore whose columns and indexes are views into the mapped file.
+
+    Raises:
+        SnapshotError: If the file is not a snapshot, was written by another format
+                       version or byte order, or fails verification.
+    """
+    reader = _Reader(path, verify)
+    store = _read_store(reader, reader.metadata["store"])
+    for name, index_metadata in reader.metadata["indexes"].items():
+        index_cls, _, read = INDEXES[name]
+        store._indexes[index_cls] = (store.version, read(reader, index_metadata, store))
+    return store
+
+def verify_snapshot(path) -> dict:
+    """Checks a snapshot's format and checksum, returning its metadata; raises SnapshotError if invalid."""
+    return _Reader(path, verify=True).metadata
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.snapshot", description="Build and check place snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a snapshot from a JSON array or JSON Lines file")
+    build.add_argument("input")
+    build.add_argument("output")
+    build.add_argument("--index", action="append", choices=sorted(INDEXES), dest="indexes",
+                       help="index to include (repeatable); defaults to all")
+    check = commands.add_parser("verify", help="check a snapshot's format version and checksum")
+    check.add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        store = PlaceStore.from_json(args.input)
+        write_snapshot(store, args.output, args.indexes)
+        print(f"Wrote {len(store)} places to {args.output}.")
+        return 0
+    try:
+        metadata = verify_snapshot(args.snapshot)
+    except (SnapshotError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(f"{args.snapshot}: format {FORMAT_VERSION}, {metadata['store']['size']} places, "
+          f"indexes: {', '.join(metadata['indexes']) or 'none'}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+import heapq
+import math
+from array import array
+from bisect import bisect_right
+
+from . import vectorized
+from .geo import box_distance_m, haversine_m, viewport_boxes
+from .place_store import PlaceStore, take
+
+DEFAULT_NODE_SIZE = 16
+
+class STRTree:
+    """
+    Static R-tree over points, bulk-loaded with Sort-Tile-Recursive packing.
+
+    Points are sorted into vertical slices by x, each slice is sorted by y,
+    and runs of node_size points become leaves. Parent levels group runs of
+    node_size consecutive nodes. Because grouping is consecutive, node i on
+    level k covers exactly the points at positions
+    [i * node_size ** (k + 1), (i + 1) * node_size ** (k + 1)) of ``ids``,
+    which lets a query take a fully covered node's points as one slice.
+
+    Points with a NaN coordinate are left out. With the NumPy backend the
+    sorting and leaf boxes are computed vectorized, giving the same tree.
+    """
+
+    def __init__(self, xs, ys, node_size: int = DEFAULT_NODE_SIZE, backend: str | None = None):
+        self.xs = xs
+        self.ys = ys
+        self.node_size = node_size
+        self.backend = backend
+        self.ids = array("I")
+        self.packed_xs = array("d")
+        self.packed_ys = array("d")
+        # levels[k] = (min_x, min_y, max_x, max_y) arrays for nodes on level k; level 0 holds leaves.
+        self.levels: list[tuple[array, array, array, array]] = []
+        self._sorted_levels: list[array] | None = None
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _build(self) -> None:
+        if vectorized.use_numpy(self.backend):
+            packed = vectorized.str_pack(self.xs, self.ys, self.node_size)
+            if packed is None:
+                return
+            self.ids, self.packed_xs, self.packed_ys, leaf_boxes = packed
+            self.levels.append(leaf_boxes)
+        else:
+            self._pack()
+        self._build_parents()
+
+    def _pack(self) -> None:
+        xs, ys, node_size = self.xs, self.ys, self.node_size
+        # x == x is False only for NaN.
+        valid = [i for i, x, y in zip(range(len(xs)), xs, ys) if x == x and y == y]
+        n = len(valid)
+        if not n:
+            return
+        valid.sort(key=xs.__getitem__)
+        n_leaves = -(-n // node_size)
+        slice_size = node_size * math.ceil(math.sqrt(n_leaves))
+        ids = array("I")
+        for start in range(0, n, slice_size):
+            ids.extend(sorted(valid[start:start + slice_size], key=ys.__getitem__))
+        self.ids = ids
+        # Coordinates copied into tree order so leaf scans read memory sequentially.
+        self.packed_xs = packed_xs = array("d", map(xs.__getitem__, ids))
+        self.packed_ys = packed_ys = array("d", map(ys.__getitem__, ids))
+
+        min_x, min_y, max_x, max_y = array("d"), array("d"), array("d"), array("d")
+        for start in range(0, n, node_size):
+            end = start + node_size
+            leaf_x = packed_xs[start:end]
+            leaf_y = packed_ys[start:end]
+            min_x.append(min(leaf_x))
+            min_y.append(min(leaf_y))
+            max_x.append(max(leaf_x))
+            max_y.append(max(leaf_y))
+        self.levels.append((min_x, min_y, max_x, max_y))
+
+    def _build_parents(self) -> None:
+        if not self.levels:
+            return
+        node_size = self.node_size
+        min_x, min_y, max_x, max_y = self.levels[0]
+        while len(min_x) > 1:
+            child = (min_x, min_y, max_x, max_y)
+            min_x, min_y, max_x, max_y = array("d"), array("d"), array("d"), array("d")
+            for start in range(0, len(child[0]), node_size):
+                end = start + node_size
+                min_x.append(min(child[0][start:end]))
+                min_y.append(min(child[1][start:end]))
+                max_x.append(max(child[2][start:end]))
+                max_y.append(max(child[3][start:end]))
+            self.levels.append((min_x, min_y, max_x, max_y))
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> list[int]:
+        """
+        Returns the ids of points inside the box, edges included, in tree order.
+
+        Nodes that lie entirely inside the box contribute all their points at
+        once; only partially overlapping leaves test individual points.
+        """
+        return self.scan(min_x, min_y, max_x, max_y)[0]
+
+    def scan(self, min_x: float, min_y: float, max_x: float, max_y: float) -> tuple[list[int], int]:
+        """
+        Like query, but also returns how many leaf entries were read: every
+        point taken from a contained node plus every point tested in a
+        partially overlapping leaf.
+        """
+        if not self.levels:
+            return [], 0
+        ids, xs, ys, node_size = self.ids, self.packed_xs, self.packed_ys, self.node_size
+        n = len(ids)
+        result = []
+        read = 0
+        nodes = range(len(self.levels[-1][0]))
+        for level in range(len(self.levels) - 1, -1, -1):
+            n_min_x, n_min_y, n_max_x, n_max_y = self.levels[level]
+            span = node_size ** (level + 1)
+            next_nodes = []
+            for node in nodes:
+                nx0, ny0, nx1, ny1 = n_min_x[node], n_min_y[node], n_max_x[node], n_max_y[node]
+                if nx0 > max_x or nx1 < min_x or ny0 > max_y or ny1 < min_y:
+                    continue
+                if min_x <= nx0 and nx1 <= max_x and min_y <= ny0 and ny1 <= max_y:
+                    inside = ids[node * span:min(n, (node + 1) * span)]
+                    read += len(inside)
+                    result.extend(inside)
+                elif level:
+                    first = node * node_size
+                    next_nodes.extend(range(first, min(first + node_size, len(self.levels[level - 1][0]))))
+                else:
+                    leaf = range(node * span, min(n, (node + 1) * span))
+                    read += len(leaf)
+                    for pos in leaf:
+                        if min_x <= xs[pos] <= max_x and min_y <= ys[pos] <= max_y:
+                            result.append(ids[pos])
+            nodes = next_nodes
+        return result, read
+
+    def sorted_levels(self) -> list[array]:
+        """
+        Returns, for every level, the ids under each node in ascending order.
+
+        sorted_levels()[k] lists node after node the same ids as the node's
+        slice of ``ids``, sorted, so a node's ids above a bound are found by
+        binary search. Built on first use.
+        """
+        if self._sorted_levels is None:
+            ids, node_size = self.ids, self.node_size
+            sorted_levels = []
+            for level in range(len(self.levels)):
+                span = node_size ** (level + 1)
+                level_ids = array("I")
+                for start in range(0, len(ids), span):
+                    level_ids.extend(sorted(ids[start:start + span]))
+                sorted_levels.append(level_ids)
+            self._sorted_levels = sorted_levels
+        return self._sorted_levels
+
+    def query_after(self, min_x: float, min_y: float, max_x: float, max_y: float, after: int = -1):
+        """
+        Yields the ids of points inside the box greater than after, ascending.
+
+        A best-first search keyed by the smallest id above after under each
+        node, read from sorted_levels(), which is a lower bound for the ids it
+        can contribute. An id is yielded once it is the smallest key in the
+        queue, so reading only the first k expands only the nodes that could
+        hold them, and resuming after the last id read skips everything
+        before it. Nodes entirely inside the box stream their sorted ids.
+        """
+        if not self.levels:
+            return
+        sorted_levels = self.sorted_levels()
+        ids, xs, ys, node_size = self.ids, self.packed_xs, self.packed_ys, self.node_size
+        n = len(ids)
+        # Entries are (key, kind, level, first, last): a node to expand (kind 0), the
+        # sorted ids [first, last) of a node inside the box (kind 1), or a point (kind 2).
+        queue = []
+
+        def push(node, level):
+            n_min_x, n_min_y, n_max_x, n_max_y = self.levels[level]
+            nx0, ny0, nx1, ny1 = n_min_x[node], n_min_y[node], n_max_x[node], n_max_y[node]
+            if nx0 > max_x or nx1 < min_x or ny0 > max_y or ny1 < min_y:
+                return
+            span = node_size ** (level + 1)
+            level_ids = sorted_levels[level]
+            last = min(n, (node + 1) * span)
+            first = bisect_right(level_ids, after, node * span, last)
+            if first == last:
+                return
+            inside = min_x <= nx0 and nx1 <= max_x and min_y <= ny0 and ny1 <= max_y
+            heapq.heappush(queue, (level_ids[first], 1 if inside else 0, level, first if inside else node, last))
+
+        top = len(self.levels) - 1
+        for node in range(len(self.levels[top][0])):
+            push(node, top)
+        while queue:
+            key, kind, level, first, last = heapq.heappop(queue)
+            if kind == 2:
+                yield key
+            elif kind == 1:
+                yield key
+                if first + 1 < last:
+                    heapq.heappush(queue, (sorted_levels[level][first + 1], 1, level, first + 1, last))
+            elif level:
+                child = first * node_size
+                for node in range(child, min(child + node_size, len(self.levels[level - 1][0]))):
+                    push(node, level - 1)
+            else:
+                for pos in range(first * node_size, min(n, (first + 1) * node_size)):
+                    point_id = ids[pos]
+                    if point_id > after and min_x <= xs[pos] <= max_x and min_y <= ys[pos] <= max_y:
+                        heapq.heappush(queue, (point_id, 2, 0, 0, 0))
+
+    def estimate(self, min_x: float, min_y: float, max_x: float, max_y: float, max_nodes: int = 1024) -> float:
+        """
+        Estimates how many points query() would return, without visiting them.
+
+        Uses the deepest level with at most max_nodes nodes, counting each
+        overlapping node's points in proportion to the overlapping part of
+        its bounding box, as if points were spread evenly within it.
+        """
+        if not self.levels:
+            return 0.0
+        level = next(k for k in range(len(self.levels)) if len(self.levels[k][0]) <= max_nodes)
+        n_min_x, n_min_y, n_max_x, n_max_y = self.levels[level]
+        span = self.node_size ** (level + 1)
+        n = len(self.ids)
+        total = 0.0
+        for node in range(len(n_min_x)):
+            nx0, ny0, nx1, ny1 = n_min_x[node], n_min_y[node], n_max_x[node], n_max_y[node]
+            if nx0 > max_x or nx1 < min_x or ny0 > max_y or ny1 < min_y:
+                continue
+            fraction = 1.0
+            if nx1 > nx0:
+                fraction *= (min(nx1, max_x) - max(nx0, min_x)) / (nx1 - nx0)
+            if ny1 > ny0:
+                fraction *= (min(ny1, max_y) - max(ny0, min_y)) / (ny1 - ny0)
+            total += fraction * (min(n, (node + 1) * span) - node * span)
+        return total
+
+    def nearest(self, point_distance, box_distance, accept=None):
+        """
+        Yields (id, distance) pairs in ascending distance (best-first search).
+
+        Nodes and points share one priority queue keyed by distance, where a
+        node's key is box_distance of its bounding box, a lower bound for every
+        point under it. A point popped from the queue is therefore closer than
+        anything still unexplored, so stopping after k results or past a
+        maximum distance only ever expands the nodes that could contain them.
+
+        Args:
+            point_distance: Function of (x, y) giving the distance to a point.
+            box_distance: Function of (min_x, min_y, max_x, max_y) giving a lower
+                          bound of the distance to any point in the box.
+            accept: Optional function of an id; points it rejects are skipped as
+                    their leaf is expanded, so they never enter the queue.
+        """
+        if not self.levels:
+            return
+        ids, xs, ys, node_size = self.ids, self.packed_xs, self.packed_ys, self.node_size
+        n = len(ids)
+        top = len(self.levels) - 1
+        n_min_x, n_min_y, n_max_x, n_max_y = self.levels[top]
+        # Entries are (distance, is_point, node or id, level). On equal distance a
+        # node is expanded before a point is returned, and points tie by id.
+        queue = [
+            (box_distance(n_min_x[node], n_min_y[node], n_max_x[node], n_max_y[node]), 0, node, top)
+            for node in range(len(n_min_x))
+        ]
+        heapq.heapify(queue)
+        while queue:
+            distance, is_point, item, level = heapq.heappop(queue)
+            if is_point:
+                yield item, distance
+            elif level:
+                n_min_x, n_min_y, n_max_x, n_max_y = self.levels[level - 1]
+                first = item * node_size
+                for node in range(first, min(first + node_size, len(n_min_x))):
+                    box = box_distance(n_min_x[node], n_min_y[node], n_max_x[node], n_max_y[node])
+                    heapq.heappush(queue, (box, 0, node, level - 1))
+            else:
+                for pos in range(item * node_size, min(n, (item + 1) * node_size)):
+                    point_id = ids[pos]
+                    if accept is None or accept(point_id):
+                        heapq.heappush(queue, (point_distance(xs[pos], ys[pos]), 1, point_id, 0))
+
+def coordinate_columns(places: list[dict] | PlaceStore) -> tuple[array, array]:
+    """Returns (latitudes, longitudes) as float arrays with NaN for missing coordinates."""
+    if isinstance(places, PlaceStore):
+        return places.latitudes, places.longitudes
+    lats, lons = array("d"), array("d")
+    for place in places:
+        lat = place.get("latitude")
+        lon = place.get("longitude")
+        missing = lat is None or lon is None
+        lats.append(math.nan if missing else lat)
+        lons.append(math.nan if missing else lon)
+    return lats, lons
+
+def scan_nearest(lats, lons, latitude: float, longitude: float, rows=None, k: int | None = None,
+                 max_distance: float = math.inf, backend: str | None = None) -> list[tuple[int, float]]:
+    """
+    Nearest rows found by computing the distance of every candidate.
+
+    The fallback when there is no spatial index, or when so few candidates are
+    left after filtering that measuring them all beats traversing the tree.
+
+    Args:
+        lats, lons: Coordinate columns with NaN for missing values.
+        latitude, longitude: The query point.
+        rows: Candidate rows in ascending order, or None for every row.
+        k: The maximum number of results, or None for no limit.
+        max_distance: Rows farther than this many meters are left out.
+        backend: "python" or "numpy", or None for vectorized.get_backend().
+
+    Returns:
+        (row, meters) pairs in ascending distance; ties go to the lower row.
+    """
+    if vectorized.use_numpy(backend):
+        return vectorized.nearest_rows(lats, lons, latitude, longitude, rows, k, max_distance)
+    if rows is None:
+        rows = range(len(lats))
+    found = []
+    for row in rows:
+        lat = lats[row]
+        lon = lons[row]
+        if lat == lat and lon == lon: # Not NaN
+            distance = haversine_m(latitude, longitude, lat, lon)
+            if distance <= max_distance:
+                found.append((distance, row))
+    if k is None:
+        found.sort()
+    else:
+        found = heapq.nsmallest(k, found)
+    return [(row, distance) for distance, row in found]
+
+class SpatialIndex:
+    """
+    Bounding-box index over place coordinates.
+
+    Wraps an STRTree keyed by (longitude, latitude) and answers map viewport
+    queries with the same places, in the same order, as a linear scan, and
+    nearest-neighbour queries by great-circle distance.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore, tree: STRTree):
+        self.places = places
+        self.size = len(places)
+        self.tree = tree
+
+    @classmethod
+    def from_places(cls, places: list[dict] | PlaceStore, node_size: int = DEFAULT_NODE_SIZE,
+                    backend: str | None = None) -> "SpatialIndex":
+        """Bulk-builds the index over a list of place dictionaries or a PlaceStore."""
+        lats, lons = coordinate_columns(places)
+        return cls(places, STRTree(lons, lats, node_size, backend))
+
+    def query(self, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> list[int]:
+        """
+        Returns the sorted rows inside a map viewport.
+
+        Viewports crossing the antimeridian (south-west longitude greater than
+        north-east longitude) are answered as two boxes.
+        """
+        return self.scan(north_east_corner, south_west_corner)[0]
+
+    def scan(self, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> tuple[list[int], int]:
+        """Like query, but also returns how many leaf entries were read; see STRTree.scan."""
+        rows = []
+        read = 0
+        for box in viewport_boxes(north_east_corner, south_west_corner):
+            box_rows, box_read = self.tree.scan(*box)
+            rows.extend(box_rows)
+            read += box_read
+        rows.sort()
+        return rows, read
+
+    def iter_rows(self, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float], after: int = -1):
+        """Yields the rows inside a map viewport greater than after, ascending; see STRTree.query_after."""
+        boxes = viewport_boxes(north_east_corner, south_west_corner)
+        if len(boxes) == 1:
+            return self.tree.query_after(*boxes[0], after)
+        return heapq.merge(*(self.tree.query_after(*box, after) for box in boxes))
+
+    def estimate(self, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> float:
+        """Estimates the number of rows inside a map viewport; see STRTree.estimate."""
+        return sum(self.tree.estimate(*box) for box in viewport_boxes(north_east_corner, south_west_corner))
+
+    def iter_nearest(self, latitude: float, longitude: float, accept=None):
+        """Yields (row, meters) pairs from nearest to farthest; see STRTree.nearest."""
+        return self.tree.nearest(
+            lambda lon, lat: haversine_m(latitude, longitude, lat, lon),
+            lambda min_lon, min_lat, max_lon, max_lat: box_distance_m(latitude, longitude, min_lon, min_lat, max_lon, max_lat),
+            accept,
+        )
+
+    def nearest(self, latitude: float, longitude: float, k: int | None = None,
+                max_distance: float = math.inf, accept=None) -> list[tuple[int, float]]:
+        """
+        Returns the rows nearest to a point by great-circle distance.
+
+        Args:
+            latitude, longitude: The query point.
+            k: The maximum number of results, or None for no limit.
+            max_distance: Rows farther than this many meters are left out.
+            accept: Optional function of a row; rows it rejects are skipped
+                    during the traversal instead of being filtered afterwards.
+
+        Returns:
+            (row, meters) pairs in ascending distance; ties go to the lower row.
+        """
+        found = []
+        if k is not None and k <= 0:
+            return found
+        for row, distance in self.iter_nearest(latitude, longitude, accept):
+            if distance > max_distance:
+                break
+            found.append((row, distance))
+            if len(found) == k:
+                break
+        return found
+
+    def coordinate_columns(self) -> tuple[array, array]:
+        """Returns the (latitudes, longitudes) columns the tree was built from."""
+        return self.tree.ys, self.tree.xs
+
+    def rows(self, row_ids) -> list[dict]:
+        """Materializes row_ids as place dictionaries."""
+        return take(self.places, row_ids)
@@ -0,0 +1,205 @@
+import base64
+import binascii
+import bisect
+import hashlib
+import itertools
+import json
+
+from . import bitset
+from .activity_index import ActivityIndex, normalize_activity
+from .bitmap_index import BitmapIndex
+from .geo import in_viewport
+from .place_store import PlaceStore
+from .spatial_index import SpatialIndex
+
+DEFAULT_PAGE_SIZE = 50
+
+# Page tokens are keyset cursors: the last row returned plus a fingerprint of
+# the query, base64-encoded so clients treat them as opaque. Streams yield rows
+# in ascending order, so resuming after a row stays correct when places are
+# appended between pages, and a token is refused by any other query.
+
+class PlaceStream:
+    """
+    Lazily evaluated results of apply_filters, activity_search and find_places_in_map_area.
+
+    A stream is a row source, answered by the first query in the chain (from the
+    store's cached index when the places are a PlaceStore), plus a row test for
+    every query chained after it. Iterating yields the matching places in row
+    order and materializes each one only when it is reached, so the first match
+    arrives without building the full result. Passing a stream as the places of
+    another iter_* function adds a test instead of an intermediate list.
+
+    Streams can be iterated more than once; page() reads one page at a time.
+
+    Args:
+        places: The list of place dictionaries or PlaceStore the rows refer to.
+        scan: A function of a row returning an iterator over the matching rows after it, ascending.
+        query: A description of the chained queries, fingerprinted into page tokens.
+        tests: Row predicates the scanned rows must also pass.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore, scan, query: tuple, tests: tuple = ()):
+        self.places = places
+        self.query = query
+        self._scan = scan
+        self._tests = tests
+
+    def rows(self, after: int = -1):
+        """Yields the matching rows greater than after, ascending."""
+        rows = self._scan(after)
+        for test in self._tests:
+            rows = filter(test, rows)
+        return rows
+
+    def __iter__(self):
+        return map(self.places.__getitem__, self.rows())
+
+    def page(self, limit: int = DEFAULT_PAGE_SIZE, token: str | None = None) -> tuple[list[dict], str | None]:
+        """
+        Returns up to limit places and the token for the next page.
+
+        Args:
+            limit: The page size.
+            token: A token from the previous page of the same query, or None for the first page.
+
+        Returns:
+            (places, next_token), with next_token None on the last page.
+
+        Raises:
+            ValueError: If limit is not positive, or the token is malformed or was
+                        issued for a different query.
+        """
+        if limit < 1:
+            raise ValueError("page limit must be positive")
+        after = -1 if token is None else self._decode(token)
+        rows = list(itertools.islice(self.rows(after), limit + 1))
+        next_token = self._encode(rows[limit - 1]) if len(rows) > limit else None
+        return [self.places[row] for row in rows[:limit]], next_token
+
+    def _fingerprint(self) -> str:
+        return hashlib.sha1(repr(self.query).encode("utf-8")).hexdigest()[:16]
+
+    def _encode(self, row: int) -> str:
+        payload = json.dumps({"after": row, "query": self._fingerprint()}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def _decode(self, token: str) -> int:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            after, fingerprint = payload["after"], payload["query"]
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise ValueError("malformed page token") from None
+        if fingerprint != self._fingerprint() or not isinstance(after, int):
+            raise ValueError("page token belongs to a different query")
+        return after
+
+def _chain(places, query: tuple, scan, make_test) -> PlaceStream:
+    """
+    Starts a stream over places, or adds a stage to a stream.
+
+    make_test builds the stage's row predicate; it is only called when chaining,
+    since a stream's first stage is applied by its scan.
+    """
+    if isinstance(places, PlaceStream):
+        tests = places._tests if make_test is None else places._tests + (make_test(),)
+        return PlaceStream(places.places, places._scan, places.query + (query,), tests)
+    return PlaceStream(places, scan, (query,))
+
+def _source(places):
+    return places.places if isinstance(places, PlaceStream) else places
+
+def _all_rows(places):
+    return lambda after: iter(range(after + 1, len(places)))
+
+def _sorted_after(rows, after: int):
+    return itertools.islice(rows, bisect.bisect_right(rows, after), None)
+
+def _bits_after(bits: int, after: int):
+    start = after + 1
+    return (row + start for row in bitset.iter_indices(bits >> start))
+
+def _scan_test(places, test):
+    return lambda after: filter(test, range(after + 1, len(places)))
+
+def iter_filters(places: list[dict] | PlaceStore | PlaceStream, active_filters: set[str]) -> PlaceStream:
+    """
+    apply_filters as a PlaceStream.
+
+    Args:
+        places: A list of place dictionaries, a PlaceStore (filtered through its
+                cached BitmapIndex), or a stream to narrow further.
+        active_filters: The IDs of the boolean filters every place must pass.
+    """
+    source = _source(places)
+    query = ("filters", sorted(active_filters))
+    if not active_filters:
+        return _chain(places, query, _all_rows(source), None)
+    if isinstance(source, PlaceStore):
+        bits = source.index(BitmapIndex).match(active_filters)
+        return _chain(places, query, lambda after: _bits_after(bits, after),
+                      lambda: bitset.BitArray.from_int(bits).__getitem__)
+    filter_ids = tuple(active_filters)
+
+    def test(row):
+        place = source[row]
+        return all(place.get(f_id, False) for f_id in filter_ids)
+
+    return _chain(places, query, _scan_test(source, test), lambda: test)
+
+def iter_activity_search(places: list[dict] | PlaceStore | PlaceStream, activity: str) -> PlaceStream:
+    """
+    activity_search as a PlaceStream.
+
+    Args:
+        places: A list of place dictionaries, a PlaceStore (searched through its
+                cached ActivityIndex), or a stream to narrow further.
+        activity: The activity every place must offer; empty matches everything.
+    """
+    source = _source(places)
+    query = ("activity", activity)
+    if not activity:
+        return _chain(places, query, _all_rows(source), None)
+    if isinstance(source, PlaceStore):
+        index = source.index(ActivityIndex)
+        postings = index.postings.get(normalize_activity(activity), ())
+        return _chain(places, query, lambda after: _sorted_after(postings, after),
+                      lambda: bitset.BitArray.from_int(index.bitmap(activity)).__getitem__)
+    wanted = activity.lower()
+
+    def test(row):
+        return wanted in [a.lower() for a in source[row].get("activities", [])]
+
+    return _chain(places, query, _scan_test(source, test), lambda: test)
+
+def iter_places_in_map_area(places: list[dict] | PlaceStore | PlaceStream, north_east_corner: tuple[float, float],
+                            south_west_corner: tuple[float, float]) -> PlaceStream:
+    """
+    find_places_in_map_area as a PlaceStream.
+
+    Args:
+        places: A list of place dictionaries, a PlaceStore (queried through its
+                cached SpatialIndex), or a stream to narrow further.
+        north_east_corner: (latitude, longitude) of the map view's NE corner.
+        south_west_corner: (latitude, longitude) of the map view's SW corner.
+    """
+    source = _source(places)
+    query = ("viewport", tuple(north_east_corner), tuple(south_west_corner))
+    if isinstance(source, PlaceStore):
+        lats, lons = source.latitudes, source.longitudes
+
+        def scan(after):
+            return source.index(SpatialIndex).iter_rows(north_east_corner, south_west_corner, after)
+
+        def test(row):
+            return in_viewport(lats[row], lons[row], north_east_corner, south_west_corner)
+
+        return _chain(places, query, scan, lambda: test)
+
+    def test(row):
+        place = source[row]
+        lat = place.get("latitude")
+        lon = place.get("longitude")
+        return lat is not None and lon is not None and in_viewport(lat, lon, north_east_corner, south_west_corner)
+
+    return _chain(places, query, _scan_test(source, test), lambda: test)
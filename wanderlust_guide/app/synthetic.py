@@ -0,0 +1,162 @@
+import itertools
+import random
+from bisect import bisect
+
+from .place_store import PlaceStore
+
+# Synthetic points of interest for benchmarks, reproducible from a seed.
+#
+# Places are spread over CITIES with Zipf-distributed weights, so a few cities
+# hold most of them, and inside each city they crowd around Zipf-weighted
+# hotspots (old town, beach front, malls). A small share lies scattered around
+# the city, and a few places have no coordinates at all. Activities are drawn
+# from ACTIVITIES, ordered by popularity, with Zipf weights after the
+# category's own activity. Amenity flags depend on the category and on a
+# per-place "amenities" score, so they are correlated with each other
+# (a place with Wi-Fi is more likely to be wheelchair accessible), and
+# scattered places have parking more often than places in a hotspot.
+
+# (name, latitude, longitude, spread in degrees), most populous first.
+# Suva sits next to the antimeridian.
+CITIES = [
+    ("Bangkok", 13.7563, 100.5018, 0.15),
+    ("Los Angeles", 34.0522, -118.2437, 0.25),
+    ("Tokyo", 35.6762, 139.6503, 0.2),
+    ("Chiang Mai", 18.7883, 98.9853, 0.08),
+    ("Phuket", 7.8804, 98.3923, 0.1),
+    ("Paris", 48.8566, 2.3522, 0.08),
+    ("Singapore", 1.3521, 103.8198, 0.08),
+    ("New York", 40.7128, -74.0060, 0.15),
+    ("Pattaya", 12.9236, 100.8825, 0.05),
+    ("Krabi", 8.0863, 98.9063, 0.08),
+    ("Sydney", -33.8688, 151.2093, 0.2),
+    ("Hua Hin", 12.5684, 99.9577, 0.05),
+    ("Khon Kaen", 16.4322, 102.8236, 0.06),
+    ("Suva", -18.1248, 178.4501, 0.05),
+]
+
+# By popularity; the first ones are the most common.
+ACTIVITIES = [
+    "eating", "sightseeing", "shopping", "photography", "swimming", "hiking", "coffee", "nightlife",
+    "massage", "cycling", "diving", "snorkeling", "guided tours", "yoga", "cooking class", "boat trip",
+    "bird watching", "rock climbing", "surfing", "kayaking", "fishing", "camping", "board games",
+    "live music", "meditation", "golf", "zip-lining", "horse riding", "wine tasting", "skateboarding",
+    "paddle boarding", "sailing", "pottery", "archery", "paragliding", "caving", "stargazing",
+    "dog walking", "reading", "coding",
+]
+
+# Category: (share, signature activity, name nouns, description words,
+#            P(suitable_for_kids), P(pet_friendly), P(parking_available),
+#            P(wheelchair_accessible), P(wifi_available)) before adjustments.
+CATEGORIES = {
+    "restaurant": (0.22, "eating", ("Kitchen", "Bistro", "Noodle House", "Grill"), ("food", "dinner", "local", "spicy"),
+                   0.6, 0.2, 0.4, 0.4, 0.5),
+    "cafe": (0.15, "coffee", ("Cafe", "Coffee", "Roastery", "Tea Room"), ("coffee", "cake", "relax", "work"),
+             0.3, 0.4, 0.3, 0.5, 0.9),
+    "shop": (0.14, "shopping", ("Market", "Boutique", "Mall", "Store"), ("shopping", "souvenirs", "fashion", "crafts"),
+             0.5, 0.2, 0.5, 0.6, 0.4),
+    "hotel": (0.1, "swimming", ("Hotel", "Resort", "Hostel", "Inn"), ("rooms", "pool", "stay", "breakfast"),
+              0.7, 0.3, 0.7, 0.7, 0.95),
+    "park": (0.1, "hiking", ("Park", "Garden", "Trail", "Viewpoint"), ("nature", "trees", "walk", "scenic"),
+             0.9, 0.7, 0.6, 0.4, 0.1),
+    "temple": (0.08, "sightseeing", ("Temple", "Shrine", "Wat", "Pagoda"), ("historic", "buddha", "quiet", "culture"),
+               0.6, 0.05, 0.5, 0.3, 0.05),
+    "museum": (0.06, "guided tours", ("Museum", "Gallery", "Exhibition", "Archive"), ("history", "art", "exhibits", "culture"),
+               0.8, 0.05, 0.6, 0.9, 0.6),
+    "beach": (0.05, "swimming", ("Beach", "Bay", "Cove", "Pier"), ("sand", "sea", "sunset", "waves"),
+              0.8, 0.5, 0.5, 0.2, 0.1),
+    "bar": (0.05, "nightlife", ("Bar", "Pub", "Rooftop", "Lounge"), ("drinks", "music", "night", "cocktails"),
+            0.05, 0.3, 0.3, 0.4, 0.7),
+    "gym": (0.05, "yoga", ("Gym", "Studio", "Fitness Club", "Dojo"), ("fitness", "training", "health", "classes"),
+            0.3, 0.05, 0.6, 0.7, 0.8),
+}
+
+ADJECTIVES = ("Golden", "Green", "Royal", "Hidden", "Sunny", "Old Town", "Riverside", "Blue", "Happy", "Little",
+              "Grand", "Silver", "Lucky", "Secret", "Central", "Lotus", "Jasmine", "Ocean", "Mountain", "Urban")
+
+HOTSPOTS_PER_CITY = 24
+SCATTERED_SHARE = 0.1 # Places spread around the city instead of in a hotspot
+UNLOCATED_SHARE = 0.01 # Places without coordinates
+ZIPF_EXPONENT = 1.1
+
+def zipf_weights(n: int, exponent: float = ZIPF_EXPONENT) -> list[float]:
+    """Cumulative weights of ranks 1..n under a Zipf law, normalized to end at 1."""
+    weights = list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, n + 1)))
+    return [weight / weights[-1] for weight in weights]
+
+def generate_places(n: int, seed: int = 0):
+    """
+    Yields n synthetic place dictionaries with the keys of SAMPLE_PLACES.
+
+    The same n and seed always give the same places, and a prefix of a run is
+    the same as a shorter run with that seed.
+    """
+    rng = random.Random(seed)
+    city_weights = zipf_weights(len(CITIES))
+    # Hotspots are drawn from their own stream so they do not depend on n.
+    layout_rng = random.Random(f"{seed}:layout")
+    hotspots = [
+        [(layout_rng.gauss(lat, spread), layout_rng.gauss(lon, spread), spread * layout_rng.uniform(0.03, 0.15))
+         for _ in range(HOTSPOTS_PER_CITY)]
+        for _, lat, lon, spread in CITIES
+    ]
+    hotspot_weights = zipf_weights(HOTSPOTS_PER_CITY)
+    activity_weights = zipf_weights(len(ACTIVITIES))
+    categories = list(CATEGORIES.items())
+    category_weights = list(itertools.accumulate(share for _, (share, *_) in categories))
+    category_weights = [weight / category_weights[-1] for weight in category_weights]
+    # Drawing is bisect(cumulative weights, random()), as random.choices does, without its per-call overhead.
+
+    random_ = rng.random
+    gauss = rng.gauss
+    choice = rng.choice
+    for _ in range(n):
+        category, (_, signature, nouns, words, kids, pets, parking, wheelchair, wifi) = categories[
+            bisect(category_weights, random_())]
+        city = bisect(city_weights, random_())
+        city_name, city_lat, city_lon, spread = CITIES[city]
+        adjective = choice(ADJECTIVES)
+        place = {
+            "name": f"{adjective} {choice(nouns)} {city_name}",
+            "description": f"{adjective.lower()} {category} in {city_name}: {choice(words)}, {choice(words)} and {choice(words)}",
+        }
+
+        scattered = random_() < SCATTERED_SHARE
+        if random_() >= UNLOCATED_SHARE:
+            if scattered:
+                lat, lon = gauss(city_lat, spread * 2), gauss(city_lon, spread * 2)
+            else:
+                hot_lat, hot_lon, radius = hotspots[city][bisect(hotspot_weights, random_())]
+                lat, lon = gauss(hot_lat, radius), gauss(hot_lon, radius)
+            place["latitude"] = round(lat, 6)
+            place["longitude"] = round((lon + 180.0) % 360.0 - 180.0, 6)
+
+        activities = [signature]
+        for _ in range(int(random_() * 4)):
+            activity = ACTIVITIES[bisect(activity_weights, random_())]
+            if activity not in activities:
+                activities.append(activity)
+        place["activities"] = activities
+
+        # amenities averages 1, so scaling by it keeps the category's rates on
+        # average while making one place's amenities rise and fall together.
+        amenities = 2 * random_()
+        place["suitable_for_kids"] = random_() < kids
+        place["pet_friendly"] = random_() < (pets * 1.5 if scattered else pets)
+        place["parking_available"] = random_() < min(1.0, parking * (1.6 if scattered else 0.9))
+        place["wheelchair_accessible"] = random_() < wheelchair * amenities
+        place["wifi_available"] = random_() < wifi * amenities
+        yield place
+
+def generate_store(n: int, seed: int = 0, batch_size: int = 100_000) -> PlaceStore:
+    """
+    Builds a PlaceStore of generate_places(n, seed), batch_size places at a time,
+    so only one batch of dictionaries exists at once even for millions of places.
+    """
+    store = PlaceStore()
+    places = generate_places(n, seed)
+    while True:
+        batch = list(itertools.islice(places, batch_size))
+        if not batch:
+            return store
+        store.extend(batch)
@@ -0,0 +1,239 @@
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from . import bitset
+from .place_store import PlaceStore, take
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Term frequencies are weighted by the field they occur in (a simple BM25F).
+FIELD_WEIGHTS = {"name": 2.0, "activities": 1.5, "description": 1.0}
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "at", "by", "for", "from", "in", "is", "it", "me",
+    "my", "near", "of", "on", "or", "the", "to", "with",
+})
+
+# Runs of Thai script, or runs of other letters/digits.
+_TOKEN_RE = re.compile(r"[\u0e00-\u0e7f]+|[^\W_]+")
+_THAI_START = "\u0e00"
+_THAI_END = "\u0e7f"
+
+def _stem(word: str) -> str:
+    """Very light English stemming: folds simple plurals ("parks" -> "park")."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        if word.endswith("ies") and len(word) > 4:
+            return word[:-3] + "y"
+        return word[:-1]
+    return word
+
+def _thai_clusters(run: str) -> list[str]:
+    """Splits a Thai run into characters, keeping combining vowels and tone marks with their base."""
+    clusters = []
+    for ch in run:
+        if clusters and unicodedata.category(ch) == "Mn":
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return clusters
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits text into index terms.
+
+    English (and other space-separated scripts) is lowercased, stripped of
+    stopwords and lightly stemmed. Thai has no spaces between words, so Thai
+    runs are indexed as overlapping character bigrams, which matches words
+    without needing a segmentation dictionary.
+    """
+    terms = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _THAI_START <= run[0] <= _THAI_END:
+            clusters = _thai_clusters(run)
+            if len(clusters) == 1:
+                terms.append(clusters[0])
+            else:
+                terms.extend(a + b for a, b in zip(clusters, clusters[1:]))
+        elif run not in STOPWORDS:
+            terms.append(_stem(run))
+    return terms
+
+class TextIndex:
+    """
+    In-process full-text index over place name, description and activities.
+
+    Each term maps to a posting list of ascending row ids with their
+    field-weighted term frequencies. Queries are ranked with BM25 and only the
+    top ``limit`` rows are kept, using a heap. Terms are scored from the highest
+    to the lowest possible contribution, and once no unseen row could still
+    reach the top results (the MaxScore condition), the remaining terms only update rows that
+    are already candidates, so long posting lists of common terms are probed
+    rather than scanned.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore):
+        self.places = places
+        self.size = len(places)
+        self.postings: dict[str, tuple[array, array]] = {}
+        self.max_scores: dict[str, float] = {}
+        self.doc_lengths = array("f")
+        self.avg_doc_length = 0.0
+        self._bitmaps: dict[str, int] = {}
+        self._build()
+
+    @classmethod
+    def from_places(cls, places: list[dict] | PlaceStore) -> "TextIndex":
+        """Builds the index over a list of place dictionaries or a PlaceStore."""
+        return cls(places)
+
+    def _fields(self):
+        if isinstance(self.places, PlaceStore):
+            store = self.places
+            for row in range(len(store)):
+                yield store.names.get(row), store.descriptions.get(row), store.activities.get(row)
+        else:
+            for place in self.places:
+                yield place.get("name"), place.get("description"), place.get("activities")
+
+    def _build(self) -> None:
+        postings: dict[str, tuple[array, array]] = {}
+        doc_lengths = self.doc_lengths
+        for row, (name, description, activities) in enumerate(self._fields()):
+            frequencies: dict[str, float] = {}
+            length = 0.0
+            for field, text in (("name", name), ("description", description), ("activities", " ".join(activities or ()))):
+                if not text:
+                    continue
+                weight = FIELD_WEIGHTS[field]
+                for term in tokenize(text):
+                    frequencies[term] = frequencies.get(term, 0.0) + weight
+                    length += weight
+            doc_lengths.append(length)
+            for term, tf in frequencies.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array("I"), array("f"))
+                entry[0].append(row)
+                entry[1].append(tf)
+        self.postings = postings
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        self.max_scores = {}
+        for term, (rows, tfs) in postings.items():
+            idf = self.idf(term)
+            self.max_scores[term] = max(self._term_score(idf, tf, doc_lengths[row]) for row, tf in zip(rows, tfs))
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency of term."""
+        df = len(self.postings[term][0])
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def _term_score(self, idf: float, tf: float, doc_length: float) -> float:
+        norm = K1 * (1 - B + B * doc_length / self.avg_doc_length) if self.avg_doc_length else K1
+        return idf * tf * (K1 + 1) / (tf + norm)
+
+    def terms(self, query: str) -> list[str]:
+        """Returns the distinct terms of query that occur in the index."""
+        return list(dict.fromkeys(term for term in tokenize(query) if term in self.postings))
+
+    def document_count(self, query: str) -> int:
+        """Upper bound of the rows matching query: the sum of its terms' document frequencies."""
+        return min(self.size, sum(len(self.postings[term][0]) for term in self.terms(query)))
+
+    def bitmap(self, query: str) -> int:
+        """Returns the bitset of rows containing any term of query; term bitsets are cached."""
+        result = 0
+        for term in self.terms(query):
+            bits = self._bitmaps.get(term)
+            if bits is None:
+                bits = self._bitmaps[term] = bitset.from_indices(self.postings[term][0])
+            result |= bits
+        return result
+
+    def search(self, query: str, limit: int = 10, accept=None) -> list[tuple[int, float]]:
+        """
+        Returns the best matching rows for query.
+
+        Args:
+            query: Free text, in English and/or Thai.
+            limit: The maximum number of results.
+            accept: Optional function of a row; rows it rejects are never scored.
+
+        Returns:
+            Up to limit (row, score) pairs, best first; ties go to the lower row.
+        """
+        if limit <= 0:
+            return []
+        terms = self.terms(query)
+        if not terms:
+            return []
+        terms = sorted(terms, key=self.max_scores.__getitem__, reverse=True)
+        # remaining[i] = best score any row can still gain from terms[i:]
+        remaining = [0.0] * (len(terms) + 1)
+        for i in range(len(terms) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + self.max_scores[terms[i]]
+
+        scores: dict[int, float] = {}
+        doc_lengths = self.doc_lengths
+        open_for_new_rows = True
+        for i, term in enumerate(terms):
+            rows, tfs = self.postings[term]
+            idf = self.idf(term)
+            if open_for_new_rows and len(scores) >= limit:
+                threshold = heapq.nlargest(limit, scores.values())[-1]
+                if threshold > remaining[i]:
+                    # No unseen row can reach the top results any more. Drop candidates
+                    # that cannot catch up and only probe the rest from now on.
+                    open_for_new_rows = False
+                    scores = {row: s for row, s in scores.items() if s + remaining[i] >= threshold}
+            if open_for_new_rows:
+                for row, tf in zip(rows, tfs):
+                    score = scores.get(row)
+                    if score is None:
+                        if accept is not None and not accept(row):
+                            continue
+                        score = 0.0
+                    scores[row] = score + self._term_score(idf, tf, doc_lengths[row])
+            else:
+                for row in scores:
+                    pos = bisect_left(rows, row)
+                    if pos < len(rows) and rows[pos] == row:
+                        scores[row] += self._term_score(idf, tfs[pos], doc_lengths[row])
+
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def rank(self, query: str, rows, limit: int | None = 10) -> list[tuple[int, float]]:
+        """
+        Scores only the given candidate rows, for when they are few.
+
+        Each candidate is looked up in each term's posting list by binary
+        search, so the cost depends on the candidates, not on the postings.
+        Returns (row, score) pairs for candidates matching at least one term,
+        best first; ties go to the lower row.
+        """
+        # Same term order as search(), so both sum each row's score identically.
+        terms = sorted(self.terms(query), key=self.max_scores.__getitem__, reverse=True)
+        idfs = [self.idf(term) for term in terms]
+        doc_lengths = self.doc_lengths
+        scores = []
+        for row in rows:
+            score = 0.0
+            for term, idf in zip(terms, idfs):
+                postings, tfs = self.postings[term]
+                pos = bisect_left(postings, row)
+                if pos < len(postings) and postings[pos] == row:
+                    score += self._term_score(idf, tfs[pos], doc_lengths[row])
+            if score > 0.0:
+                scores.append((row, score))
+        if limit is None:
+            return sorted(scores, key=lambda item: (-item[1], item[0]))
+        return heapq.nsmallest(limit, scores, key=lambda item: (-item[1], item[0]))
+
+    def rows(self, row_ids) -> list[dict]:
+        """Materializes row_ids as place dictionaries."""
+        return take(self.places, row_ids)
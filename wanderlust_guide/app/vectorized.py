@@ -0,0 +1,222 @@
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional; every caller keeps a pure-Python path
+    np = None
+
+from .geo import EARTH_RADIUS_M
+
+PYTHON = "python"
+NUMPY = "numpy"
+BACKENDS = (PYTHON, NUMPY)
+
+_backend = PYTHON
+
+# array.array typecode -> NumPy dtype of the same width
+_NUMPY_TYPES = {"d": "float64", "f": "float32", "q": "int64", "I": "uint32", "b": "int8"}
+
+def available() -> bool:
+    """Returns True if NumPy can be imported."""
+    return np is not None
+
+def set_backend(backend: str) -> None:
+    """
+    Selects the default execution backend for scan-based queries.
+
+    Args:
+        backend: "python" (the default) or "numpy". Choosing "numpy" without NumPy
+                 installed is allowed; calls then keep running on the Python path.
+    """
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    _backend = backend
+
+def get_backend() -> str:
+    """Returns the default execution backend."""
+    return _backend
+
+def use_numpy(backend: str | None = None) -> bool:
+    """
+    Decides whether a call runs vectorized.
+
+    Args:
+        backend: The per-call choice, or None to use the global default.
+
+    Returns:
+        True if the call should use NumPy and NumPy is installed.
+    """
+    if backend is None:
+        backend = _backend
+    elif backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    return backend == NUMPY and np is not None
+
+def to_array(values, typecode: str) -> array:
+    """Copies a NumPy array into an array.array of the given typecode."""
+    result = array(typecode)
+    result.frombytes(np.ascontiguousarray(values, dtype=_NUMPY_TYPES[typecode]).tobytes())
+    return result
+
+def float_array(values):
+    """A float64 view of an array('d') or memoryview, or a copy of any other sequence of floats."""
+    if isinstance(values, (array, memoryview)):
+        return np.frombuffer(values, dtype=np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+def float_column(places: list[dict], key: str):
+    """Extracts a numeric key from place dicts as float64, with NaN for missing/None values."""
+    nan = float("nan")
+    return np.fromiter(
+        (nan if (value := place.get(key)) is None else value for place in places),
+        dtype=np.float64, count=len(places),
+    )
+
+def bool_column(places: list[dict], key: str):
+    """Extracts place.get(key, False) truthiness from place dicts as a bool array."""
+    return np.fromiter((bool(place.get(key, False)) for place in places), dtype=bool, count=len(places))
+
+def filter_rows(places: list[dict], active_filters) -> list[int]:
+    """Row numbers of places matching every filter, as one AND of boolean masks."""
+    mask = np.ones(len(places), dtype=bool)
+    for f_id in active_filters:
+        mask &= bool_column(places, f_id)
+    return np.flatnonzero(mask).tolist()
+
+def viewport_rows(lats, lons, north_east_corner: tuple[float, float], south_west_corner: tuple[float, float]) -> list[int]:
+    """Row numbers whose coordinates fall in the viewport; NaN coordinates never match."""
+    ne_lat, ne_lon = north_east_corner
+    sw_lat, sw_lon = south_west_corner
+    mask = (lats >= sw_lat) & (lats <= ne_lat)
+    if sw_lon > ne_lon: # Viewport crosses the antimeridian
+        mask &= (lons >= sw_lon) | (lons <= ne_lon)
+    else:
+        mask &= (lons >= sw_lon) & (lons <= ne_lon)
+    return np.flatnonzero(mask).tolist()
+
+def haversine_m(lats, lons, latitude: float, longitude: float):
+    """geo.haversine_m from one point to arrays of points; NaN coordinates give NaN."""
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(lats)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(lons - longitude)
+    a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def nearest_rows(lats, lons, latitude: float, longitude: float, rows=None, k: int | None = None,
+                 max_distance: float = math.inf) -> list[tuple[int, float]]:
+    """spatial_index.scan_nearest with all candidate distances computed as one array operation."""
+    lats = float_array(lats)
+    lons = float_array(lons)
+    rows = np.arange(len(lats)) if rows is None else np.fromiter(rows, dtype=np.int64)
+    distances = haversine_m(lats[rows], lons[rows], latitude, longitude)
+    keep = distances <= max_distance # False for NaN
+    rows = rows[keep]
+    distances = distances[keep]
+    order = np.lexsort((rows, distances))
+    if k is not None:
+        order = order[:max(k, 0)]
+    return list(zip(rows[order].tolist(), distances[order].tolist()))
+
+def quadrant_rows(lats, lons) -> dict[str, list[int]]:
+    """
+    The quadrant split of get_map_clusters as mask operations.
+
+    The averages treat missing coordinates as 0 and are summed left to right
+    with Python's sum(), exactly like the list implementation, so both
+    backends put boundary places in the same quadrant.
+    """
+    n = len(lats)
+    avg_lat = sum(np.nan_to_num(lats, nan=0.0).tolist()) / n if n else 0
+    avg_lon = sum(np.nan_to_num(lons, nan=0.0).tolist()) / n if n else 0
+    mapped = ~(np.isnan(lats) | np.isnan(lons))
+    north = lats >= avg_lat
+    west = lons < avg_lon
+    masks = {
+        "NW": mapped & north & west,
+        "NE": mapped & north & ~west,
+        "SW": mapped & ~north & west,
+        "SE": mapped & ~north & ~west,
+    }
+    return {name: np.flatnonzero(mask).tolist() for name, mask in masks.items()}
+
+def grid_cluster(xs, ys, counts, ids, expansion_zooms, cells_per_world: int, zoom: int):
+    """
+    Vectorized grid assignment and centroid computation for ClusterIndex.
+
+    Cells are ordered by their first member and weighted sums are accumulated
+    in member order with bincount, so the output is identical to the Python
+    loop in ClusterIndex._cluster.
+
+    Returns:
+        None if no two items share a cell, otherwise the new level's
+        (xs, ys, counts, ids, expansion_zooms) as array.array columns.
+    """
+    x = np.frombuffer(xs, dtype=np.float64)
+    y = np.frombuffer(ys, dtype=np.float64)
+    weights = np.frombuffer(counts, dtype=np.uint32).astype(np.float64)
+    cx = np.minimum((x * cells_per_world).astype(np.int64), cells_per_world - 1)
+    cy = np.minimum((y * cells_per_world).astype(np.int64), cells_per_world - 1)
+    keys = cx * cells_per_world + cy
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    if len(unique_keys) == len(keys):
+        return None
+    # Renumber cells in order of first appearance, as dict insertion order does.
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    cell = rank[inverse]
+    first = first[order]
+    n_cells = len(first)
+
+    sizes = np.bincount(cell, minlength=n_cells)
+    totals = np.bincount(cell, weights=weights, minlength=n_cells)
+    wx = np.bincount(cell, weights=x * weights, minlength=n_cells)
+    wy = np.bincount(cell, weights=y * weights, minlength=n_cells)
+
+    single = sizes == 1
+    out_xs = np.where(single, x[first], wx / totals)
+    out_ys = np.where(single, y[first], wy / totals)
+    out_counts = totals.astype(np.uint32)
+    out_ids = np.where(single, np.frombuffer(ids, dtype=np.int64)[first], (first.astype(np.int64) << 5) + zoom + 1)
+    out_expansion = np.where(single, np.frombuffer(expansion_zooms, dtype=np.int8)[first], zoom + 1)
+    return (
+        to_array(out_xs, "d"), to_array(out_ys, "d"), to_array(out_counts, "I"),
+        to_array(out_ids, "q"), to_array(out_expansion, "b"),
+    )
+
+def str_pack(xs, ys, node_size: int):
+    """
+    Vectorized Sort-Tile-Recursive ordering and leaf boxes for STRTree.
+
+    Uses stable sorts, so the packing equals the Python build exactly.
+
+    Returns:
+        None if there are no points with coordinates, otherwise
+        (ids, packed_xs, packed_ys, leaf_boxes) where leaf_boxes is a
+        (min_x, min_y, max_x, max_y) tuple of array.array columns.
+    """
+    x = float_array(xs)
+    y = float_array(ys)
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    n = len(valid)
+    if not n:
+        return None
+    order = valid[np.argsort(x[valid], kind="stable")]
+    n_leaves = -(-n // node_size)
+    slice_size = node_size * int(np.ceil(np.sqrt(n_leaves)))
+    # Sort each vertical slice by y: a stable sort on (slice number, y).
+    slice_of = np.arange(n) // slice_size
+    order = order[np.lexsort((y[order], slice_of))]
+    packed_x = x[order]
+    packed_y = y[order]
+    starts = np.arange(0, n, node_size)
+    boxes = (
+        to_array(np.minimum.reduceat(packed_x, starts), "d"),
+        to_array(np.minimum.reduceat(packed_y, starts), "d"),
+        to_array(np.maximum.reduceat(packed_x, starts), "d"),
+        to_array(np.maximum.reduceat(packed_y, starts), "d"),
+    )
+    return to_array(order, "I"), to_array(packed_x, "d"), to_array(packed_y, "d"), boxes
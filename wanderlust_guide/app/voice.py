@@ -0,0 +1,350 @@
+import queue
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .instrumentation import Histogram, get_instrumentation
+from .place_store import PlaceStore
+from .search import DEFAULT_SEARCH_LIMIT, _get_index, text_search
+from .text_index import TextIndex
+
+DEFAULT_MAX_BATCH = 16 # Transcription requests per backend call
+DEFAULT_BATCH_WAIT = 0.005 # Seconds the first request of a batch waits for others to join it
+DEFAULT_SEARCH_WORKERS = 2 # Threads running speculative searches
+
+# Stages of the end of an utterance, reported by VoiceSession.latency and VoicePipeline.stats().
+STAGES = ("queue", "transcribe", "search", "total")
+
+# Voice search as a pipeline. Audio arrives in chunks while the user speaks,
+# and the audio so far is transcribed again whenever more has arrived; every
+# new partial transcript is searched speculatively. When speech ends only the
+# final transcription is left, and when it matches the last partial the
+# results are already computed (or being computed) and are returned as they
+# are. Transcription requests of all sessions go through one batcher thread
+# that hands the backend every request waiting at once in a single call, as
+# speech models cost far less per stream when run on a batch.
+
+_TRAILING_WORD = re.compile(r"\S+$")
+
+class Transcriber(ABC):
+    """
+    Speech-to-text backend of a VoicePipeline.
+
+    transcribe() receives a batch of requests, each the whole audio of one
+    session so far and whether the session has finished, and returns one
+    transcript per request in the same order. Partial transcripts (requests
+    of unfinished sessions) may leave out words the audio has not settled
+    yet. The pipeline calls it from a single thread.
+    """
+
+    @abstractmethod
+    def transcribe(self, batch: list[tuple[bytes, bool]]) -> list[str]:
+        """Returns one transcript per (audio, final) request of batch, in order."""
+
+class StubTranscriber(Transcriber):
+    """
+    Deterministic local Transcriber for tests, demos and benchmarks.
+
+    The "audio" is the UTF-8 text being spoken. Partial transcripts stop
+    before the last word unless the audio ends with whitespace, since a word
+    cut by a chunk boundary may still grow; final transcripts keep every word.
+    Each call sleeps call_latency plus item_latency per request, modelling a
+    backend whose cost is mostly per call, and records the batch size in
+    batch_sizes.
+
+    Args:
+        call_latency: Seconds every call takes.
+        item_latency: Seconds added per request in the batch.
+    """
+
+    def __init__(self, call_latency: float = 0.0, item_latency: float = 0.0):
+        self.call_latency = call_latency
+        self.item_latency = item_latency
+        self.batch_sizes: list[int] = []
+
+    def transcribe(self, batch: list[tuple[bytes, bool]]) -> list[str]:
+        self.batch_sizes.append(len(batch))
+        delay = self.call_latency + self.item_latency * len(batch)
+        if delay:
+            time.sleep(delay)
+        transcripts = []
+        for audio, final in batch:
+            # A chunk may also end inside a multi-byte character; the incomplete bytes are dropped.
+            text = audio.decode("utf-8", errors="ignore")
+            if not final:
+                text = _TRAILING_WORD.sub("", text)
+            transcripts.append(" ".join(text.split()))
+        return transcripts
+
+class VoiceSession:
+    """
+    One utterance streamed into a VoicePipeline; create it with VoicePipeline.open().
+
+    feed() adds audio as it is recorded and returns at once. Whenever audio
+    has arrived since the last partial transcription, the session requests
+    another one (only one is pending at a time, so a fast stream does not
+    flood the backend), and each new partial transcript starts a speculative
+    text_search, cancelling the previous one if it has not started yet.
+    Partial transcriptions that fail are ignored. finish() ends the utterance
+    and returns the results for the final transcript.
+
+    After finish(), transcript is the final transcript, partials the distinct
+    partial transcripts in order, speculation_hit whether the final transcript
+    matched the last partial so its search was reused, and latency the time
+    of each of the STAGES in milliseconds:
+
+    - queue: the final request waiting for its transcription batch;
+    - transcribe: the backend call that transcribed it;
+    - search: from the final transcript to the results, including any wait
+      for a speculative search still running;
+    - total: from finish() being called to the results.
+    """
+
+    def __init__(self, pipeline: "VoicePipeline", limit: int = DEFAULT_SEARCH_LIMIT):
+        self.pipeline = pipeline
+        self.limit = limit
+        self.transcript: str | None = None
+        self.partials: list[str] = []
+        self.speculation_hit = False
+        self.latency: dict[str, float] = {}
+        self._audio = bytearray()
+        self._lock = threading.Lock()
+        self._pending = False # A partial transcription is being made
+        self._stale = False # Audio arrived after the pending partial's request
+        self._finished = False
+        self._query: str | None = None # The transcript of the speculative search
+        self._results: Future | None = None
+
+    def feed(self, chunk: bytes) -> None:
+        """
+        Adds a chunk of audio to the utterance.
+
+        Raises:
+            ValueError: If the session has finished.
+        """
+        with self._lock:
+            if self._finished:
+                raise ValueError("voice session has already finished")
+            self._audio += chunk
+            if self._pending:
+                self._stale = True
+                return
+            self._pending = True
+            audio = bytes(self._audio)
+        self._request_partial(audio)
+
+    def _request_partial(self, audio: bytes) -> None:
+        self.pipeline._transcribe(audio, False).add_done_callback(self._on_partial)
+
+    def _on_partial(self, future: Future) -> None:
+        """Starts the speculative search of a partial transcript and, if audio arrived meanwhile, the next partial."""
+        audio = None
+        with self._lock:
+            self._pending = False
+            if self._finished:
+                return
+            if future.exception() is None:
+                transcript = future.result()[0]
+                if transcript and transcript != self._query and not self.pipeline._closed:
+                    self.partials.append(transcript)
+                    if self._results is not None:
+                        self._results.cancel()
+                    self._query = transcript
+                    self._results = self.pipeline._search(transcript, self.limit)
+            if self._stale:
+                self._stale = False
+                self._pending = True
+                audio = bytes(self._audio)
+        if audio is not None and not self.pipeline._closed:
+            self._request_partial(audio)
+
+    def finish(self) -> list[dict]:
+        """
+        Ends the utterance and waits for its results.
+
+        Returns:
+            Up to limit places for the final transcript, best match first, as text_search returns them.
+
+        Raises:
+            ValueError: If the session has already finished.
+            Exception: Whatever the transcriber raised for the final transcription.
+        """
+        ended = time.perf_counter()
+        with self._lock:
+            if self._finished:
+                raise ValueError("voice session has already finished")
+            # From here on partial transcripts are dropped, so the speculation below is settled.
+            self._finished = True
+            audio = bytes(self._audio)
+        transcript, queued, transcribing = self.pipeline._transcribe(audio, True).result()
+        transcribed = time.perf_counter()
+        if transcript == self._query:
+            self.speculation_hit = True
+            places = self._results.result()
+        else:
+            if self._results is not None:
+                self._results.cancel()
+            places = text_search(transcript, self.pipeline.index, self.limit)
+        finished = time.perf_counter()
+
+        self.transcript = transcript
+        self.latency = {
+            "queue": round(queued * 1000, 3),
+            "transcribe": round(transcribing * 1000, 3),
+            "search": round((finished - transcribed) * 1000, 3),
+            "total": round((finished - ended) * 1000, 3),
+        }
+        self.pipeline._record(self)
+        return places
+
+class VoicePipeline:
+    """
+    Streaming voice search with batched transcription and speculative search.
+
+    Each utterance is a VoiceSession from open(), fed audio chunks as they
+    are recorded; search() runs one over an iterable of chunks. Transcription
+    requests from all sessions are queued for a batcher thread, which waits
+    up to batch_wait seconds after the first request for others and passes
+    up to max_batch of them to the transcriber in one call. Speculative
+    searches of partial transcripts run on their own small thread pool, and
+    the final search, when the speculation missed, on the thread calling
+    finish().
+
+    stats() reports the sessions, batches and latency percentiles of each
+    stage. With instrumentation installed, every transcriber call is also
+    reported as "VoicePipeline.transcribe", and the searches as text_search.
+
+    Close the pipeline with close(), or use it as a context manager, to stop
+    its threads.
+
+    Args:
+        places: The places to search, as for text_search; they are indexed once, up front.
+                Defaults to the search corpus.
+        transcriber: The speech-to-text backend; defaults to a StubTranscriber.
+        max_batch: The most transcription requests passed to the transcriber at once.
+        batch_wait: Seconds a batch stays open for more requests after its first.
+        search_workers: Threads running speculative searches.
+    """
+
+    def __init__(self, places: list[dict] | PlaceStore | TextIndex | None = None, transcriber: Transcriber | None = None,
+                 max_batch: int = DEFAULT_MAX_BATCH, batch_wait: float = DEFAULT_BATCH_WAIT,
+                 search_workers: int = DEFAULT_SEARCH_WORKERS):
+        self.index = _get_index(places, TextIndex)
+        self.transcriber = transcriber or StubTranscriber()
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.batches = 0
+        self.requests = 0
+        self.sessions = 0
+        self.speculation_hits = 0
+        self.latencies = {stage: Histogram() for stage in STAGES}
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._queue: queue.Queue = queue.Queue()
+        self._searches = ThreadPoolExecutor(search_workers, thread_name_prefix="voice-search")
+        self._batcher = threading.Thread(target=self._run, name="voice-batcher", daemon=True)
+        self._batcher.start()
+
+    def open(self, limit: int = DEFAULT_SEARCH_LIMIT) -> VoiceSession:
+        """Starts a session for one utterance, whose results are up to limit places."""
+        return VoiceSession(self, limit)
+
+    def search(self, chunks, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+        """Feeds every audio chunk of the iterable chunks to a new session, as they come, and returns its results."""
+        session = self.open(limit)
+        for chunk in chunks:
+            session.feed(chunk)
+        return session.finish()
+
+    def stats(self) -> dict:
+        """Returns session and batch counts and the p50/p95/p99 of each stage in milliseconds."""
+        with self._stats_lock:
+            return {
+                "sessions": self.sessions,
+                "speculation_hits": self.speculation_hits,
+                "batches": self.batches,
+                "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "stages": {
+                    stage: {f"p{round(q * 100)}_ms": round(histogram.quantile(q) * 1000, 3) for q in (0.50, 0.95, 0.99)}
+                    for stage, histogram in self.latencies.items()
+                },
+            }
+
+    def close(self) -> None:
+        """Transcribes the requests already queued, then stops the batcher and search threads."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._batcher.join()
+        self._searches.shutdown()
+
+    def __enter__(self) -> "VoicePipeline":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _transcribe(self, audio: bytes, final: bool) -> Future:
+        """Queues a transcription request; the future's result is (transcript, seconds queued, seconds transcribing)."""
+        if self._closed:
+            raise RuntimeError("voice pipeline is closed")
+        future = Future()
+        self._queue.put((audio, final, future, time.perf_counter()))
+        return future
+
+    def _search(self, transcript: str, limit: int) -> Future:
+        return self._searches.submit(text_search, transcript, self.index, limit)
+
+    def _record(self, session: VoiceSession) -> None:
+        with self._stats_lock:
+            self.sessions += 1
+            self.speculation_hits += session.speculation_hit
+            for stage, milliseconds in session.latency.items():
+                self.latencies[stage].observe(milliseconds / 1000)
+
+    def _run(self) -> None:
+        """The batcher thread: collects requests into batches until close() queues None."""
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.perf_counter() + self.batch_wait
+            closing = False
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+            self._transcribe_batch(batch)
+            if closing:
+                return
+
+    def _transcribe_batch(self, batch: list[tuple]) -> None:
+        requests = [(audio, final) for audio, final, _, _ in batch]
+        started = time.perf_counter()
+        try:
+            instrumentation = get_instrumentation()
+            if instrumentation is None:
+                transcripts = self.transcriber.transcribe(requests)
+            else:
+                transcripts = instrumentation.call("VoicePipeline.transcribe", self.transcriber.transcribe, (requests,), {})
+            if len(transcripts) != len(batch):
+                raise ValueError(f"transcriber returned {len(transcripts)} transcripts for {len(batch)} requests")
+        except Exception as error:
+            for _, _, future, _ in batch:
+                future.set_exception(error)
+            return
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+        for (_, _, future, queued), transcript in zip(batch, transcripts):
+            future.set_result((transcript, started - queued, finished - started))
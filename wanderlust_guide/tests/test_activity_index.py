@@ -0,0 +1,60 @@
+import unittest
+from app.activity_index import ActivityIndex
+from app.bitmap_index import BitmapIndex
+from app.place_store import PlaceStore
+from app.search import activity_search, search_activities
+from tests.test_search import SAMPLE_PLACES_FOR_SEARCH
+
+PLACES_WITH_CASES = SAMPLE_PLACES_FOR_SEARCH + [
+    {"id": 6, "name": "River Loop", "activities": ["Hiking", "hiking", "Cycling"], "pet_friendly": True},
+    {"id": 7, "name": "Bike Shop"},
+]
+
+class TestActivityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ActivityIndex.from_places(PLACES_WITH_CASES)
+
+    def test_postings_are_sorted_and_unique(self):
+        """Test that each posting list is ascending with no duplicate rows."""
+        self.assertEqual(list(self.index.postings["hiking"]), [0, 2, 4, 5])
+        for rows in self.index.postings.values():
+            self.assertEqual(list(rows), sorted(set(rows)))
+
+    def test_lookup_case_insensitive(self):
+        """Test that lookups ignore letter case."""
+        self.assertEqual(self.index.lookup("HIKING"), [0, 2, 4, 5])
+        self.assertEqual(self.index.count("Cycling"), 1)
+        self.assertEqual(self.index.lookup("swimming"), [])
+
+    def test_lookup_all_and_any(self):
+        """Test AND and OR over several activities."""
+        self.assertEqual(self.index.lookup_all(["hiking", "cycling"]), [5])
+        self.assertEqual(self.index.lookup_all(["hiking", "swimming"]), [])
+        self.assertEqual(self.index.lookup_any(["reading", "cycling"]), [1, 3, 5])
+
+    def test_lookup_within_candidates(self):
+        """Test intersecting postings with candidate rows given as ids or a bitset."""
+        self.assertEqual(self.index.lookup("hiking", within=[5, 1, 2]), [2, 5])
+        self.assertEqual(self.index.lookup("hiking", within=0b100001), [0, 5])
+        self.assertEqual(self.index.lookup_any(["reading", "cycling"], within=[3]), [3])
+
+    def test_activity_search_matches_list_scan(self):
+        """Test that index and store results equal the list scan."""
+        store = PlaceStore.from_dicts(PLACES_WITH_CASES)
+        for activity in ["hiking", "HiKiNg", "reading", "swimming", ""]:
+            expected = activity_search(PLACES_WITH_CASES, activity)
+            self.assertEqual(activity_search(self.index, activity), expected)
+            self.assertEqual(activity_search(store, activity), expected)
+
+    def test_chained_search_with_filter_bitmap(self):
+        """Test searching an activity inside the rows selected by a filter."""
+        store = PlaceStore.from_dicts(PLACES_WITH_CASES)
+        filtered_rows = store.index(BitmapIndex).match({"pet_friendly"})
+        results = activity_search(store, "hiking", within=filtered_rows)
+        self.assertEqual([p["name"] for p in results], ["River Loop"])
+        results = search_activities(store, ["hiking", "rock climbing"])
+        self.assertEqual([p["name"] for p in results], ["Adventure Sports Center"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import tempfile
+import unittest
+from app.benchmark import QUERIES, WORKLOAD_SIZE, compare, main, parse_scale, run_benchmarks
+
+class TestBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.results = run_benchmarks(["300"], min_time=0.0)
+
+    def test_parse_scale(self):
+        """Test that scale labels and plain numbers are accepted and anything else refused."""
+        self.assertEqual(parse_scale("10k"), 10_000)
+        self.assertEqual(parse_scale("10M"), 10_000_000)
+        self.assertEqual(parse_scale("250k"), 250_000)
+        self.assertEqual(parse_scale("300"), 300)
+        with self.assertRaises(ValueError):
+            parse_scale("lots")
+
+    def test_results_cover_every_query_type(self):
+        """Test that each query type reports throughput, percentiles and peak memory."""
+        scale = self.results["scales"]["300"]
+        self.assertEqual(scale["places"], 300)
+        self.assertEqual(set(scale["index_ms"]), {"BitmapIndex", "ActivityIndex", "SpatialIndex", "ClusterIndex", "TextIndex"})
+        self.assertEqual(set(scale["queries"]), set(QUERIES))
+        for result in scale["queries"].values():
+            self.assertGreaterEqual(result["calls"], WORKLOAD_SIZE)
+            self.assertGreater(result["qps"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+            self.assertLessEqual(result["p95_ms"], result["p99_ms"])
+            self.assertGreaterEqual(result["peak_kb"], 0)
+
+    def test_compare(self):
+        """Test that slower, more memory-hungry or differently seeded results count as regressions."""
+        self.assertEqual(compare(self.results, self.results), [])
+        slower = copy.deepcopy(self.results)
+        filters = slower["scales"]["300"]["queries"]["filters"]
+        filters["qps"] /= 3
+        filters["p50_ms"] = filters["p50_ms"] * 2 + 1
+        filters["peak_kb"] = filters["peak_kb"] * 2 + 100
+        self.assertEqual(len(compare(slower, self.results)), 3)
+        self.assertEqual(compare(slower, {"seed": 0, "scales": {}}), [])
+        self.assertEqual(len(compare(self.results, dict(self.results, seed=7))), 1)
+
+    def test_main_fails_on_regression(self):
+        """Test that the command line writes a baseline, then exits with status 1 on a regression."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            arguments = ["--scales", "300", "--queries", "clusters", "--min-time", "0", "--baseline", path]
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(arguments + ["--update-baseline"])
+            with open(path, encoding="utf-8") as fp:
+                baseline = json.load(fp)
+            self.assertEqual(set(baseline["scales"]["300"]["queries"]), {"clusters"})
+            baseline["scales"]["300"]["queries"]["clusters"]["qps"] *= 1000
+            with open(path, "w", encoding="utf-8") as fp:
+                json.dump(baseline, fp)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out), self.assertRaises(SystemExit) as exit_:
+                main(arguments)
+        self.assertEqual(exit_.exception.code, 1)
+        self.assertIn("REGRESSION 300 clusters: throughput", out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
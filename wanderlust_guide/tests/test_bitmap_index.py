@@ -0,0 +1,63 @@
+import unittest
+from itertools import combinations
+from app.bitmap_index import BitmapIndex
+from app.filters import apply_filters, get_filter_counts, register_filter, DETAILED_FILTERS
+from app.place_store import PlaceStore
+from tests.test_filters import SAMPLE_PLACES_DATA
+
+class TestBitmapIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BitmapIndex.from_places(SAMPLE_PLACES_DATA, keys=DETAILED_FILTERS)
+
+    def test_bitmap_per_filter(self):
+        """Test that each filter key gets a bitset of matching rows."""
+        self.assertEqual(self.index.bitmap("pet_friendly"), 0b10110) # Place B, C, E
+        self.assertEqual(self.index.bitmap("wifi_available"), 0b00110) # Place E is missing the key
+
+    def test_unindexed_key_is_built_on_demand(self):
+        """Test that a key missing from every place matches nothing."""
+        self.assertEqual(self.index.bitmap("free_entry"), 0)
+        self.assertIn("free_entry", self.index.keys())
+
+    def test_matches_linear_filter_for_all_combinations(self):
+        """Test that bitmap results equal apply_filters on the list for every filter combination."""
+        store = PlaceStore.from_dicts(SAMPLE_PLACES_DATA)
+        keys = list(DETAILED_FILTERS)
+        for r in range(len(keys) + 1):
+            for combo in combinations(keys, r):
+                expected = apply_filters(SAMPLE_PLACES_DATA, set(combo))
+                self.assertEqual(apply_filters(self.index, set(combo)), expected)
+                self.assertEqual(apply_filters(store, set(combo)), expected)
+                self.assertEqual(self.index.count(combo), len(expected))
+
+    def test_rows_are_original_objects(self):
+        """Test that an index over a list returns the original place dicts."""
+        rows = self.index.rows(self.index.match({"pet_friendly"}))
+        self.assertIs(rows[0], SAMPLE_PLACES_DATA[1])
+
+    def test_register_attribute_with_predicate(self):
+        """Test registering a derived boolean attribute."""
+        bits = self.index.register_attribute("fully_equipped", lambda p: p.get("wifi_available") and p.get("parking_available"))
+        self.assertEqual(bits, 0b00010) # Place B only
+        self.assertEqual(self.index.count({"fully_equipped", "pet_friendly"}), 1)
+
+    def test_facet_counts(self):
+        """Test facet counts given an active selection."""
+        counts = get_filter_counts(SAMPLE_PLACES_DATA, {"pet_friendly"})
+        self.assertEqual(counts["wifi_available"], 2)
+        self.assertEqual(counts["parking_available"], 1)
+        self.assertEqual(counts["pet_friendly"], 3)
+        self.assertEqual(set(counts), set(DETAILED_FILTERS))
+
+    def test_register_filter(self):
+        """Test that a registered filter shows up in facet counts."""
+        register_filter("free_entry", "Free Entry")
+        try:
+            places = SAMPLE_PLACES_DATA + [{"id": 6, "name": "Place F", "free_entry": True}]
+            self.assertEqual(get_filter_counts(PlaceStore.from_dicts(places))["free_entry"], 1)
+        finally:
+            del DETAILED_FILTERS["free_entry"]
+
+if __name__ == '__main__':
+    unittest.main()
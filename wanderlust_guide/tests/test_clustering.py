@@ -0,0 +1,90 @@
+import random
+import unittest
+from app.clustering import ClusterIndex, project, unproject
+from app.map_utils import get_map_clusters
+
+def _city_places(n, seed=5):
+    rng = random.Random(seed)
+    return [
+        {"id": i, "name": f"Place {i}", "latitude": rng.gauss(13.75, 0.05), "longitude": rng.gauss(100.5, 0.05)}
+        for i in range(n)
+    ]
+
+class TestClusterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.places = _city_places(500) + [{"id": 999, "name": "Unmapped"}]
+        self.index = ClusterIndex.from_places(self.places)
+
+    def test_project_round_trip(self):
+        """Test that unproject inverts project."""
+        lat, lon = unproject(*project(13.75, 100.5))
+        self.assertAlmostEqual(lat, 13.75)
+        self.assertAlmostEqual(lon, 100.5)
+
+    def test_counts_are_conserved_at_every_zoom(self):
+        """Test that every mapped place is counted exactly once at each zoom level."""
+        for zoom in range(0, 22):
+            features = self.index.get_clusters(zoom)
+            self.assertEqual(sum(f["count"] for f in features), 500, zoom)
+
+    def test_low_zoom_merges_high_zoom_separates(self):
+        """Test that zooming out merges places and zooming past max_zoom shows them all."""
+        self.assertEqual(len(self.index.get_clusters(0)), 1)
+        self.assertEqual(len(self.index.get_clusters(21)), 500)
+        self.assertTrue(all("row" in f for f in self.index.get_clusters(21)))
+
+    def test_expansion_zoom(self):
+        """Test that a cluster splits at its expansion zoom."""
+        cluster = next(f for f in self.index.get_clusters(8) if "cluster_id" in f)
+        expansion_zoom = cluster["expansion_zoom"]
+        self.assertEqual(self.index.get_cluster_expansion_zoom(cluster["cluster_id"]), expansion_zoom)
+        self.assertGreater(expansion_zoom, 8)
+        ids_at_expansion = {f.get("cluster_id") for f in self.index.get_clusters(expansion_zoom)}
+        self.assertNotIn(cluster["cluster_id"], ids_at_expansion)
+
+    def test_viewport_limits_results(self):
+        """Test that only items inside the viewport are returned."""
+        ne, sw = (13.75, 100.5), (13.70, 100.45)
+        features = self.index.get_clusters(21, ne, sw)
+        expected = [
+            i for i, p in enumerate(self.places)
+            if "latitude" in p and 13.70 <= p["latitude"] <= 13.75 and 100.45 <= p["longitude"] <= 100.5
+        ]
+        self.assertEqual([f["row"] for f in features], expected)
+
+    def test_get_map_clusters_response_shape(self):
+        """Test that get_map_clusters keeps the clusters/places response shape without member lists."""
+        result = get_map_clusters(self.index, 10)
+        self.assertEqual(result["type"], "clusters")
+        self.assertEqual(sum(result["data"].values()), 500)
+        for key, detail in result["details"].items():
+            self.assertEqual(detail["count"], result["data"][key])
+            self.assertIn("latitude", detail)
+        result = get_map_clusters(self.index, 21)
+        self.assertEqual(result["type"], "places")
+        self.assertEqual(result["data"], self.places[:500])
+        # Past PLACES_ZOOM the individual places are returned, as for list input.
+        self.assertEqual(get_map_clusters(self.index, 16), result)
+
+    def test_list_input_with_viewport(self):
+        """Test that list input honours an optional viewport."""
+        result = get_map_clusters(self.places, 16, (13.75, 100.5), (13.70, 100.45))
+        self.assertEqual(result["type"], "places")
+        self.assertTrue(all(13.70 <= p["latitude"] <= 13.75 for p in result["data"]))
+
+    def test_summary_only(self):
+        """Test that summary_only returns the counts alone for index and list input, at any zoom."""
+        for zoom in (10, 21):
+            full = get_map_clusters(self.index, zoom)
+            summary = get_map_clusters(self.index, zoom, summary_only=True)
+            self.assertEqual(summary["type"], "summary")
+            self.assertEqual(sum(summary["data"].values()), 500)
+            if full["type"] == "clusters":
+                self.assertEqual(summary["data"], full["data"])
+        self.assertEqual(get_map_clusters(self.places, 10, summary_only=True),
+                         {"type": "summary", "data": get_map_clusters(self.places, 10)["data"]})
+        self.assertEqual(get_map_clusters(self.places, 18, summary_only=True), {"type": "summary", "data": {"places": 501}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import contextlib
+import io
+import json
+import unittest
+from app.filters import apply_filters
+from app.instrumentation import Histogram, Instrumentation, Metrics, instrumented, percentile, set_instrumentation
+from app.map_utils import find_places_in_map_area, get_map_clusters
+from app.place_store import PlaceStore
+from app.query_cache import CachedPlaces
+from app.sample_data import SAMPLE_PLACES
+from app.search import activity_search, text_search, voice_search
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantiles_interpolate_within_buckets(self):
+        """Test that quantiles interpolate inside the bucket and overflow reports the last bound."""
+        histogram = Histogram((1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 0])
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertAlmostEqual(histogram.quantile(1.0), 4.0)
+        histogram.observe(100.0)
+        self.assertEqual(histogram.quantile(0.99), 4.0)
+        self.assertEqual(Histogram().quantile(0.5), 0.0)
+
+    def test_nearest_rank_percentile(self):
+        """Test that percentile picks the nearest-rank value of a sorted list."""
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual([percentile(values, q) for q in (0.0, 0.5, 0.75, 0.99, 1.0)], [1.0, 2.0, 3.0, 4.0, 4.0])
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.previous = set_instrumentation(self.metrics)
+        self.store = PlaceStore.from_dicts(SAMPLE_PLACES)
+
+    def tearDown(self):
+        set_instrumentation(self.previous)
+
+    def test_hot_functions_do_not_print(self):
+        """Test that the query functions write nothing to stdout."""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            apply_filters(SAMPLE_PLACES, {"pet_friendly"})
+            activity_search(self.store, "hiking")
+            find_places_in_map_area(self.store, (34.1, -118.2), (34.0, -118.3))
+            get_map_clusters(SAMPLE_PLACES, 10)
+            text_search("park", self.store)
+            voice_search(self.store)
+        self.assertEqual(out.getvalue(), "")
+
+    def test_latency_and_row_counts(self):
+        """Test that each call is timed and its scanned and returned rows are counted."""
+        for _ in range(3):
+            found = apply_filters(SAMPLE_PLACES, {"pet_friendly"})
+        apply_filters(self.store, {"pet_friendly"})
+        functions = self.metrics.to_json()["functions"]
+        self.assertEqual(functions["apply_filters"]["calls"], 4)
+        self.assertEqual(functions["apply_filters"]["rows_scanned"], 3 * len(SAMPLE_PLACES) + len(found))
+        self.assertEqual(functions["apply_filters"]["rows_returned"], 4 * len(found))
+        self.assertLessEqual(functions["apply_filters"]["p50_ms"], functions["apply_filters"]["p99_ms"])
+
+    def test_index_paths_count_entries_read(self):
+        """Test that index paths count the index entries they read, and an empty filter set counts every row."""
+        apply_filters(self.store, {"pet_friendly", "wifi_available"})
+        apply_filters(self.store, set())
+        activity_search(self.store, "hiking")
+        find_places_in_map_area(self.store, (90.0, 180.0), (-90.0, -180.0))
+        functions = self.metrics.to_json()["functions"]
+        entries = sum(sum(1 for place in SAMPLE_PLACES if place.get(key)) for key in ("pet_friendly", "wifi_available"))
+        self.assertEqual(functions["apply_filters"]["rows_scanned"], entries + len(SAMPLE_PLACES))
+        hiking = sum(1 for place in SAMPLE_PLACES if "hiking" in place.get("activities", []))
+        self.assertEqual(functions["activity_search"]["rows_scanned"], hiking)
+        located = sum(1 for place in SAMPLE_PLACES if place.get("latitude") is not None)
+        self.assertEqual(functions["find_places_in_map_area"]["rows_scanned"], located)
+
+    def test_cache_and_index_hit_rates(self):
+        """Test that index builds count as misses, reuse as hits, and the query cache is tracked too."""
+        find_places_in_map_area(self.store, (34.1, -118.2), (34.0, -118.3))
+        find_places_in_map_area(self.store, (34.1, -118.2), (34.0, -118.3))
+        cached = CachedPlaces(self.store)
+        cached.apply_filters({"pet_friendly"})
+        cached.apply_filters({"pet_friendly"})
+        caches = self.metrics.to_json()["caches"]
+        self.assertEqual(caches["index.SpatialIndex"], {"hits": 1, "misses": 1, "hit_rate": 0.5})
+        self.assertEqual(caches["query_cache"]["hits"], 1)
+        self.assertIn("CachedPlaces.apply_filters", self.metrics.to_json()["functions"])
+
+    def test_sampled_profiles(self):
+        """Test that profile_every profiles one call in N and merges the samples."""
+        self.metrics.profile_every = 2
+        for _ in range(4):
+            activity_search(self.store, "hiking")
+        self.assertGreater(self.metrics.profiles["activity_search"].total_calls, 0)
+        self.assertIn("activity_search", self.metrics.profile_report("activity_search"))
+        self.assertEqual(self.metrics.profile_report("text_search"), "")
+
+    def test_exporters(self):
+        """Test that the JSON export round-trips and the Prometheus export has cumulative buckets."""
+        text_search("park", self.store)
+        self.assertEqual(json.loads(json.dumps(self.metrics.to_json())), self.metrics.to_json())
+        text = self.metrics.to_prometheus()
+        self.assertIn('wanderlust_query_duration_seconds_bucket{function="text_search",le="+Inf"} 1', text)
+        self.assertIn('wanderlust_query_duration_seconds_count{function="text_search"} 1', text)
+        self.assertIn('wanderlust_rows_returned_total{function="text_search"}', text)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.to_json(), {"functions": {}, "caches": {}, "errors": {}})
+
+    def test_custom_instrumentation(self):
+        """Test that any Instrumentation subclass receives the calls it is installed for."""
+        calls = []
+
+        class Recorder(Instrumentation):
+            def call(self, name, function, args, kwargs):
+                calls.append(name)
+                return function(*args, **kwargs)
+
+        @instrumented
+        def double(x):
+            return 2 * x
+
+        set_instrumentation(Recorder())
+        self.assertEqual(double(4), 8)
+        self.assertEqual(calls, ["TestMetrics.test_custom_instrumentation.<locals>.double"])
+        set_instrumentation(None)
+        self.assertEqual(double(5), 10)
+        self.assertEqual(len(calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import random
+import threading
+import unittest
+from app import bitset
+from app.filters import apply_filters
+from app.live_store import LivePlaceStore
+from app.map_utils import find_places_in_map_area, get_place_coordinates
+from app.search import activity_search
+
+def _random_place(rng):
+    place = {
+        "name": f"Place {rng.randint(0, 200)}",
+        "activities": [rng.choice(["Diving", "hiking", "yoga"])],
+        "pet_friendly": rng.random() < 0.4,
+    }
+    if rng.random() < 0.95:
+        place["latitude"] = rng.uniform(0, 10)
+        place["longitude"] = rng.uniform(0, 10)
+    return place
+
+class TestLivePlaceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(6)
+        initial = [_random_place(self.rng) for _ in range(500)]
+        self.store = LivePlaceStore(initial)
+        self.model = dict(enumerate(initial))
+
+    def _random_writes(self, n):
+        for _ in range(n):
+            r = self.rng.random()
+            if r < 0.4 or not self.model:
+                place = _random_place(self.rng)
+                self.model[self.store.insert(place)] = place
+            elif r < 0.7:
+                key = self.rng.choice(list(self.model))
+                place = _random_place(self.rng)
+                self.store.update(key, place)
+                self.model[key] = place
+            else:
+                key = self.rng.choice(list(self.model))
+                self.store.delete(key)
+                del self.model[key]
+
+    def _assert_matches_model(self):
+        snapshot = self.store.snapshot()
+        self.assertEqual(sorted(snapshot.keys()), sorted(self.model))
+        expected = [self.model[key] for key in snapshot.keys()]
+        self.assertEqual(snapshot.places(), expected)
+        self.assertEqual(snapshot.apply_filters({"pet_friendly"}), apply_filters(expected, {"pet_friendly"}))
+        self.assertEqual(snapshot.activity_search("diving"), activity_search(expected, "diving"))
+        ne, sw = (6.0, 7.0), (2.0, 3.0)
+        self.assertEqual(snapshot.find_places_in_map_area(ne, sw), find_places_in_map_area(expected, ne, sw))
+        for name in ("Place 1", "Place 50", "Missing"):
+            self.assertEqual(snapshot.get_place_coordinates(name), get_place_coordinates(name, expected))
+
+    def test_writes_are_visible_in_new_snapshots(self):
+        """Test that inserts, updates and deletes are reflected by every query."""
+        self._random_writes(400)
+        self._assert_matches_model()
+
+    def test_old_snapshots_do_not_change(self):
+        """Test that a snapshot taken before writes keeps returning the old places."""
+        before = self.store.snapshot()
+        places = before.places()
+        self._random_writes(100)
+        self.assertEqual(before.places(), places)
+        self.assertNotEqual(self.store.snapshot().version, before.version)
+
+    def test_writes_branching_from_an_old_snapshot(self):
+        """Test that a write applied to an older snapshot leaves the snapshots written after it unchanged."""
+        self._random_writes(50)
+        old = self.store.snapshot()
+        self._random_writes(50)
+        newer = self.store.snapshot()
+        places = newer.places()
+        branch = old.with_place(10_000, {"name": "Branch", "pet_friendly": True}, old.version + 1)
+        self.assertEqual(newer.places(), places)
+        self.assertEqual(branch.places(), old.places() + [{"name": "Branch", "pet_friendly": True}])
+        self.assertEqual(branch.apply_filters({"pet_friendly"})[-1]["name"], "Branch")
+        self.assertIsNone(newer.get(10_000))
+
+    def test_chunked_live_bits(self):
+        """Test that ChunkedBits writes return new bitsets that share the untouched chunks."""
+        bits = bitset.ChunkedBits.full(10_000)
+        cleared = bits.with_bit(5000, False).with_bit(20_000)
+        self.assertEqual(bits.to_int(), bitset.full(10_000))
+        self.assertEqual(cleared.to_int(), (bitset.full(10_000) & ~(1 << 5000)) | (1 << 20_000))
+        self.assertEqual((cleared.count(), cleared[5000], cleared[20_000], cleared[4999]), (10_000, False, True, True))
+        self.assertIs(cleared.chunks[0], bits.chunks[0])
+        self.assertIs(cleared.with_bit(1), cleared)
+
+    def test_compaction_preserves_places(self):
+        """Test that compaction empties the delta without changing the places."""
+        self._random_writes(300)
+        self.store.compact()
+        self.assertEqual(self.store.snapshot().delta_size, 0)
+        self._assert_matches_model()
+        self._random_writes(100)
+        self._assert_matches_model()
+
+    def test_missing_key(self):
+        """Test that updating or deleting an unknown key raises KeyError."""
+        with self.assertRaises(KeyError):
+            self.store.update(10_000, {"name": "Nowhere"})
+        key = self.store.insert({"name": "Temporary"})
+        self.store.delete(key)
+        with self.assertRaises(KeyError):
+            self.store.delete(key)
+
+    def test_background_compaction_with_concurrent_readers(self):
+        """Test that readers see consistent snapshots while a writer and the compactor run."""
+        store = LivePlaceStore(compaction_threshold=50)
+        store.start_compaction(interval=0.01)
+        errors = []
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                snapshot = store.snapshot()
+                if len(snapshot.places()) != len(snapshot):
+                    errors.append(snapshot.version)
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        keys = [store.insert({"name": f"Place {i}", "pet_friendly": i % 2 == 0}) for i in range(500)]
+        for key in keys[::3]:
+            store.delete(key)
+        done.set()
+        for reader in readers:
+            reader.join()
+        store.stop_compaction()
+        self.assertEqual(errors, [])
+        self.assertGreater(store.compactions, 0)
+        self.assertEqual(len(store), 500 - len(keys[::3]))
+        self.assertEqual(len(store.snapshot().apply_filters({"pet_friendly"})),
+                         sum(1 for i in range(500) if i % 2 == 0 and i % 3 != 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import random
+import unittest
+from unittest.mock import patch
+from app.geo import haversine_m
+from app.map_utils import get_place_coordinates
+from app.name_index import NameIndex, normalize_name
+from app.place_store import PlaceStore
+from app.search import autocomplete
+
+PLACES = [
+    {"name": "Café de Flore", "popularity": 50, "latitude": 48.854, "longitude": 2.333},
+    {"name": "Cafe Central", "popularity": 90, "latitude": 48.210, "longitude": 16.366},
+    {"name": "Canal Saint-Martin", "popularity": 70, "latitude": 48.871, "longitude": 2.365},
+    {"name": "Louvre", "popularity": 100, "latitude": 48.861, "longitude": 2.336},
+    {"name": "ร้านกาแฟ", "popularity": 10},
+    {"name": "Cafe Central", "popularity": 5, "latitude": 1.0, "longitude": 1.0}, # Duplicate name
+    {"description": "No name"},
+]
+
+class TestNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = NameIndex.from_places(PLACES)
+
+    def test_normalize_name(self):
+        """Test case and accent folding that leaves Thai marks alone."""
+        self.assertEqual(normalize_name("CAFÉ"), "cafe")
+        self.assertEqual(normalize_name("ร้าน"), "ร้าน")
+
+    def test_exact_lookup_returns_first_match(self):
+        """Test that exact lookup behaves like the first hit of a linear scan."""
+        self.assertEqual(self.index.lookup("Cafe Central"), 1)
+        self.assertIsNone(self.index.lookup("cafe central"))
+        self.assertEqual(self.index.lookup_normalized("CAFE central"), [1, 5])
+
+    def test_get_place_coordinates_matches_linear_scan(self):
+        """Test indexed coordinate lookups against the list implementation."""
+        store = PlaceStore.from_dicts(PLACES)
+        for name in ["Cafe Central", "Louvre", "ร้านกาแฟ", "Nowhere"]:
+            expected = get_place_coordinates(name, PLACES)
+            self.assertEqual(get_place_coordinates(name, self.index), expected)
+            self.assertEqual(get_place_coordinates(name, store), expected)
+
+    def test_complete_ranks_by_popularity(self):
+        """Test prefix completion ordered by popularity, ignoring case and accents."""
+        names = [PLACES[row]["name"] for row in self.index.complete("CA")]
+        self.assertEqual(names, ["Cafe Central", "Canal Saint-Martin", "Café de Flore", "Cafe Central"])
+        self.assertEqual(self.index.complete("café", limit=2), [1, 0])
+        self.assertEqual(self.index.complete("cafe d"), [0])
+        self.assertEqual(self.index.complete("zz"), [])
+        self.assertEqual(self.index.complete("ร้าน"), [4])
+
+    def test_complete_precomputed_and_scanned_agree(self):
+        """Test that precomputed short prefixes rank like a scanned range."""
+        for prefix in ["", "c", "ca", "l"]:
+            precomputed = self.index.complete(prefix, limit=3)
+            scanned = self.index.complete(prefix, limit=20)[:3]
+            self.assertEqual(precomputed, scanned, prefix)
+
+    def test_complete_ranks_by_distance(self):
+        """Test prefix completion ordered by distance from a point."""
+        rows = self.index.complete("ca", near=(48.87, 2.36))
+        self.assertEqual(rows, [2, 0, 1, 5])
+
+    def test_complete_matches_brute_force(self):
+        """Test every prefix of names sharing long prefixes, by popularity and by distance, against sorting all matches."""
+        rng = random.Random(7)
+        words = ["gol", "golden", "go", "lotus", "lot"]
+        places = []
+        for i in range(600):
+            place = {"name": " ".join(rng.choice(words) for _ in range(rng.randint(1, 3))), "popularity": rng.randint(0, 9)}
+            if rng.random() < 0.9:
+                place["latitude"], place["longitude"] = rng.uniform(-60, 60), rng.uniform(-180, 180)
+            places.append(place)
+        index = NameIndex.from_places(places)
+        position = {row: pos for pos, row in enumerate(index.key_rows)}
+        prefixes = {key[:length] for key in index.keys for length in range(len(key) + 1)}
+
+        def by_distance(near):
+            def key(row):
+                place = places[row]
+                if "latitude" not in place:
+                    return (float("inf"), position[row])
+                return (haversine_m(near[0], near[1], place["latitude"], place["longitude"]), position[row])
+            return key
+
+        for threshold in (0, 256): # Searching the tree, and scanning small ranges
+            with patch("app.name_index.NEAR_SCAN_THRESHOLD", threshold):
+                for prefix in sorted(prefixes):
+                    matches = [row for row in range(len(places)) if index.keys[position[row]].startswith(prefix)]
+                    for limit in (1, 10, 30):
+                        expected = sorted(matches, key=lambda row: (-places[row]["popularity"], position[row]))[:limit]
+                        self.assertEqual(index.complete(prefix, limit), expected, prefix)
+                        near = (rng.uniform(-60, 60), rng.uniform(-180, 180))
+                        self.assertEqual(index.complete(prefix, limit, near), sorted(matches, key=by_distance(near))[:limit], prefix)
+
+    def test_autocomplete_returns_places(self):
+        """Test the search-level autocomplete wrapper."""
+        results = autocomplete("lou", places=PLACES)
+        self.assertEqual([p["name"] for p in results], ["Louvre"])
+
+if __name__ == '__main__':
+    unittest.main()
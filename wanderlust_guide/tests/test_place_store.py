@@ -0,0 +1,98 @@
+import io
+import json
+import unittest
+from app.place_store import PlaceStore
+from app.filters import apply_filters
+from app.search import activity_search
+from app.map_utils import find_places_in_map_area, get_map_clusters, get_place_coordinates
+
+# Sample places with a mix of present, missing and extra keys
+SAMPLE_PLACES = [
+    {"id": 1, "name": "Adventure Park", "description": "Fun for all ages", "suitable_for_kids": True, "parking_available": True, "pet_friendly": False, "activities": ["hiking", "zip-lining"], "latitude": 34.0522, "longitude": -118.2437},
+    {"id": 2, "name": "Quiet Cafe", "description": "Relax and unwind", "wifi_available": True, "pet_friendly": True, "activities": ["reading", "board games"], "latitude": 34.0550, "longitude": -118.2500},
+    {"id": 3, "name": "Dog Haven", "pet_friendly": True, "parking_available": True, "activities": ["Hiking", "fetch"], "latitude": 34.0600, "longitude": -118.2600},
+    {"id": 4, "name": "Mountain Trails", "description": "Scenic hiking paths", "parking_available": True, "latitude": 34.1500, "longitude": -118.3000},
+    {"id": 5, "name": "ร้านกาแฟ", "description": "กาแฟสด", "pet_friendly": True},
+]
+
+class TestPlaceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PlaceStore.from_dicts(SAMPLE_PLACES)
+
+    def test_round_trip_to_dicts(self):
+        """Test that materialized rows equal the original dictionaries."""
+        self.assertEqual(len(self.store), len(SAMPLE_PLACES))
+        self.assertEqual(self.store.to_dicts(), SAMPLE_PLACES)
+        self.assertEqual(self.store[-1], SAMPLE_PLACES[-1])
+
+    def test_index_out_of_range(self):
+        """Test that indexing past the end raises IndexError."""
+        with self.assertRaises(IndexError):
+            self.store[len(SAMPLE_PLACES)]
+
+    def test_bool_columns_are_bitsets(self):
+        """Test that boolean attributes are packed into bitsets keyed by row."""
+        self.assertEqual(self.store.bool_column("pet_friendly"), 0b10110)
+        self.assertEqual(self.store.bool_column("unknown_key"), 0)
+
+    def test_activities_are_interned(self):
+        """Test that repeated activities share one vocabulary entry."""
+        store = PlaceStore.from_dicts([{"activities": ["hiking"]}, {"activities": ["hiking", "cycling"]}])
+        self.assertEqual(store.activities.vocabulary, ["hiking", "cycling"])
+        self.assertEqual(store[1]["activities"], ["hiking", "cycling"])
+
+    def test_extend_appends_rows(self):
+        """Test that extend keeps earlier rows and bumps the version."""
+        version = self.store.version
+        self.store.extend([{"name": "New Place", "pet_friendly": True}])
+        self.assertEqual(len(self.store), len(SAMPLE_PLACES) + 1)
+        self.assertEqual(self.store[0], SAMPLE_PLACES[0])
+        self.assertEqual(self.store[-1], {"name": "New Place", "pet_friendly": True})
+        self.assertGreater(self.store.version, version)
+
+    def test_from_json_array_and_lines(self):
+        """Test loading from a JSON array and from JSON Lines."""
+        as_array = PlaceStore.from_json(io.StringIO(json.dumps(SAMPLE_PLACES)))
+        as_lines = PlaceStore.from_json(io.StringIO("\n".join(json.dumps(p) for p in SAMPLE_PLACES)))
+        self.assertEqual(as_array.to_dicts(), SAMPLE_PLACES)
+        self.assertEqual(as_lines.to_dicts(), SAMPLE_PLACES)
+
+    def test_coordinates_missing(self):
+        """Test that missing coordinates come back as None."""
+        self.assertEqual(self.store.coordinates(4), (None, None))
+
+class TestPlaceStoreQueries(unittest.TestCase):
+    """The public query functions must give the same answers for a store as for a list."""
+
+    def setUp(self):
+        self.store = PlaceStore.from_dicts(SAMPLE_PLACES)
+
+    def test_apply_filters(self):
+        for active in [set(), {"pet_friendly"}, {"pet_friendly", "parking_available"}, {"wifi_available"}, {"missing"}]:
+            self.assertEqual(apply_filters(self.store, active), apply_filters(SAMPLE_PLACES, active))
+
+    def test_activity_search(self):
+        for activity in ["hiking", "HIKING", "fetch", "swimming", ""]:
+            self.assertEqual(activity_search(self.store, activity), activity_search(SAMPLE_PLACES, activity))
+
+    def test_find_places_in_map_area(self):
+        ne, sw = (34.0700, -118.2200), (34.0300, -118.2700)
+        self.assertEqual(find_places_in_map_area(self.store, ne, sw), find_places_in_map_area(SAMPLE_PLACES, ne, sw))
+
+    def test_get_map_clusters(self):
+        """Stores are clustered by their ClusterIndex, which keeps the response shape."""
+        result = get_map_clusters(self.store, 20)
+        self.assertEqual(result["type"], "places")
+        self.assertEqual(result["data"], SAMPLE_PLACES[:4])
+        result = get_map_clusters(self.store, 3)
+        self.assertEqual(result["type"], "clusters")
+        self.assertEqual(sum(result["data"].values()), 4)
+
+    def test_get_place_coordinates(self):
+        self.assertEqual(get_place_coordinates("Dog Haven", self.store), (34.0600, -118.2600))
+        self.assertEqual(get_place_coordinates("ร้านกาแฟ", self.store), (None, None))
+        self.assertIsNone(get_place_coordinates("Nowhere", self.store))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import random
+import unittest
+from app.geo import haversine_m, in_viewport
+from app.place_store import PlaceStore
+from app.planner import explain, plan_query, query
+
+WORDS = ["coffee", "beach", "temple", "market", "park", "museum"]
+
+def _random_places(n, seed=9):
+    rng = random.Random(seed)
+    return [
+        {"name": f"{rng.choice(WORDS)} {i}", "description": " ".join(rng.choices(WORDS, k=3)),
+         "activities": rng.sample(["diving", "hiking", "kayaking", "yoga"], 2),
+         "latitude": rng.gauss(13.75, 0.5), "longitude": rng.gauss(100.5, 0.5),
+         "pet_friendly": rng.random() < 0.3, "wifi_available": rng.random() < 0.5}
+        for i in range(n)
+    ]
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.places = _random_places(5000)
+        self.store = PlaceStore.from_dicts(self.places)
+
+    def _matching(self, filters=(), activities=(), bbox=None):
+        return [
+            p for p in self.places
+            if all(p[f] for f in filters) and all(a in p["activities"] for a in activities)
+            and (bbox is None or in_viewport(p["latitude"], p["longitude"], *bbox))
+        ]
+
+    def test_filters_and_activities_in_row_order(self):
+        """Test that filters and activities combine like apply_filters followed by activity_search."""
+        expected = self._matching(filters={"pet_friendly", "wifi_available"}, activities=["diving"])
+        result = query(filters={"pet_friendly", "wifi_available"}, activities=["diving"], limit=None, places=self.store)
+        self.assertEqual(result, expected)
+
+    def test_bbox_with_filters(self):
+        """Test that a viewport query probes the filters and stops at the limit."""
+        bbox = ((13.9, 100.7), (13.6, 100.3))
+        expected = self._matching(filters={"pet_friendly"}, bbox=bbox)[:5]
+        self.assertEqual(query(filters={"pet_friendly"}, bbox=bbox, limit=5, places=self.store), expected)
+
+    def test_near_orders_by_distance(self):
+        """Test that near ranks by distance within the radius, after the other predicates."""
+        candidates = self._matching(activities=["yoga"])
+        distances = sorted(
+            (haversine_m(13.75, 100.5, p["latitude"], p["longitude"]), i) for i, p in enumerate(candidates)
+        )
+        expected = [candidates[i] for d, i in distances if d <= 20_000][:10]
+        self.assertEqual(query(activities=["yoga"], near=(13.75, 100.5, 20_000), places=self.store), expected)
+
+    def test_text_relevance_with_filters(self):
+        """Test that text with filters returns the best matches among the filtered places."""
+        result = query(text="temple", filters={"pet_friendly"}, places=self.store)
+        self.assertEqual(len(result), 10)
+        for place in result:
+            self.assertTrue(place["pet_friendly"])
+            self.assertIn("temple", place["name"] + " " + place["description"])
+
+    def test_most_selective_predicate_drives(self):
+        """Test that the plan starts from the predicate with the fewest estimated rows."""
+        bbox = ((13.76, 100.51), (13.75, 100.5))
+        plan = plan_query(self.store, filters={"wifi_available"}, bbox=bbox)
+        plan.execute()
+        self.assertEqual(plan.stages[0].operation, "scan")
+        self.assertTrue(plan.stages[0].description.startswith("bbox"))
+        self.assertEqual(plan.stages[1].operation, "probe")
+
+    def test_explain(self):
+        """Test that explain lists every stage with its row counts."""
+        text = explain(filters={"pet_friendly"}, activities=["diving"], places=self.store)
+        lines = text.splitlines()
+        self.assertIn("ranked by row", lines[0])
+        self.assertIn("scan filters ['pet_friendly']", lines[1])
+        self.assertIn("intersect activities ['diving']", lines[2])
+        self.assertIn(" in, ", lines[2])
+
+    def test_list_input(self):
+        """Test that a list of places is accepted and indexed for the call."""
+        self.assertEqual(query(activities=["hiking"], limit=3, places=self.places), self._matching(activities=["hiking"])[:3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import random
+import unittest
+from app.filters import apply_filters
+from app.map_utils import find_places_in_map_area, get_map_clusters
+from app.place_store import PlaceStore
+from app.query_cache import CachedPlaces, LRUCache, snap_viewport
+
+def _city_places(n, seed=4):
+    rng = random.Random(seed)
+    return [
+        {"id": i, "name": f"Place {i}", "latitude": rng.gauss(13.75, 0.5), "longitude": rng.gauss(100.5, 0.5),
+         "pet_friendly": rng.random() < 0.4, "wifi_available": rng.random() < 0.5}
+        for i in range(n)
+    ]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        """Test that lookups are counted as hits or misses."""
+        cache = LRUCache()
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_evicts_least_recently_used_within_budget(self):
+        """Test that the byte budget evicts the least recently used entries first."""
+        cache = LRUCache(max_bytes=3000)
+        cache.put("a", "x", nbytes=800)
+        cache.put("b", "x", nbytes=800)
+        cache.get("a")
+        cache.put("c", "x", nbytes=800)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "x")
+        self.assertEqual(cache.get("c"), "x")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], 3000)
+        cache.put("huge", "x", nbytes=10_000)
+        self.assertIsNone(cache.get("huge"))
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the time to live."""
+        clock = FakeClock()
+        cache = LRUCache(ttl=10, clock=clock)
+        cache.put("a", 1)
+        clock.now = 9.9
+        self.assertEqual(cache.get("a"), 1)
+        clock.now = 10.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_version_invalidation(self):
+        """Test that a new dataset version empties the cache."""
+        cache = LRUCache()
+        cache.validate(1)
+        cache.put("a", 1)
+        cache.validate(1)
+        self.assertEqual(cache.get("a"), 1)
+        cache.validate(2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+class TestSnapViewport(unittest.TestCase):
+
+    def test_snapped_viewport_contains_viewport(self):
+        """Test that snapping only grows the viewport and nearby viewports share a key."""
+        key, ne, sw = snap_viewport((13.8, 100.6), (13.7, 100.5), 12)
+        self.assertTrue(ne[0] >= 13.8 and ne[1] >= 100.6 and sw[0] <= 13.7 and sw[1] <= 100.5)
+        self.assertEqual(snap_viewport((13.8001, 100.6001), (13.7001, 100.5001), 12)[0], key)
+
+    def test_antimeridian(self):
+        """Test that a viewport crossing the antimeridian stays split after snapping."""
+        _, ne, sw = snap_viewport((10.0, -175.0), (0.0, 175.0), 6)
+        self.assertGreater(sw[1], ne[1])
+        self.assertTrue(sw[1] <= 175.0 and ne[1] >= -175.0)
+
+class TestCachedPlaces(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PlaceStore.from_dicts(_city_places(3000))
+        self.cached = CachedPlaces(self.store)
+
+    def test_viewport_results_match(self):
+        """Test that cached viewport queries return exactly the uncached places and hit on small pans."""
+        rng = random.Random(8)
+        for _ in range(100):
+            lat, lon, span = rng.uniform(13, 14.5), rng.uniform(99.5, 101.5), rng.choice([0.01, 0.1, 1.0])
+            for jiggle in (0.0, span / 1000):
+                ne, sw = (lat + span + jiggle, lon + span + jiggle), (lat + jiggle, lon + jiggle)
+                self.assertEqual(self.cached.find_places_in_map_area(ne, sw), find_places_in_map_area(self.store, ne, sw))
+        self.assertGreaterEqual(self.cached.stats()["hits"], 90)
+
+    def test_cluster_results_match(self):
+        """Test that cached clusters equal the uncached response, with and without a viewport."""
+        ne, sw = (14.2, 101.0), (13.3, 100.0)
+        for zoom in (3, 8, 12, 21):
+            self.assertEqual(self.cached.get_map_clusters(zoom, ne, sw), get_map_clusters(self.store, zoom, ne, sw))
+            self.assertEqual(self.cached.get_map_clusters(zoom), get_map_clusters(self.store, zoom))
+
+    def test_filter_sets_are_canonical(self):
+        """Test that the same filters in any order share one entry."""
+        expected = apply_filters(self.store, {"pet_friendly", "wifi_available"})
+        self.assertEqual(self.cached.apply_filters(["pet_friendly", "wifi_available"]), expected)
+        self.assertEqual(self.cached.apply_filters(["wifi_available", "pet_friendly"]), expected)
+        self.assertEqual(self.cached.stats()["hits"], 1)
+
+    def test_empty_filter_set_returns_every_place(self):
+        """Test that an empty filter set returns the same places as the uncached path."""
+        self.assertEqual(self.cached.apply_filters(set()), apply_filters(self.store, set()))
+
+    def test_store_change_invalidates(self):
+        """Test that extending the store drops cached results."""
+        ne, sw = (14.0, 101.0), (13.5, 100.0)
+        before = len(self.cached.find_places_in_map_area(ne, sw))
+        self.store.extend([{"name": "New", "latitude": 13.75, "longitude": 100.5}])
+        self.assertEqual(len(self.cached.find_places_in_map_area(ne, sw)), before + 1)
+        self.assertEqual(self.cached.stats()["invalidations"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import threading
+import unittest
+from unittest.mock import patch
+from app.instrumentation import Metrics, set_instrumentation
+from app.loadgen import fetch, run_load
+from app.map_utils import find_places_in_map_area
+from app.place_store import PlaceStore
+from app.sample_data import SAMPLE_PLACES
+from app.search import text_search
+from app.server import QueryService, serve
+
+class TestQueryService(unittest.IsolatedAsyncioTestCase):
+
+    async def _start(self, **options):
+        self.store = PlaceStore.from_dicts(SAMPLE_PLACES)
+        self.service = QueryService(self.store, **options)
+        self.server = await serve(self.service, port=0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.service.close()
+
+    async def _get(self, path, headers=None):
+        return await fetch("127.0.0.1", self.port, path, headers)
+
+    async def test_endpoints(self):
+        """Test that each endpoint answers with the result of the function it wraps."""
+        await self._start()
+        status, _, body = await self._get("/api/search?q=park&limit=2")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), text_search("park", self.store, 2))
+        status, _, body = await self._get("/api/places?filters=pet_friendly,parking_available")
+        self.assertEqual([place["name"] for place in json.loads(body)], ["Dog Haven"])
+        status, _, body = await self._get("/api/coordinates?name=City%20Museum")
+        self.assertEqual(json.loads(body), {"name": "City Museum", "latitude": 34.05, "longitude": -118.24})
+        status, _, body = await self._get("/api/map/clusters?zoom=18")
+        self.assertEqual(json.loads(body)["type"], "places")
+        self.assertIn("pet_friendly", json.loads((await self._get("/api/filters"))[2]))
+
+    async def test_errors(self):
+        """Test that unknown paths, bad parameters and unknown names give JSON errors."""
+        await self._start()
+        self.assertEqual((await self._get("/api/nothing"))[0], 404)
+        self.assertEqual((await self._get("/api/map/viewport?ne=34.1&sw=34,-118"))[0], 400)
+        self.assertEqual((await self._get("/api/search"))[0], 400)
+        status, _, body = await self._get("/api/coordinates?name=Nowhere")
+        self.assertEqual(status, 404)
+        self.assertIn("error", json.loads(body))
+
+    async def test_ndjson_stream(self):
+        """Test that NDJSON responses are chunked, one place per line, and read from a lazy stream in batches."""
+        await self._start()
+        path = "/api/map/viewport?ne=34.10,-118.20&sw=34.00,-118.30"
+        with patch('app.server.find_places_in_map_area', side_effect=AssertionError), patch('app.server.STREAM_BATCH', 2):
+            status, headers, body = await self._get(path, {"Accept": "application/x-ndjson"})
+        self.assertEqual(headers["transfer-encoding"], "chunked")
+        places = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+        self.assertEqual(places, find_places_in_map_area(self.store, (34.10, -118.20), (34.00, -118.30)))
+        status, _, body = await self._get("/api/places?filters=pet_friendly&format=ndjson")
+        self.assertEqual([json.loads(line) for line in body.decode("utf-8").splitlines()],
+                         json.loads((await self._get("/api/places?filters=pet_friendly"))[2]))
+
+    async def test_internal_errors_are_not_leaked(self):
+        """Test that an unexpected exception gives a generic 500 and is reported to the instrumentation."""
+        await self._start()
+        metrics = Metrics()
+        previous = set_instrumentation(metrics)
+        try:
+            with patch('app.server.text_search', side_effect=RuntimeError("secret detail")):
+                status, _, body = await self._get("/api/search?q=park")
+        finally:
+            set_instrumentation(previous)
+        self.assertEqual(status, 500)
+        self.assertEqual(json.loads(body), {"error": "internal server error"})
+        self.assertEqual(metrics.to_json()["errors"], {"/api/search": {"RuntimeError": 1}})
+        self.assertIn("secret detail", metrics.recent_errors[-1])
+
+    async def test_request_bodies_are_drained(self):
+        """Test that chunked and sized bodies of non-upload requests are skipped, keeping the connection usable."""
+        await self._start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"GET /api/search?q=park HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n"
+                     b"5\r\nhello\r\n0\r\n\r\n"
+                     b"POST /api/search?q=park HTTP/1.1\r\nHost: test\r\nContent-Length: 3\r\n\r\nabc"
+                     b"GET /api/search?q=museum HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        self.assertEqual([part[:3] for part in response.split(b"HTTP/1.1 ")[1:]], [b"200", b"405", b"200"])
+
+    async def test_bad_and_oversized_bodies_are_rejected(self):
+        """Test that a negative Content-Length gives 400, and oversized bodies and chunks give 413 before being read."""
+        await self._start()
+        requests = {
+            b"Content-Length: -5\r\n\r\n": b"400",
+            b"Content-Length: 99999999999\r\n\r\n": b"413",
+            b"Transfer-Encoding: chunked\r\n\r\n-5\r\n": b"400",
+            b"Transfer-Encoding: chunked\r\n\r\nfffffffff\r\n": b"413",
+        }
+        for path in (b"/api/search?q=park", b"/api/voice-search"):
+            for head, status in requests.items():
+                reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+                writer.write(b"POST " + path + b" HTTP/1.1\r\nHost: test\r\n" + head)
+                response = await reader.read()
+                writer.close()
+                self.assertEqual(response[9:12], status, (path, head))
+
+    async def test_pages_and_cluster_summary(self):
+        """Test that limit and cursor page through a listing, and summary=1 returns counts only."""
+        await self._start()
+        places, path = [], "/api/places?filters=pet_friendly&limit=1"
+        while path:
+            status, _, body = await self._get(path)
+            self.assertEqual(status, 200)
+            page = json.loads(body)
+            places.extend(page["places"])
+            path = page["next_cursor"] and f"/api/places?filters=pet_friendly&limit=1&cursor={page['next_cursor']}"
+        self.assertGreater(len(places), 1)
+        self.assertEqual(places, json.loads((await self._get("/api/places?filters=pet_friendly"))[2]))
+        self.assertEqual((await self._get("/api/activities?activity=hiking&cursor=bogus"))[0], 400)
+        status, _, body = await self._get("/api/map/clusters?zoom=18&summary=1")
+        self.assertEqual(json.loads(body)["type"], "summary")
+
+    async def test_metrics_endpoints(self):
+        """Test that /metrics and /api/metrics expose the installed Metrics."""
+        await self._start()
+        previous = set_instrumentation(Metrics())
+        try:
+            await self._get("/api/places?filters=pet_friendly")
+            status, headers, body = await self._get("/metrics")
+            self.assertEqual(status, 200)
+            self.assertTrue(headers["content-type"].startswith("text/plain"))
+            self.assertIn('wanderlust_query_duration_seconds_count{function="apply_filters"} 1', body.decode("utf-8"))
+            metrics = json.loads((await self._get("/api/metrics"))[2])
+            self.assertEqual(metrics["functions"]["apply_filters"]["calls"], 1)
+            self.assertEqual(metrics["service"]["queries"], 2)
+        finally:
+            set_instrumentation(previous)
+
+    async def test_voice_upload(self):
+        """Test that a chunked voice upload is transcribed and searched as its chunks arrive."""
+        await self._start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"POST /api/voice-search?limit=1 HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for chunk in (b"city ", b"muse", b"um"):
+            writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        writer.write(b"GET /api/search?q=museum HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        first, second = response.split(b"HTTP/1.1 ")[1:]
+        self.assertTrue(first.startswith(b"200"))
+        result = json.loads(first.split(b"\r\n\r\n", 1)[1])
+        self.assertEqual(result["transcript"], "city museum")
+        self.assertEqual([place["name"] for place in result["places"]], ["City Museum"])
+        self.assertEqual(set(result["latency_ms"]), {"queue", "transcribe", "search", "total"})
+        self.assertTrue(second.startswith(b"200")) # The connection stays usable after the upload
+        self.assertEqual(json.loads((await self._get("/api/metrics"))[2])["voice"]["sessions"], 1)
+        self.service.close()
+        with self.assertRaises(RuntimeError): # The pipeline the service created is shut down with it
+            self.service.voice.open().feed(b"closed")
+
+    async def test_identical_requests_are_coalesced(self):
+        """Test that identical requests in flight together run the query once."""
+        await self._start()
+        release = threading.Event()
+        calls = []
+
+        def slow_search(query, places, limit):
+            calls.append(query)
+            release.wait(5)
+            return []
+
+        with patch('app.server.text_search', slow_search):
+            requests = [asyncio.ensure_future(self._get("/api/search?q=park")) for _ in range(5)]
+            while self.service.stats()["requests"] < 5:
+                await asyncio.sleep(0.01)
+            release.set()
+            responses = await asyncio.gather(*requests)
+        self.assertEqual([status for status, _, _ in responses], [200] * 5)
+        self.assertEqual(calls, ["park"])
+        self.assertEqual(self.service.stats()["coalesced"], 4)
+
+    async def test_overload_is_rejected(self):
+        """Test that requests beyond the running and waiting limits get 503 with Retry-After."""
+        await self._start(max_in_flight=1, max_queue=0)
+        release = threading.Event()
+
+        def slow_search(query, places, limit):
+            release.wait(5)
+            return []
+
+        with patch('app.server.text_search', slow_search):
+            first = asyncio.ensure_future(self._get("/api/search?q=park"))
+            while self.service.stats()["running"] < 1:
+                await asyncio.sleep(0.01)
+            status, headers, _ = await self._get("/api/search?q=museum")
+            release.set()
+            self.assertEqual((await first)[0], 200)
+        self.assertEqual(status, 503)
+        self.assertEqual(headers["retry-after"], "1")
+        self.assertEqual(self.service.stats()["rejected"], 1)
+
+    async def test_load_generator(self):
+        """Test that the load generator reports throughput and latency percentiles."""
+        await self._start()
+        summary = await run_load("127.0.0.1", self.port, concurrency=4, requests=40)
+        self.assertEqual(summary["requests"], 40)
+        self.assertEqual(summary["statuses"], {200: 40})
+        self.assertLessEqual(summary["p50_ms"], summary["p99_ms"])
+
+if __name__ == '__main__':
+    unittest.main()
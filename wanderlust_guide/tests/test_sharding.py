@@ -0,0 +1,76 @@
+import random
+import unittest
+from unittest.mock import patch
+from app.filters import apply_filters
+from app.map_utils import find_places_in_map_area, get_map_clusters, nearest_places, places_within_radius
+from app.place_store import PlaceStore
+from app.search import activity_search
+from app.sharding import ShardedPlaces, partition_rows
+
+def _random_places(n, seed=12):
+    rng = random.Random(seed)
+    places = []
+    for i in range(n):
+        place = {"id": i, "name": f"Place {i}", "activities": rng.sample(["diving", "hiking", "yoga"], 2),
+                 "pet_friendly": rng.random() < 0.3}
+        if rng.random() < 0.95:
+            place["latitude"] = rng.gauss(13.75, 0.5)
+            place["longitude"] = rng.gauss(100.5, 0.5)
+        places.append(place)
+    return places
+
+class TestPartitionRows(unittest.TestCase):
+
+    def test_every_row_in_one_shard(self):
+        """Test that shards cover every row once, in ascending order, with balanced sizes."""
+        store = PlaceStore.from_dicts(_random_places(1000))
+        shards = partition_rows(store, 3)
+        self.assertEqual(sorted(row for rows in shards for row in rows), list(range(1000)))
+        for rows in shards:
+            self.assertEqual(list(rows), sorted(rows))
+            self.assertAlmostEqual(len(rows), 1000 / 3, delta=30)
+
+class TestShardedPlaces(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.store = PlaceStore.from_dicts(_random_places(3000))
+        cls.sharded = ShardedPlaces(cls.store, n_shards=4, processes=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sharded.close()
+
+    def test_row_ordered_results_match(self):
+        """Test that merged filter, activity and viewport results equal the unsharded ones."""
+        self.assertEqual(self.sharded.apply_filters({"pet_friendly"}), apply_filters(self.store, {"pet_friendly"}))
+        self.assertEqual(self.sharded.activity_search("Yoga"), activity_search(self.store, "Yoga"))
+        for ne, sw in (((14.0, 100.7), (13.5, 100.3)), ((13.8, 100.51), (13.7, 100.5)), ((-10.0, 10.0), (-20.0, 0.0))):
+            self.assertEqual(self.sharded.find_places_in_map_area(ne, sw), find_places_in_map_area(self.store, ne, sw))
+
+    def test_viewport_only_reaches_overlapping_shards(self):
+        """Test that a viewport far from every place is not sent to any shard."""
+        with patch.object(self.sharded, '_fan_out', wraps=self.sharded._fan_out) as fan_out:
+            self.sharded.find_places_in_map_area((-10.0, 10.0), (-20.0, 0.0))
+        self.assertEqual(list(fan_out.call_args.args[1]), [])
+
+    def test_nearest_merges_top_k(self):
+        """Test that nearest and radius searches equal the unsharded ones, including filters."""
+        for latitude, longitude in ((13.75, 100.5), (14.5, 101.2), (12.0, 99.0)):
+            self.assertEqual(self.sharded.nearest_places(latitude, longitude, 8, activities=["diving"]),
+                             nearest_places(self.store, latitude, longitude, 8, activities=["diving"]))
+            self.assertEqual(self.sharded.places_within_radius(latitude, longitude, 5000, filters={"pet_friendly"}),
+                             places_within_radius(self.store, latitude, longitude, 5000, filters={"pet_friendly"}))
+
+    def test_clusters(self):
+        """Test that per-shard clusters account for every located place, and single places match."""
+        located = len(find_places_in_map_area(self.store, (90.0, 180.0), (-90.0, -180.0)))
+        for zoom in (4, 10):
+            response = self.sharded.get_map_clusters(zoom)
+            self.assertEqual(response["type"], "clusters")
+            self.assertEqual(sum(response["data"].values()), located)
+        self.assertEqual(self.sharded.get_map_clusters(21, (13.8, 100.6), (13.7, 100.5)),
+                         get_map_clusters(self.store, 21, (13.8, 100.6), (13.7, 100.5)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import random
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+from app.filters import apply_filters
+from app.map_utils import find_places_in_map_area, get_map_clusters, get_place_coordinates, nearest_places
+from app.name_index import NameIndex
+from app.place_store import PlaceStore
+from app.planner import query
+from app.search import activity_search
+from app.snapshot import FORMAT_VERSION, SnapshotError, main, open_snapshot, write_snapshot
+
+WORDS = ["coffee", "beach", "temple", "Café", "วัดพระแก้ว", "ตลาดน้ำ"]
+
+def _random_places(n, seed=3):
+    rng = random.Random(seed)
+    places = []
+    for i in range(n):
+        place = {"id": i, "name": f"{rng.choice(WORDS)} {i % 300}", "description": " ".join(rng.choices(WORDS, k=3)),
+                 "activities": rng.sample(["Diving", "hiking", "yoga"], 2), "pet_friendly": rng.random() < 0.3,
+                 "popularity": rng.random()}
+        if rng.random() < 0.95:
+            place["latitude"] = rng.gauss(13.75, 0.5)
+            place["longitude"] = rng.gauss(100.5, 0.5)
+        places.append(place)
+    return places
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "places.snap")
+        self.places = _random_places(2000)
+        self.store = PlaceStore.from_dicts(self.places)
+        write_snapshot(self.store, self.path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        """Test that a mapped snapshot holds the same places and answers queries like the store."""
+        snapshot = open_snapshot(self.path, verify=True)
+        self.assertEqual(snapshot.to_dicts(), self.places)
+        ne, sw = (14.0, 100.8), (13.5, 100.2)
+        self.assertEqual(find_places_in_map_area(snapshot, ne, sw), find_places_in_map_area(self.store, ne, sw))
+        for zoom in (2, 9, 21):
+            self.assertEqual(get_map_clusters(snapshot, zoom, ne, sw), get_map_clusters(self.store, zoom, ne, sw))
+        self.assertEqual(apply_filters(snapshot, {"pet_friendly"}), apply_filters(self.store, {"pet_friendly"}))
+        self.assertEqual(activity_search(snapshot, "DIVING"), activity_search(self.store, "DIVING"))
+        self.assertEqual(nearest_places(snapshot, 13.75, 100.5, 5, activities=["yoga"]),
+                         nearest_places(self.store, 13.75, 100.5, 5, activities=["yoga"]))
+        for text in ("temple coffee", "วัด", "cafe"):
+            self.assertEqual(query(text=text, places=snapshot), query(text=text, places=self.store))
+        for name in ("coffee 12", "Café 7", "Missing"):
+            self.assertEqual(get_place_coordinates(name, snapshot), get_place_coordinates(name, self.store))
+        self.assertEqual(snapshot.index(NameIndex).complete("c"), self.store.index(NameIndex).complete("c"))
+        self.assertEqual(snapshot.index(NameIndex).complete("c", 3, (13.75, 100.5)),
+                         self.store.index(NameIndex).complete("c", 3, (13.75, 100.5)))
+
+    def test_indexes_are_loaded_not_rebuilt(self):
+        """Test that the stored indexes come back as views into the file."""
+        snapshot = open_snapshot(self.path)
+        with patch('app.spatial_index.SpatialIndex.from_places', side_effect=AssertionError):
+            find_places_in_map_area(snapshot, (14.0, 100.8), (13.5, 100.2))
+        self.assertIsInstance(snapshot.latitudes, memoryview)
+
+    def test_checksum_mismatch(self):
+        """Test that verification detects a corrupted byte."""
+        with open(self.path, "r+b") as fp:
+            fp.seek(-1, os.SEEK_END)
+            last = fp.read(1)
+            fp.seek(-1, os.SEEK_END)
+            fp.write(bytes([last[0] ^ 0xFF]))
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.path, verify=True)
+
+    def test_format_version_mismatch(self):
+        """Test that snapshots of another format version or other files are rejected."""
+        with open(self.path, "r+b") as fp:
+            fp.seek(8)
+            fp.write(struct.pack("<I", FORMAT_VERSION + 1))
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.path)
+        with open(self.path, "wb") as fp:
+            fp.write(b"not a snapshot")
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.path)
+
+    @patch('app.snapshot.print')
+    def test_cli_build_from_json_lines(self, mock_print):
+        """Test that the CLI builds a snapshot from JSON Lines and verifies it."""
+        source = os.path.join(self.directory.name, "places.jsonl")
+        with open(source, "w", encoding="utf-8") as fp:
+            for place in self.places[:100]:
+                fp.write(json.dumps(place) + "\n")
+        output = os.path.join(self.directory.name, "small.snap")
+        self.assertEqual(main(["build", source, output, "--index", "spatial"]), 0)
+        self.assertEqual(main(["verify", output]), 0)
+        self.assertEqual(open_snapshot(output).to_dicts(), self.places[:100])
+        self.assertEqual(main(["verify", os.path.join(self.directory.name, "missing.snap")]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
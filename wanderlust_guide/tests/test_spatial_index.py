@@ -0,0 +1,133 @@
+import random
+import unittest
+from unittest.mock import patch
+from app.geo import box_distance_m, haversine_m, viewport_boxes
+from app.map_utils import find_places_in_map_area, nearest_places, places_within_radius
+from app.place_store import PlaceStore
+from app.spatial_index import SpatialIndex, STRTree, coordinate_columns, scan_nearest
+
+def _random_places(n, seed=7):
+    rng = random.Random(seed)
+    places = []
+    for i in range(n):
+        if i % 50 == 0:
+            places.append({"id": i, "name": f"Unmapped {i}"}) # No coordinates
+        else:
+            places.append({"id": i, "name": f"Place {i}", "latitude": rng.uniform(-85, 85), "longitude": rng.uniform(-180, 180)})
+    return places
+
+class TestSpatialIndex(unittest.TestCase):
+
+    def test_viewport_boxes_splits_antimeridian(self):
+        """Test that a viewport crossing the antimeridian becomes two boxes."""
+        self.assertEqual(viewport_boxes((10, 20), (0, 10)), [(10, 0, 20, 10)])
+        self.assertEqual(viewport_boxes((10, -170), (0, 170)), [(170, 0, 180.0, 10), (-180.0, 0, -170, 10)])
+
+    def test_empty_tree(self):
+        """Test querying a tree with no points."""
+        self.assertEqual(STRTree([], []).query(-180, -90, 180, 90), [])
+
+    def test_matches_linear_scan(self):
+        """Test that indexed viewport queries equal the linear scan, including order."""
+        places = _random_places(2000)
+        index = SpatialIndex.from_places(places, node_size=4)
+        store = PlaceStore.from_dicts(places)
+        rng = random.Random(11)
+        for _ in range(200):
+            sw_lat, ne_lat = sorted(rng.uniform(-90, 90) for _ in range(2))
+            sw_lon, ne_lon = rng.uniform(-180, 180), rng.uniform(-180, 180)
+            ne, sw = (ne_lat, ne_lon), (sw_lat, sw_lon)
+            expected = find_places_in_map_area(places, ne, sw)
+            self.assertEqual(find_places_in_map_area(index, ne, sw), expected)
+            self.assertEqual(find_places_in_map_area(store, ne, sw), expected)
+
+    def test_rows_after_cursor(self):
+        """Test that iter_rows yields the viewport's rows above the cursor in ascending order, lazily."""
+        places = _random_places(2000)
+        index = SpatialIndex.from_places(places, node_size=4)
+        rng = random.Random(12)
+        for _ in range(100):
+            sw_lat, ne_lat = sorted(rng.uniform(-90, 90) for _ in range(2))
+            ne, sw = (ne_lat, rng.uniform(-180, 180)), (sw_lat, rng.uniform(-180, 180))
+            rows = index.query(ne, sw)
+            after = rng.choice(rows) if rows and rng.random() < 0.7 else -1
+            self.assertEqual(list(index.iter_rows(ne, sw, after)), [row for row in rows if row > after])
+        with patch.object(index.tree, 'query', side_effect=AssertionError):
+            self.assertEqual(next(index.iter_rows((85, 180), (-85, -180), 10)), 11)
+        self.assertEqual(list(STRTree([], []).query_after(-180, -90, 180, 90)), [])
+
+    def test_antimeridian_viewport(self):
+        """Test that a viewport from 170 to -170 finds places on both sides of the antimeridian."""
+        places = [
+            {"name": "Fiji", "latitude": -17.7, "longitude": 178.0},
+            {"name": "Samoa", "latitude": -13.8, "longitude": -172.1},
+            {"name": "Sydney", "latitude": -33.9, "longitude": 151.2},
+        ]
+        ne, sw = (0.0, -170.0), (-30.0, 170.0)
+        names = [p["name"] for p in find_places_in_map_area(places, ne, sw)]
+        self.assertEqual(names, ["Fiji", "Samoa"])
+        names = [p["name"] for p in find_places_in_map_area(SpatialIndex.from_places(places), ne, sw)]
+        self.assertEqual(names, ["Fiji", "Samoa"])
+
+    def test_edges_are_inclusive(self):
+        """Test that points on the viewport edge are included."""
+        places = [{"name": "Corner", "latitude": 1.0, "longitude": 2.0}]
+        self.assertEqual(SpatialIndex.from_places(places).query((1.0, 2.0), (0.0, 0.0)), [0])
+
+class TestNearest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.places = _random_places(3000)
+        for place in self.places:
+            place["pet_friendly"] = rng.random() < 0.3
+            place["activities"] = ["Diving"] if rng.random() < 0.2 else ["hiking"]
+        self.index = SpatialIndex.from_places(self.places, node_size=4)
+        self.lats, self.lons = coordinate_columns(self.places)
+
+    def test_box_distance_is_lower_bound(self):
+        """Test that the box distance never exceeds the distance to a point inside the box."""
+        rng = random.Random(5)
+        for _ in range(2000):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            min_lat, max_lat = sorted(rng.uniform(-90, 90) for _ in range(2))
+            min_lon, max_lon = sorted(rng.uniform(-180, 180) for _ in range(2))
+            inside = (rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon))
+            bound = box_distance_m(lat, lon, min_lon, min_lat, max_lon, max_lat)
+            self.assertLessEqual(bound, haversine_m(lat, lon, *inside) + 1e-6)
+
+    def test_knn_matches_scan(self):
+        """Test that best-first traversal returns the same rows and distances as a full scan."""
+        for lat, lon in ((0.0, 179.9), (89.5, 0.0), (-60.0, -179.5), (13.7, 100.5)):
+            expected = scan_nearest(self.lats, self.lons, lat, lon, k=25)
+            self.assertEqual(self.index.nearest(lat, lon, 25), expected)
+            expected = scan_nearest(self.lats, self.lons, lat, lon, max_distance=1_000_000)
+            self.assertEqual(self.index.nearest(lat, lon, max_distance=1_000_000), expected)
+
+    def test_nearest_places_with_filters(self):
+        """Test that filters and activities give the same nearest places for lists, indexes and stores."""
+        store = PlaceStore.from_dicts(self.places)
+        for filters, activities in ((None, None), ({"pet_friendly"}, None), (None, ["diving"]), ({"pet_friendly"}, ["diving"])):
+            expected = nearest_places(self.places, 13.7, 100.5, 10, filters=filters, activities=activities)
+            self.assertEqual(len(expected), 10)
+            for place in expected:
+                self.assertTrue(not filters or place["pet_friendly"])
+                self.assertTrue(not activities or place["activities"] == ["Diving"])
+            self.assertEqual(nearest_places(self.index, 13.7, 100.5, 10, filters=filters, activities=activities), expected)
+            self.assertEqual(nearest_places(store, 13.7, 100.5, 10, filters=filters, activities=activities), expected)
+
+    def test_places_within_radius(self):
+        """Test that radius search returns exactly the places within the radius, nearest first."""
+        store = PlaceStore.from_dicts(self.places)
+        found = places_within_radius(store, 13.7, 100.5, 2_000_000, filters={"pet_friendly"})
+        distances = [haversine_m(13.7, 100.5, p["latitude"], p["longitude"]) for p in found]
+        self.assertEqual(distances, sorted(distances))
+        expected = [
+            p for p in self.places
+            if "latitude" in p and p["pet_friendly"] and haversine_m(13.7, 100.5, p["latitude"], p["longitude"]) <= 2_000_000
+        ]
+        self.assertEqual(len(found), len(expected))
+        self.assertEqual(places_within_radius(self.places, 13.7, 100.5, 2_000_000, filters={"pet_friendly"}), found)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+from app.filters import apply_filters
+from app.map_utils import find_places_in_map_area
+from app.place_store import PlaceStore
+from app.search import activity_search
+from app.streaming import iter_activity_search, iter_filters, iter_places_in_map_area
+from tests.test_sharding import _random_places
+
+NE, SW = (14.0, 100.7), (13.5, 100.3)
+
+class TestPlaceStream(unittest.TestCase):
+
+    def setUp(self):
+        self.places = _random_places(2000)
+        self.store = PlaceStore.from_dicts(self.places)
+
+    def test_streams_match_list_functions(self):
+        """Test that each stream yields what the list-returning function returns, for lists and stores."""
+        for places in (self.places, self.store):
+            self.assertEqual(list(iter_filters(places, {"pet_friendly"})), apply_filters(places, {"pet_friendly"}))
+            self.assertEqual(list(iter_filters(places, set())), list(places))
+            self.assertEqual(list(iter_activity_search(places, "yoga")), activity_search(places, "yoga"))
+            self.assertEqual(list(iter_places_in_map_area(places, NE, SW)), find_places_in_map_area(places, NE, SW))
+            self.assertEqual(list(iter_places_in_map_area(places, (14.0, -179.0), (13.0, 179.0))), [])
+
+    def test_streams_compose(self):
+        """Test that chained streams equal the nested list functions, in any order."""
+        expected = find_places_in_map_area(activity_search(apply_filters(self.places, {"pet_friendly"}), "diving"), NE, SW)
+        for places in (self.places, self.store):
+            chained = iter_places_in_map_area(iter_activity_search(iter_filters(places, {"pet_friendly"}), "diving"), NE, SW)
+            self.assertEqual(list(chained), expected)
+            reordered = iter_filters(iter_activity_search(iter_places_in_map_area(places, NE, SW), "diving"), {"pet_friendly"})
+            self.assertEqual(list(reordered), expected)
+
+    def test_places_are_materialized_lazily(self):
+        """Test that taking the first match from a store materializes only that place."""
+        stream = iter_activity_search(iter_filters(self.store, {"pet_friendly"}), "hiking")
+        with patch.object(self.store, '_materialize', wraps=self.store._materialize) as materialize:
+            first = next(iter(stream))
+        self.assertEqual(materialize.call_count, 1)
+        self.assertEqual(first, activity_search(apply_filters(self.store, {"pet_friendly"}), "hiking")[0])
+
+    def test_pages_cover_results_once(self):
+        """Test that following next tokens returns every result once, in order, ending with None."""
+        for places in (self.places, self.store):
+            stream = iter_filters(iter_places_in_map_area(places, NE, SW), {"pet_friendly"})
+            pages, token = [], None
+            while True:
+                page, token = stream.page(37, token)
+                pages.append(page)
+                if token is None:
+                    break
+            self.assertTrue(all(len(page) == 37 for page in pages[:-1]))
+            self.assertEqual([place for page in pages for place in page], list(stream))
+
+    def test_token_survives_appends(self):
+        """Test that places appended between pages do not shift the cursor."""
+        stream = iter_activity_search(self.store, "yoga")
+        first, token = stream.page(10)
+        self.store.extend([{"id": 5000, "name": "New", "activities": ["Yoga"]}])
+        second, _ = iter_activity_search(self.store, "yoga").page(10, token)
+        expected = activity_search(self.store, "yoga")
+        self.assertEqual(first + second, expected[:20])
+
+    def test_bad_tokens_are_rejected(self):
+        """Test that malformed tokens and tokens from another query raise ValueError."""
+        _, token = iter_filters(self.store, {"pet_friendly"}).page(5)
+        with self.assertRaises(ValueError):
+            iter_activity_search(self.store, "yoga").page(5, token)
+        with self.assertRaises(ValueError):
+            iter_filters(self.store, {"pet_friendly"}).page(5, "not a token")
+        with self.assertRaises(ValueError):
+            iter_filters(self.store, {"pet_friendly"}).page(0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import collections
+import unittest
+from app.geo import haversine_m
+from app.synthetic import ACTIVITIES, CITIES, generate_places, generate_store
+
+class TestGeneratePlaces(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.places = list(generate_places(20000, seed=1))
+
+    def test_reproducible(self):
+        """Test that a seed always gives the same places and a shorter run is a prefix."""
+        self.assertEqual(list(generate_places(500, seed=1)), self.places[:500])
+        self.assertNotEqual(list(generate_places(500, seed=2)), self.places[:500])
+
+    def test_coordinates_cluster_around_cities(self):
+        """Test that located places lie near a city, the busiest city first, with a few unlocated."""
+        located = [place for place in self.places if "latitude" in place]
+        self.assertAlmostEqual(len(located) / len(self.places), 0.99, delta=0.005)
+        for place in located[:2000]:
+            distance = min(haversine_m(place["latitude"], place["longitude"], lat, lon) for _, lat, lon, _ in CITIES)
+            self.assertLess(distance, 200_000)
+            self.assertTrue(-180.0 <= place["longitude"] < 180.0)
+        cities = collections.Counter(place["name"].rsplit(" ", 1)[-1] for place in self.places)
+        self.assertEqual(cities.most_common(1)[0][0], "Bangkok")
+
+    def test_activities_follow_popularity(self):
+        """Test that popular activities are far more common than rare ones, without duplicates per place."""
+        counts = collections.Counter(activity for place in self.places for activity in place["activities"])
+        self.assertGreater(counts["eating"], counts["cycling"])
+        self.assertGreater(counts["cycling"], 3 * counts.get("coding", 0))
+        self.assertTrue(set(counts) <= set(ACTIVITIES))
+        self.assertTrue(all(len(set(place["activities"])) == len(place["activities"]) for place in self.places))
+
+    def test_amenities_are_correlated(self):
+        """Test that Wi-Fi is more likely at wheelchair-accessible places than overall."""
+        wifi = [place["wifi_available"] for place in self.places]
+        wifi_accessible = [place["wifi_available"] for place in self.places if place["wheelchair_accessible"]]
+        self.assertGreater(sum(wifi_accessible) / len(wifi_accessible), sum(wifi) / len(wifi) + 0.1)
+
+    def test_generate_store_in_batches(self):
+        """Test that a store built in batches holds the generated places."""
+        store = generate_store(1000, seed=1, batch_size=300)
+        self.assertEqual(len(store), 1000)
+        self.assertEqual(store.to_dicts(), self.places[:1000])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import random
+import unittest
+from app.place_store import PlaceStore
+from app.search import set_search_corpus, text_search
+from app.sample_data import SAMPLE_PLACES
+from app.text_index import TextIndex, tokenize
+
+WORDS = ["park", "cafe", "temple", "market", "river", "night", "street", "food", "hiking", "museum", "coffee", "beach"]
+
+def _random_places(n, seed=3):
+    rng = random.Random(seed)
+    return [
+        {
+            "name": " ".join(rng.choices(WORDS, k=2)),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 8))),
+            "activities": rng.choices(WORDS, k=rng.randint(0, 3)),
+        }
+        for _ in range(n)
+    ]
+
+class TestTokenize(unittest.TestCase):
+
+    def test_english(self):
+        """Test lowercasing, stopword removal and plural folding."""
+        self.assertEqual(tokenize("Parks with Playgrounds"), ["park", "playground"])
+        self.assertEqual(tokenize("Cities & galleries"), ["city", "gallery"])
+        self.assertEqual(tokenize("glass"), ["glass"])
+
+    def test_thai_bigrams(self):
+        """Test that Thai text becomes bigrams of characters with their combining marks."""
+        self.assertEqual(tokenize("กาแฟ"), ["กา", "าแ", "แฟ"])
+        self.assertEqual(tokenize("ร้าน"), ["ร้า", "าน"])
+        self.assertEqual(tokenize("cafe กาแฟ"), ["cafe", "กา", "าแ", "แฟ"])
+
+class TestTextIndex(unittest.TestCase):
+
+    def test_thai_query_matches_inside_unsegmented_text(self):
+        """Test that a Thai word is found inside a longer Thai name."""
+        places = [{"name": "ร้านกาแฟริมน้ำ"}, {"name": "วัดพระแก้ว"}, {"name": "ตลาดน้ำ"}]
+        index = TextIndex.from_places(places)
+        self.assertEqual([row for row, _ in index.search("กาแฟ")], [0])
+
+    def test_name_matches_outrank_description_matches(self):
+        """Test that the name field weighs more than the description."""
+        places = [
+            {"name": "Old Town", "description": "Near the temple"},
+            {"name": "Golden Temple", "description": "Old town landmark"},
+        ]
+        index = TextIndex.from_places(places)
+        self.assertEqual(index.search("temple")[0][0], 1)
+
+    def test_top_k_matches_exhaustive_ranking(self):
+        """Test that early termination returns the same top k as scoring every row."""
+        places = _random_places(400)
+        index = TextIndex.from_places(places)
+        rng = random.Random(9)
+        for _ in range(50):
+            query = " ".join(rng.choices(WORDS, k=rng.randint(1, 4)))
+            terms = {t for t in tokenize(query) if t in index.postings}
+            scores = {}
+            for term in terms:
+                idf = index.idf(term)
+                rows, tfs = index.postings[term]
+                for row, tf in zip(rows, tfs):
+                    scores[row] = scores.get(row, 0.0) + index._term_score(idf, tf, index.doc_lengths[row])
+            expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:5]
+            result = index.search(query, limit=5)
+            self.assertEqual([row for row, _ in result], [row for row, _ in expected], query)
+            for (_, got), (_, want) in zip(result, expected):
+                self.assertAlmostEqual(got, want)
+
+    def test_store_and_default_corpus(self):
+        """Test searching a PlaceStore and the default corpus."""
+        store = PlaceStore.from_dicts(SAMPLE_PLACES)
+        self.assertEqual(text_search("hiking", places=store), text_search("hiking"))
+        set_search_corpus(store)
+        try:
+            self.assertEqual(text_search("museum")[0]["name"], "City Museum")
+        finally:
+            set_search_corpus(SAMPLE_PLACES)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import random
+import unittest
+from app import vectorized
+from app.clustering import ClusterIndex
+from app.filters import apply_filters
+from app.map_utils import find_places_in_map_area, get_map_clusters
+from app.spatial_index import STRTree, coordinate_columns, scan_nearest
+
+def _random_places(n, seed=11):
+    rng = random.Random(seed)
+    places = []
+    for i in range(n):
+        place = {"id": i, "name": f"Place {i}", "pet_friendly": rng.random() < 0.5, "wifi_available": rng.random() < 0.3}
+        if i % 40:
+            place["latitude"] = rng.gauss(13.75, 0.2)
+            place["longitude"] = rng.gauss(100.5, 0.2)
+        places.append(place)
+    return places
+
+class TestBackendSelection(unittest.TestCase):
+
+    def tearDown(self):
+        vectorized.set_backend(vectorized.PYTHON)
+
+    def test_unknown_backend_rejected(self):
+        """Test that unknown backend names raise ValueError."""
+        with self.assertRaises(ValueError):
+            vectorized.set_backend("gpu")
+        with self.assertRaises(ValueError):
+            vectorized.use_numpy("gpu")
+
+    def test_python_is_default(self):
+        """Test that scans stay on the Python path unless NumPy is requested."""
+        self.assertEqual(vectorized.get_backend(), vectorized.PYTHON)
+        self.assertFalse(vectorized.use_numpy())
+
+    def test_numpy_requires_numpy(self):
+        """Test that requesting NumPy only vectorizes when it is installed."""
+        vectorized.set_backend(vectorized.NUMPY)
+        self.assertEqual(vectorized.use_numpy(), vectorized.available())
+        self.assertFalse(vectorized.use_numpy(vectorized.PYTHON))
+
+@unittest.skipUnless(vectorized.available(), "NumPy is not installed")
+class TestNumpyBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.places = _random_places(2000)
+
+    def test_filters_match_python(self):
+        """Test that vectorized filtering returns the same places."""
+        active = {"pet_friendly", "wifi_available"}
+        self.assertEqual(apply_filters(self.places, active, backend="numpy"),
+                         apply_filters(self.places, active, backend="python"))
+
+    def test_viewport_matches_python(self):
+        """Test that the vectorized viewport scan returns the same places, including across the antimeridian."""
+        for ne, sw in (((13.8, 100.6), (13.6, 100.4)), ((14.0, 100.5), (13.5, 101.0))):
+            self.assertEqual(find_places_in_map_area(self.places, ne, sw, backend="numpy"),
+                             find_places_in_map_area(self.places, ne, sw, backend="python"))
+
+    def test_quadrants_match_python(self):
+        """Test that the vectorized quadrant split returns the same clusters."""
+        self.assertEqual(get_map_clusters(self.places, 10, backend="numpy"),
+                         get_map_clusters(self.places, 10, backend="python"))
+
+    def test_str_pack_matches_python(self):
+        """Test that the vectorized STR build packs the same tree."""
+        xs = [p.get("longitude", float("nan")) for p in self.places]
+        ys = [p.get("latitude", float("nan")) for p in self.places]
+        python_tree = STRTree(xs, ys, backend="python")
+        numpy_tree = STRTree(xs, ys, backend="numpy")
+        self.assertEqual(numpy_tree.ids, python_tree.ids)
+        self.assertEqual(numpy_tree.levels, python_tree.levels)
+
+    def test_clusters_match_python(self):
+        """Test that vectorized grid clustering produces the same levels."""
+        python_index = ClusterIndex.from_places(self.places, backend="python")
+        numpy_index = ClusterIndex.from_places(self.places, backend="numpy")
+        for zoom in range(0, 22):
+            self.assertEqual(numpy_index.get_clusters(zoom), python_index.get_clusters(zoom), zoom)
+
+    def test_nearest_scan_matches_python(self):
+        """Test that the vectorized distance scan returns the same rows with the same distances."""
+        lats, lons = coordinate_columns(self.places)
+        rows = [row for row, place in enumerate(self.places) if place["pet_friendly"]]
+        python_rows = scan_nearest(lats, lons, 13.7, 100.5, rows, k=20, backend="python")
+        numpy_rows = scan_nearest(lats, lons, 13.7, 100.5, rows, k=20, backend="numpy")
+        self.assertEqual([row for row, _ in numpy_rows], [row for row, _ in python_rows])
+        for (_, expected), (_, actual) in zip(python_rows, numpy_rows):
+            self.assertAlmostEqual(actual, expected, places=6)
+
+if __name__ == '__main__':
+    unittest.main()
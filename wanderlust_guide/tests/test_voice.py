@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from app.instrumentation import Metrics, set_instrumentation
+from app.place_store import PlaceStore
+from app.sample_data import SAMPLE_PLACES
+from app.search import text_search, voice_search
+from app.voice import STAGES, StubTranscriber, Transcriber, VoicePipeline
+
+class FailingTranscriber(Transcriber):
+    """Fails every batch, or with partials_only every batch without a final request."""
+
+    def __init__(self, partials_only: bool = False):
+        self.partials_only = partials_only
+        self.stub = StubTranscriber()
+
+    def transcribe(self, batch):
+        if not self.partials_only or not any(final for _, final in batch):
+            raise RuntimeError("backend unavailable")
+        return self.stub.transcribe(batch)
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.001)
+
+class TestVoicePipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PlaceStore.from_dicts(SAMPLE_PLACES)
+
+    def test_transcriber_is_abstract(self):
+        """Test that a Transcriber must implement transcribe."""
+        with self.assertRaises(TypeError):
+            Transcriber()
+
+    def test_stub_transcriber(self):
+        """Test that partial stub transcripts leave out the unfinished last word and final ones keep it."""
+        stub = StubTranscriber()
+        audio = "ร้าน กาแฟ city mus".encode("utf-8")
+        self.assertEqual(stub.transcribe([(audio, False), (audio, True), (audio[:-1] + b" ", False)]),
+                         ["ร้าน กาแฟ city", "ร้าน กาแฟ city mus", "ร้าน กาแฟ city mu"])
+        # A chunk boundary inside a Thai character drops the partial character.
+        self.assertEqual(stub.transcribe([("กาแฟ".encode("utf-8")[:-1], True)]), ["กาแ"])
+        self.assertEqual(stub.batch_sizes, [3, 1])
+
+    def test_streamed_search_matches_text_search(self):
+        """Test that a streamed utterance returns text_search's results for the final transcript."""
+        with VoicePipeline(self.store) as pipeline:
+            session = pipeline.open(limit=3)
+            for chunk in (b"quiet ca", b"fe for ", b"work"):
+                session.feed(chunk)
+            places = session.finish()
+            self.assertEqual(session.transcript, "quiet cafe for work")
+            self.assertEqual(places, text_search("quiet cafe for work", self.store, 3))
+            self.assertEqual(set(session.latency), set(STAGES))
+            self.assertGreaterEqual(session.latency["total"], session.latency["search"])
+            with self.assertRaises(ValueError):
+                session.feed(b"more")
+
+    def test_speculative_search_is_reused(self):
+        """Test that a final transcript equal to the last partial reuses its speculative search."""
+        with VoicePipeline(self.store) as pipeline:
+            session = pipeline.open()
+            session.feed(b"city ")
+            session.feed(b"museum ")
+            _wait_for(lambda: session.partials[-1:] == ["city museum"])
+            self.assertEqual([place["name"] for place in session.finish()], ["City Museum"])
+            self.assertTrue(session.speculation_hit)
+            self.assertEqual(session.partials[0], "city")
+
+            session = pipeline.open()
+            session.feed(b"dog hav")
+            self.assertEqual([place["name"] for place in session.finish()], ["Dog Haven"])
+            self.assertFalse(session.speculation_hit)
+            stats = pipeline.stats()
+            self.assertEqual((stats["sessions"], stats["speculation_hits"]), (2, 1))
+            self.assertEqual(set(stats["stages"]), set(STAGES))
+
+    def test_concurrent_sessions_are_batched(self):
+        """Test that transcription requests of concurrent sessions share backend calls."""
+        stub = StubTranscriber(call_latency=0.02)
+        queries = ["adventure park", "quiet cafe", "city museum", "dog haven", "tech hub", "mountain trails"]
+        results = {}
+        with VoicePipeline(self.store, stub, batch_wait=0.01) as pipeline:
+            def speak(query):
+                results[query] = pipeline.search([query[:4].encode(), query[4:].encode()], limit=1)
+
+            threads = [threading.Thread(target=speak, args=(query,)) for query in queries]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(pipeline.requests, sum(stub.batch_sizes))
+        self.assertGreater(max(stub.batch_sizes), 1)
+        self.assertLess(len(stub.batch_sizes), sum(stub.batch_sizes))
+        for query in queries:
+            self.assertEqual(results[query], text_search(query, self.store, 1))
+
+    def test_transcriber_errors(self):
+        """Test that failed partial transcriptions are ignored and a failed final one is raised."""
+        with VoicePipeline(self.store, FailingTranscriber(partials_only=True)) as pipeline:
+            self.assertEqual([place["name"] for place in pipeline.search([b"beach ", b"resort"])], ["Beach Resort"])
+        with VoicePipeline(self.store, FailingTranscriber()) as pipeline:
+            with self.assertRaises(RuntimeError):
+                pipeline.search([b"beach resort"])
+        with self.assertRaises(RuntimeError):
+            pipeline.open().feed(b"closed")
+
+    def test_instrumented_transcription(self):
+        """Test that transcriber calls are reported to the installed instrumentation."""
+        metrics = Metrics()
+        previous = set_instrumentation(metrics)
+        try:
+            with VoicePipeline(self.store) as pipeline:
+                pipeline.search([b"beach"])
+        finally:
+            set_instrumentation(previous)
+        self.assertGreaterEqual(metrics.latencies["VoicePipeline.transcribe"].count, 1)
+        self.assertIn("text_search", metrics.latencies)
+
+    def test_voice_search_with_audio(self):
+        """Test that voice_search streams audio chunks through a pipeline."""
+        places = voice_search(SAMPLE_PLACES, limit=1, audio=iter([b"tech ", b"hub"]))
+        self.assertEqual([place["name"] for place in places], ["Tech Hub Cafe"])
+
+if __name__ == '__main__':
+    unittest.main()